@@ -1,12 +1,18 @@
 import logging
 import logging.config
+import signal
 import sys
+import threading
 
 from telegram.ext import Updater, CommandHandler, CallbackQueryHandler
 
+from dagan.async_runner import AsyncRunner
+from dagan.bot_base.webhook_server import WebhookServer
 from dagan.dagan_bot import DaganBot
-from dagan.data import private_parameters
+from dagan.data import private_parameters, public_parameters
 from dagan.resources import resource_path
+from dagan.utils.metrics import Metrics
+from dagan.utils.metrics_server import MetricsServer
 
 
 def main():
@@ -16,33 +22,96 @@ def main():
     # Override default exception handler
     sys.excepthook = lambda exctype, value, traceback: logging.getLogger(__name__).exception(value)
 
+    run_mode = get_parameter('RUN_MODE')
+
     # Create the Updater and pass it bot's token.
     updater = Updater(private_parameters.BOT_TOKEN)
 
     # Create my instance
-    dagan = DaganBot(updater.bot)
+    dagan = DaganBot(updater.bot, threads=run_mode != public_parameters.RUN_MODE_ASYNCIO)
 
     # Add handler: Commands, Buttons and Error
+    add_handlers(updater.dispatcher, dagan)
+
+    # Publish the metrics
+    metrics_server = None
+    if get_parameter('METRICS_PORT') is not None:
+        metrics_server = MetricsServer(get_parameter('METRICS_LISTEN'), get_parameter('METRICS_PORT'),
+                                       get_parameter('METRICS_PATH'))
+        metrics_server.start()
+    if get_parameter('METRICS_LOG_SECONDS'):
+        Metrics.start_log_dump(get_parameter('METRICS_LOG_SECONDS'))
+
+    if run_mode == public_parameters.RUN_MODE_ASYNCIO:
+        # Run the bot in a single event loop until the process receives SIGINT, SIGTERM or SIGABRT
+        AsyncRunner(dagan, updater.dispatcher).run()
+    elif run_mode == public_parameters.RUN_MODE_WEBHOOK:
+        # Receive updates with a local HTTP server
+        server = WebhookServer(updater.bot, updater.dispatcher.update_queue, get_parameter('WEBHOOK_LISTEN'),
+                               get_parameter('WEBHOOK_PORT'), get_parameter('WEBHOOK_PATH'),
+                               get_parameter('WEBHOOK_SECRET'))
+        dispatcher_thread = threading.Thread(target=updater.dispatcher.start)
+        dispatcher_thread.start()
+        server.start()
+        if get_parameter('WEBHOOK_URL'):
+            updater.bot.set_webhook(url=get_parameter('WEBHOOK_URL'), secret_token=get_parameter('WEBHOOK_SECRET'))
+
+        # Run the bot until the process receives SIGINT, SIGTERM or SIGABRT. updater.idle() cannot be used: it exits
+        # the process without the stop sequence when the updater is not polling
+        stopped = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            signal.signal(sig, lambda signum, frame: stopped.set())
+        stopped.wait()
+        server.stop()
+        updater.dispatcher.stop()
+        dispatcher_thread.join()
+    else:
+        # Start the Bot
+        updater.start_polling()
+
+        # Run the bot until the user presses Ctrl-C or the process receives SIGINT,
+        # SIGTERM or SIGABRT
+        updater.idle()
+
+    # Send queued messages and save pending data
+    dagan.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+
+
+def add_handlers(dispatcher, dagan):
     """
+    Register the handlers of the bot: Commands, Buttons and Error. Commands:
     start - Consulta de menús
     info - Información de restaurantes
     subscriptions - Consultar suscripciones activas
+    history - Menús de la última semana
+    search - Buscar en los menús de hoy
+    alert - Alertas de búsqueda
     help - Ayuda
+
+    :param dispatcher: API's dispatcher
+    :param dagan: DaganBot instance
     """
-    updater.dispatcher.add_handler(CommandHandler('start', dagan.start_cmd))
-    updater.dispatcher.add_handler(CommandHandler('info', dagan.info_cmd))
-    updater.dispatcher.add_handler(CommandHandler('subscriptions', dagan.subscriptions_cmd))
-    updater.dispatcher.add_handler(CommandHandler('help', dagan.help_cmd))
+    dispatcher.add_handler(CommandHandler('start', dagan.start_cmd))
+    dispatcher.add_handler(CommandHandler('info', dagan.info_cmd))
+    dispatcher.add_handler(CommandHandler('subscriptions', dagan.subscriptions_cmd))
+    dispatcher.add_handler(CommandHandler('history', dagan.history_cmd))
+    dispatcher.add_handler(CommandHandler('search', dagan.search_cmd, pass_args=True))
+    dispatcher.add_handler(CommandHandler('alert', dagan.alert_cmd, pass_args=True))
+    dispatcher.add_handler(CommandHandler('help', dagan.help_cmd))
 
-    updater.dispatcher.add_handler(CallbackQueryHandler(dagan.button))
-    updater.dispatcher.add_error_handler(dagan.error)
+    dispatcher.add_handler(CallbackQueryHandler(dagan.button))
+    dispatcher.add_error_handler(dagan.error)
 
-    # Start the Bot
-    updater.start_polling()
 
-    # Run the bot until the user presses Ctrl-C or the process receives SIGINT,
-    # SIGTERM or SIGABRT
-    updater.idle()
+def get_parameter(name):
+    """
+    Get a parameter from private_parameters, or its default value from public_parameters
+    :param name: Name of the parameter
+    :return: Value of the parameter (None if it is not defined)
+    """
+    return getattr(private_parameters, name, getattr(public_parameters, name, None))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,166 @@
+import asyncio
+import functools
+import logging
+import queue
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import TelegramError
+
+from dagan.data import public_parameters
+from dagan.upv.info_manager import InfoManager
+
+
+class AsyncRunner:
+    """
+    Asyncio execution mode for DaganBot.
+    One event loop polls the updates, dispatches them, runs the subscription scheduler, the menu events and the
+    refresh of the UPV info as coroutines. Blocking work (handlers, HTTP requests to UPV, DB access) is run in a
+    bounded pool of ASYNC_WORKERS threads, so the number of threads does not grow with the load
+    """
+
+    def __init__(self, dagan, dispatcher):
+        """
+        :param dagan: DaganBot instance created without threads
+        :param dispatcher: API's dispatcher with the handlers of the bot
+        """
+        self.dagan = dagan
+        self.dispatcher = dispatcher
+        self.executor = ThreadPoolExecutor(public_parameters.ASYNC_WORKERS)
+        self.loop = None
+        self.updates = None  # Semaphore to limit the updates in process
+        self.stopped = None
+        # Wake-ups from the threads of the pool, handed over to the loop by the listeners of the thread events
+        self.scheduled = None
+        self.events_put = None
+        self.refresh_requested = None
+        self.listeners = []  # (NotifyingEvent or NotifyingQueue, listener)
+
+    def run(self):
+        """
+        Run the bot until the process receives SIGINT, SIGTERM or SIGABRT
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.updates = asyncio.Semaphore(public_parameters.ASYNC_MAX_UPDATES)
+        self.stopped = asyncio.Event()
+        self.scheduled = self.wake_up_on(self.dagan.schedule_event)
+        self.events_put = self.wake_up_on(InfoManager.events)
+        self.refresh_requested = self.wake_up_on(InfoManager.refresh_event)
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+            self.loop.add_signal_handler(sig, self.stopped.set)
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            for notifier, listener in self.listeners:
+                notifier.remove_listener(listener)
+            self.executor.shutdown()
+            self.loop.close()
+
+    def wake_up_on(self, notifier):
+        """
+        :param notifier: NotifyingEvent or NotifyingQueue used by the threads
+        :return: asyncio.Event set in the loop each time the notifier is set or receives an item. It starts set if the
+        notifier was set or has items before the loop (like the events of the first reload)
+        """
+        event = asyncio.Event()
+        listener = functools.partial(self.loop.call_soon_threadsafe, event.set)
+        notifier.add_listener(listener)
+        self.listeners.append((notifier, listener))
+        if notifier.is_set() if isinstance(notifier, threading.Event) else not notifier.empty():
+            event.set()
+        return event
+
+    async def main(self):
+        tasks = [self.loop.create_task(coro) for coro in
+                 (self.poll(), self.schedule(), self.dispatch_events(), self.refresh())]
+        await self.stopped.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Run a blocking function in the pool of threads
+        :return: Awaitable with the result of the function
+        """
+        return self.loop.run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+    async def poll(self):
+        """
+        Ask Telegram for new updates and process each one in a new task
+        """
+        offset = None
+        while True:
+            try:
+                updates = await self.call(self.dagan.bot.get_updates, offset=offset,
+                                          timeout=public_parameters.ASYNC_POLL_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except TelegramError as err:
+                logging.getLogger(__name__).warning('Error polling updates: %s', err)
+                await asyncio.sleep(public_parameters.ASYNC_POLL_RETRY_SECONDS)
+                continue
+            except Exception as err:
+                logging.getLogger(__name__).exception(err)
+                await asyncio.sleep(public_parameters.ASYNC_POLL_RETRY_SECONDS)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.updates.acquire()
+                self.loop.create_task(self.process(update))
+
+    async def process(self, update):
+        try:
+            await self.call(self.dispatcher.process_update, update)
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+        finally:
+            self.updates.release()
+
+    async def schedule(self):
+        """
+        Check the subscriptions when the delivery window of a chat opens, or as soon as a chat is scheduled
+        """
+        while True:
+            self.scheduled.clear()
+            self.dagan.schedule_event.clear()
+            wait = await self.call(self.dagan.check_subscriptions)
+            await self.wait_for(self.scheduled, wait)
+
+    async def dispatch_events(self):
+        """
+        Dispatch the menu events published by the refreshes of the UPV info
+        """
+        while True:
+            await self.events_put.wait()
+            self.events_put.clear()
+            while True:
+                try:
+                    event = InfoManager.events.get_nowait()
+                except queue.Empty:
+                    break
+                await self.call(self.dagan.dispatch_menu_event, event)
+                InfoManager.events.task_done()
+
+    async def refresh(self):
+        """
+        Refresh the UPV info before it expires, or as soon as a reload finds it expired
+        """
+        wait = InfoManager.refresh_delay()
+        while True:
+            await self.wait_for(self.refresh_requested, wait)
+            self.refresh_requested.clear()
+            InfoManager.refresh_event.clear()
+            wait = await self.call(InfoManager.scheduled_refresh)
+
+    @staticmethod
+    async def wait_for(event, timeout):
+        """
+        Wait until an asyncio.Event is set or some seconds pass
+        """
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,89 @@
+import base64
+import re
+import struct
+import string
+
+from dagan.data import public_parameters
+
+
+class CallbackData:
+    """
+    Data of a keypad button: an action (CBDATA_* code), the ids it refers to and the action of the message which
+    contains the button (origin).
+    Version 1 packs it in fixed width binary, encoded with url-safe base64 (16 chars, far below the 64 bytes allowed
+    by Telegram). Version 0 is the previous text format (like 'BM1R2PF'), still sent by old keypads
+    """
+    __slots__ = ('action', 'res_id', 'menu_id', 'origin')
+
+    VERSION = 1
+    PACKED = struct.Struct('<BBiiBx')  # Version, action, res_id, menu_id, origin, reserved
+    LENGTH = 4 * PACKED.size // 3  # Chars of the encoded data
+    ALPHABET = frozenset(string.ascii_letters + string.digits + '-_')
+
+    LEGACY = re.compile(r'(?P<action>[-SI])|(?P<req>[QF])R(?P<req_res>\d+)|'
+                        r'(?P<menu_req>[QBU])M(?P<menu>\d+)R(?P<res>\d+)(?:P(?P<origin>[MF]))?')
+    LEGACY_ACTIONS = {'-': public_parameters.CBDATA_CANCEL, 'S': public_parameters.CBDATA_START_CMD,
+                      'I': public_parameters.CBDATA_INFO_CMD, 'Q': public_parameters.CBDATA_REP_RES,
+                      'F': public_parameters.CBDATA_INFO_RES, 'B': public_parameters.CBDATA_SUBS,
+                      'U': public_parameters.CBDATA_UNSUBS}
+    LEGACY_ORIGINS = {'M': public_parameters.CBDATA_REP_MENU, 'F': public_parameters.CBDATA_INFO_RES}
+
+    def __init__(self, action, res_id=0, menu_id=0, origin=0):
+        self.action = action
+        self.res_id = res_id
+        self.menu_id = menu_id
+        self.origin = origin
+
+    def __eq__(self, other):
+        return isinstance(other, CallbackData) and (self.action, self.res_id, self.menu_id, self.origin) == \
+               (other.action, other.res_id, other.menu_id, other.origin)
+
+    def __repr__(self):
+        return 'CallbackData(%s, %s, %s, %s)' % (self.action, self.res_id, self.menu_id, self.origin)
+
+    @classmethod
+    def encode(cls, action, res_id=0, menu_id=0, origin=0):
+        """
+        :param action: CBDATA_* code of the action
+        :param res_id: Restaurant id
+        :param menu_id: Menu id
+        :param origin: CBDATA_* code of the message which contains the button
+        :return: Callback data of a button
+        """
+        try:
+            packed = cls.PACKED.pack(cls.VERSION, action, res_id, menu_id, origin)
+        except struct.error as err:
+            raise ValueError(str(err))
+        return base64.urlsafe_b64encode(packed).decode('ascii')
+
+    @classmethod
+    def decode(cls, data):
+        """
+        :param data: Callback data of a button (any version)
+        :return: CallbackData
+        :raise ValueError: Invalid data
+        """
+        if len(data) == cls.LENGTH and cls.ALPHABET.issuperset(data):
+            version, action, res_id, menu_id, origin = cls.PACKED.unpack(base64.urlsafe_b64decode(data))
+            if version != cls.VERSION:
+                raise ValueError('Unknown callback data version: %d' % version)
+            return cls(action, res_id, menu_id, origin)
+        return cls.__decode_legacy(data)
+
+    @classmethod
+    def __decode_legacy(cls, data):
+        """
+        Decode the text format of version 0
+        """
+        match = cls.LEGACY.fullmatch(data)
+        if match is None:
+            raise ValueError('Invalid callback data: %r' % data)
+        if match.group('action'):
+            return cls(cls.LEGACY_ACTIONS[match.group('action')])
+        if match.group('req'):
+            return cls(cls.LEGACY_ACTIONS[match.group('req')], int(match.group('req_res')))
+        action = cls.LEGACY_ACTIONS[match.group('menu_req')]
+        if action == public_parameters.CBDATA_REP_RES:
+            action = public_parameters.CBDATA_REP_MENU  # Report request of a menu
+        return cls(action, int(match.group('res')), int(match.group('menu')),
+                   cls.LEGACY_ORIGINS.get(match.group('origin'), 0))
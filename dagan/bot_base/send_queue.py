@@ -0,0 +1,156 @@
+import collections
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest, Unauthorized
+
+from dagan.data import public_parameters
+from dagan.utils.metrics import Metrics
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens can be reserved in advance: the caller receives the time to wait before using it
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate: Tokens generated per second
+        :param capacity: Maximum number of tokens stored (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token
+        :return: Seconds to wait until the token is valid
+        """
+        with self.lock:
+            self.__refill()
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+class SendQueue:
+    """
+    Outbound queue for Telegram API calls, consumed by pools of workers.
+    Calls are limited by a global token bucket and a token bucket per chat. Interactive replies and bulk messages
+    (subscriptions) have their own workers, so replies never wait for a worker blocked by the rate of a bulk message
+    """
+    INTERACTIVE = 0  # Priority of replies to users
+    BULK = 1  # Priority of massive messages
+    call_seconds = Metrics.histogram('dagan_telegram_seconds', 'Duration of the calls to the Telegram API', ('method',))
+    call_errors = Metrics.counter('dagan_telegram_errors_total', 'Failed calls to the Telegram API (with retries)',
+                                  ('method',))
+
+    def __init__(self, workers=public_parameters.SEND_WORKERS, bulk_workers=public_parameters.SEND_BULK_WORKERS):
+        """
+        :param workers: Workers of interactive replies
+        :param bulk_workers: Workers of bulk messages
+        """
+        self.queues = {self.INTERACTIVE: queue.Queue(), self.BULK: queue.Queue()}
+        self.global_bucket = TokenBucket(public_parameters.SEND_GLOBAL_RATE, public_parameters.SEND_GLOBAL_RATE)
+        self.chat_buckets = collections.OrderedDict()  # {chat_id: TokenBucket}, from the least recently used
+        self.chat_buckets_lock = threading.Lock()
+        self.workers = {priority: [threading.Thread(target=self.__work, args=(self.queues[priority],), daemon=True)
+                                   for _ in range(count)]
+                        for priority, count in ((self.INTERACTIVE, workers), (self.BULK, bulk_workers))}
+        Metrics.gauge('dagan_send_queue_size', 'Calls to the Telegram API waiting in the send queue', self.qsize)
+        for workers in self.workers.values():
+            for worker in workers:
+                worker.start()
+
+    def submit(self, priority, method, **kwargs):
+        """
+        Queue a call to the API
+
+        :param priority: SendQueue.INTERACTIVE or SendQueue.BULK
+        :param method: Method of API's bot instance
+        :param kwargs: Arguments of the method (chat_id is used to apply the limit per chat)
+        :return: Future with the result of the call
+        """
+        future = Future()
+        self.queues[priority].put((kwargs.get('chat_id'), method, kwargs, future))
+        return future
+
+    def stop(self):
+        """
+        Stop the workers once all the queued calls are done
+        """
+        for priority, workers in self.workers.items():
+            for _ in workers:
+                self.queues[priority].put(None)
+        for workers in self.workers.values():
+            for worker in workers:
+                worker.join()
+
+    def qsize(self):
+        return sum(work_queue.qsize() for work_queue in self.queues.values())
+
+    def __work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:  # Stop signal
+                break
+            chat_id, method, kwargs, future = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.__call(chat_id, method, kwargs))
+                except Exception as err:
+                    future.set_exception(err)
+
+    def __call(self, chat_id, method, kwargs):
+        """
+        Call the API respecting the rate limits, and retry it if Telegram asks for it
+
+        :param chat_id: Id of the chat affected by the call
+        :param method: Method of API's bot instance
+        :param kwargs: Arguments of the method
+        :return: Result of the method
+        """
+        retries = 0
+        while True:
+            # The global token is taken once the chat can receive the call, so it is not held while the chat waits
+            time.sleep(self.__chat_bucket(chat_id).reserve())
+            time.sleep(self.global_bucket.reserve())
+            try:
+                with self.call_seconds.time(method.__name__):
+                    return method(**kwargs)
+            except (BadRequest, Unauthorized):  # Bad requests and chats which have blocked the bot will fail again
+                self.call_errors.labels(method.__name__).inc()
+                raise
+            except (RetryAfter, TimedOut, NetworkError) as err:
+                self.call_errors.labels(method.__name__).inc()
+                if retries >= public_parameters.SEND_MAX_RETRIES:
+                    raise
+                if isinstance(err, RetryAfter):
+                    wait = err.retry_after
+                else:
+                    wait = public_parameters.SEND_BACKOFF_SECONDS * 2 ** retries
+            retries += 1
+            logging.getLogger(__name__).warning('Retrying %s to %s in %s seconds', method.__name__, chat_id, wait)
+            time.sleep(wait)
+
+    def __chat_bucket(self, chat_id):
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self.chat_buckets) >= public_parameters.SEND_CHAT_BUCKETS:
+                    self.chat_buckets.popitem(last=False)  # Forget the least recently used chat
+                bucket = self.chat_buckets[chat_id] = TokenBucket(public_parameters.SEND_CHAT_RATE,
+                                                                  public_parameters.SEND_CHAT_BURST)
+            else:
+                self.chat_buckets.move_to_end(chat_id)
+            return bucket
@@ -1,6 +1,8 @@
 from telegram import InlineKeyboardMarkup, ChatAction
 from telegram.inline.inlinekeyboardbutton import InlineKeyboardButton
 
+from dagan.bot_base.callback_data import CallbackData
+from dagan.bot_base.send_queue import SendQueue
 from dagan.data import public_parameters, labels
 
 
@@ -8,12 +10,35 @@ class TelegramBot:
     """
     TelegramBot Base Bot: Class for a regular Telegram Bot
     """
+    CANCEL_CB = CallbackData.encode(public_parameters.CBDATA_CANCEL)  # Callback data of the cancel button
 
     def __init__(self, bot):
         self.bot = bot  # API's bot instance (token, basics methods, etc)
+        self.send_queue = SendQueue()  # Rate limited queue for all calls to the API
+
+    def stop(self):
+        """
+        Send all queued messages and stop the senders
+        """
+        self.send_queue.stop()
+
+    def call_api(self, method, priority=SendQueue.INTERACTIVE, **kwargs):
+        """
+        Call a method of the API through the send queue.
+        Interactive calls wait for the result, so messages to a user keep their order and errors reach the handler
+
+        :param method: Method of API's bot instance
+        :param priority: SendQueue.INTERACTIVE or SendQueue.BULK
+        :param kwargs: Arguments of the method
+        :return: Result of the method for interactive calls, a Future for bulk calls
+        """
+        future = self.send_queue.submit(priority, method, **kwargs)
+        if priority == SendQueue.INTERACTIVE:
+            return future.result()
+        return future
 
     def send_msg(self, chat_id, msg_txt, button_list=None, cols=public_parameters.KEYPAD_COLUMNS, with_cancel=True,
-                 parse_mode=public_parameters.MODE):
+                 parse_mode=public_parameters.MODE, priority=SendQueue.INTERACTIVE):
         """
         Method to send a message
 
@@ -23,9 +48,38 @@ class TelegramBot:
         :param cols: Columns to distribute buttons
         :param with_cancel: Add a cancel button (True / False)
         :param parse_mode: Parse Mode
+        :param priority: SendQueue.INTERACTIVE or SendQueue.BULK
+        :return: Future of the message for bulk messages
         """
         keypad = self.prepare_keypad(button_list, cols, with_cancel)
-        self.bot.send_message(chat_id=chat_id, text=msg_txt, parse_mode=parse_mode, reply_markup=keypad)
+        return self.call_api(self.bot.send_message, priority, chat_id=chat_id, text=msg_txt, parse_mode=parse_mode,
+                             reply_markup=keypad)
+
+    @staticmethod
+    def split_msg(header, blocks, max_length=public_parameters.MESSAGE_MAX_LENGTH):
+        """
+        Join blocks of text in messages not longer than the limit of Telegram. Each message starts with the header, and
+        blocks longer than a message are cut
+
+        :param header: Text at the start of each message
+        :param blocks: List of texts
+        :param max_length: Maximum length of a message
+        :return: List of texts to send
+        """
+        room = max_length - len(header)
+        messages = []
+        text = ''
+        for block in blocks:
+            if text and len(text) + len(block) > room:
+                messages.append(header + text)
+                text = ''
+            while len(block) > room:
+                messages.append(header + block[:room])
+                block = block[room:]
+            text += block
+        if text:
+            messages.append(header + text)
+        return messages
 
     def edit_msg(self, chat_id, msg_id, msg_txt, button_list=None, cols=public_parameters.KEYPAD_COLUMNS,
                  with_cancel=True):
@@ -40,8 +94,8 @@ class TelegramBot:
         :param with_cancel: Add a cancel button (True / False)
         """
         keypad = self.prepare_keypad(button_list, cols, with_cancel)
-        self.bot.edit_message_text(text=msg_txt, chat_id=chat_id, message_id=msg_id, parse_mode=public_parameters.MODE,
-                                   reply_markup=keypad)
+        self.call_api(self.bot.edit_message_text, text=msg_txt, chat_id=chat_id, message_id=msg_id,
+                      parse_mode=public_parameters.MODE, reply_markup=keypad)
 
     def reply_msg(self, chat_id, msg_id, msg_txt, button_list=None, cols=public_parameters.KEYPAD_COLUMNS,
                   with_cancel=True):
@@ -56,8 +110,8 @@ class TelegramBot:
         :param with_cancel: Add a cancel button (True / False)
         """
         keypad = self.prepare_keypad(button_list, cols, with_cancel)
-        self.bot.send_message(chat_id, msg_txt, reply_to_message_id=msg_id, parse_mode=public_parameters.MODE,
-                              reply_markup=keypad)
+        self.call_api(self.bot.send_message, chat_id=chat_id, text=msg_txt, reply_to_message_id=msg_id,
+                      parse_mode=public_parameters.MODE, reply_markup=keypad)
 
     def remove_msg(self, chat_id, msg_id):
         """
@@ -66,16 +120,16 @@ class TelegramBot:
         :param chat_id: Id of conversation
         :param msg_id: Message's id to remove
         """
-        self.bot.delete_message(chat_id=chat_id, message_id=msg_id)
+        self.call_api(self.bot.delete_message, chat_id=chat_id, message_id=msg_id)
 
     def send_location(self, chat_id, latitude, longitude):
-        self.bot.send_location(chat_id=chat_id, latitude=latitude, longitude=longitude)
+        self.call_api(self.bot.send_location, chat_id=chat_id, latitude=latitude, longitude=longitude)
 
     def send_contact(self, chat_id, name, phone):
-        self.bot.send_contact(chat_id=chat_id, phone_number=phone, first_name=name)
+        self.call_api(self.bot.send_contact, chat_id=chat_id, phone_number=phone, first_name=name)
 
     def report_busy(self, chat_id):
-        self.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        self.call_api(self.bot.send_chat_action, chat_id=chat_id, action=ChatAction.TYPING)
 
     @staticmethod
     def prepare_keypad(button_list, cols, with_cancel):
@@ -89,7 +143,7 @@ class TelegramBot:
         if button_list is not None and button_list:
             keypad = TelegramBot.grouper(button_list, cols)  # Group buttons in cols
             if with_cancel:  # Add a cancel button
-                keypad.append([InlineKeyboardButton(labels.CANCEL_BTN, callback_data=public_parameters.CBDATA_CANCEL)])
+                keypad.append([InlineKeyboardButton(labels.CANCEL_BTN, callback_data=TelegramBot.CANCEL_CB)])
             return InlineKeyboardMarkup(keypad)
         else:
             return None
@@ -0,0 +1,68 @@
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+from dagan.data import public_parameters
+from dagan.utils.http_server import HttpServer, HttpHandler
+
+
+class WebhookServer(HttpServer):
+    """
+    HTTP server that receives the updates sent by Telegram to a webhook, and queues them for the dispatcher
+    """
+    SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+    def __init__(self, bot, update_queue, listen=public_parameters.WEBHOOK_LISTEN,
+                 port=public_parameters.WEBHOOK_PORT, path=public_parameters.WEBHOOK_PATH, secret=None):
+        """
+        :param bot: API's bot instance
+        :param update_queue: Queue of updates of the dispatcher
+        :param listen: Address to listen
+        :param port: Port to listen (0 for any free port)
+        :param path: Path of the webhook
+        :param secret: Secret token expected in each request. Required: requests cannot be verified without it
+        """
+        if not secret:
+            raise ValueError('WEBHOOK_SECRET is required by the webhook mode')
+        super(WebhookServer, self).__init__(listen, port, _WebhookHandler)
+        self.bot = bot
+        self.update_queue = update_queue
+        self.path = path
+        self.secret = secret
+
+    def check_secret(self, token):
+        """
+        :param token: Secret token received (None if it is missing)
+        :return: True if the request can be accepted
+        """
+        return token is not None and hmac.compare_digest(token, self.secret)
+
+    def put(self, data):
+        """
+        Queue an update
+
+        :param data: Dict with the update sent by Telegram
+        """
+        self.update_queue.put(Update.de_json(data, self.bot))
+
+
+class _WebhookHandler(HttpHandler):
+    def do_POST(self):
+        webhook = self.server.owner
+        if self.path != webhook.path:
+            self.send_empty(404)
+        elif not webhook.check_secret(self.headers.get(WebhookServer.SECRET_HEADER)):
+            self.send_empty(403)
+        else:
+            length = int(self.headers.get('Content-Length', 0))
+            if length > public_parameters.WEBHOOK_MAX_BODY:
+                self.send_empty(413)
+            else:
+                try:
+                    webhook.put(json.loads(self.rfile.read(length).decode('utf-8')))
+                    self.send_empty(200)
+                except Exception as err:
+                    logging.getLogger(__name__).warning('Invalid update received: %s', err)
+                    self.send_empty(400)
@@ -1,29 +1,80 @@
+import concurrent.futures
 import datetime
+import functools
 import logging
 import threading
 
 import pkg_resources
 from telegram import InlineKeyboardButton
+from telegram.error import Unauthorized
 
+from dagan.bot_base.callback_data import CallbackData
+from dagan.bot_base.send_queue import SendQueue
 from dagan.data import public_parameters, labels
 from dagan.database.entities import ReportMode
+from dagan.upv.delivery_scheduler import DeliveryScheduler
 from dagan.upv.info_manager import InfoManager
+from dagan.upv.menu_event import MenuEvent
 from dagan.upv.menu_bot import MenuBot
+from dagan.upv.search_index import SearchIndex
+from dagan.utils.dagan_lock import DaganLock
+from dagan.utils.metrics import Metrics
+from dagan.utils.notifying import NotifyingEvent
 
 
 class DaganBot(MenuBot):
     """
     Dagan Bot: A UPV Menus Telegram bot that communicates with users with commands and buttons
     """
+    handler_seconds = Metrics.histogram('dagan_handler_seconds', 'Duration of the handlers of commands and buttons',
+                                        ('handler',))
+    fanout_seconds = Metrics.histogram('dagan_fanout_seconds', 'Duration of the deliveries of automatic messages',
+                                       ('kind',))
+    deliveries = Metrics.counter('dagan_deliveries_total', 'Automatic messages sent', ('result',))
 
-    def __init__(self, bot):
-        super(DaganBot, self).__init__(bot)
-        # Start subscriptions thread
-        self.scheduled_thread = threading.Thread(target=self.check_scheduled_task)
-        self.scheduled_thread.start()
+    def __init__(self, bot, threads=True):
+        """
+        :param bot: API's bot instance
+        :param threads: Start the background threads (subscriptions, events, refresher). Otherwise the owner must
+        run check_subscriptions(), dispatch_menu_event() and InfoManager.scheduled_refresh() (see AsyncRunner)
+        """
+        super(DaganBot, self).__init__(bot, threads)
+        # Avoid concurrent notifications of the same menu. It is held while the messages are checked and sent, but
+        # not while their deliveries are waited
+        self.notify_lock = DaganLock('notify', hold_warning=None)
+        self.sending = set()  # Automatic messages sent but not reported yet {(chat_id, key of the message)}
+        self.button_handlers = {  # Handler of each button action {CBDATA_* code: method(bot, update, CallbackData)}
+            public_parameters.CBDATA_CANCEL: self.cancel_btn,
+            public_parameters.CBDATA_START_CMD: self.start_btn,
+            public_parameters.CBDATA_INFO_CMD: self.info_btn,
+            public_parameters.CBDATA_REP_RES: self.restaurant_report_btn,
+            public_parameters.CBDATA_REP_MENU: self.menu_report_btn,
+            public_parameters.CBDATA_INFO_RES: self.restaurant_info_btn,
+            public_parameters.CBDATA_SUBS: self.subscription_btn,
+            public_parameters.CBDATA_UNSUBS: self.unsubscription_btn,
+        }
+        self.scheduler = DeliveryScheduler()  # Next delivery window of each chat with automatic messages
+        self.schedule_event = NotifyingEvent()  # Wake up the subscription checker when a chat is scheduled
+        Metrics.gauge('dagan_scheduled_chats', 'Chats waiting for their delivery window', self.scheduler.__len__)
+        for chat_id in InfoManager.get_delivery_chats():
+            self.schedule_chat(chat_id)
+        if threads:
+            # Start subscriptions threads
+            self.scheduled_thread = threading.Thread(target=self.check_scheduled_task, daemon=True)
+            self.scheduled_thread.start()
+            self.events_thread = threading.Thread(target=self.dispatch_menu_events, daemon=True)
+            self.events_thread.start()
+
+    def stop(self):
+        """
+        Send queued messages and save pending data before exiting
+        """
+        super(DaganBot, self).stop()
+        InfoManager.flush_reports()
 
     """ Command Handlers """
 
+    @handler_seconds.timed('start')
     def start_cmd(self, bot, update):
         """
         Command Handler for start
@@ -34,12 +85,13 @@ class DaganBot(MenuBot):
         """
         try:
             self.report_busy(update.message.chat_id)
+            self.reactivate_chat(update.message.chat_id)
             self.reload()  # Update info
-            with InfoManager.data_lock.reader():
-                self.send_start_keypad(update.message.chat_id)  # Send the keypad
+            self.send_start_keypad(update.message.chat_id)  # Send the keypad
         except Exception as err:
             logging.getLogger(__name__).exception(err)
 
+    @handler_seconds.timed('info')
     def info_cmd(self, bot, update):
         """
         Command Handler for info
@@ -50,11 +102,11 @@ class DaganBot(MenuBot):
         """
         try:
             self.report_busy(update.message.chat_id)
-            with InfoManager.data_lock.reader():
-                self.send_info_keypad(update.message.chat_id)
+            self.send_info_keypad(update.message.chat_id)
         except Exception as err:
             logging.getLogger(__name__).exception(err)
 
+    @handler_seconds.timed('subscriptions')
     def subscriptions_cmd(self, bot, update):
         """
         Command Handler for subscriptions
@@ -66,18 +118,100 @@ class DaganBot(MenuBot):
         try:
             self.report_busy(update.message.chat_id)
             self.reload()  # Update info
-            with InfoManager.data_lock.reader():
-                info = ''
-                if update.message.chat_id in InfoManager.chats.keys() and InfoManager.chats[
-                    update.message.chat_id].subscriptions:
-                    for sub in InfoManager.chats[update.message.chat_id].subscriptions:
-                        info += self.menu_name_to_show(sub.res_id, sub.menu_id)
-                if not info:
-                    info = labels.NO_SUBS
-                self.send_msg(update.message.chat_id, info)
+            info = ''
+            snapshot = InfoManager.snapshot
+            for res_id, menu_id in InfoManager.subscriptions.of_chat(update.message.chat_id):
+                if snapshot.has_menu(res_id, menu_id):  # Otherwise it has left the catalog
+                    info += self.menu_name_to_show(res_id, menu_id, snapshot)
+            if not info:
+                info = labels.NO_SUBS
+            self.send_msg(update.message.chat_id, info)
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+
+    @handler_seconds.timed('history')
+    def history_cmd(self, bot, update):
+        """
+        Command Handler for history
+        Send the menus served in the last days for each menu you're subscribed
+
+        :param bot: API's bot instance
+        :param update: API's update instance
+        """
+        try:
+            self.report_busy(update.message.chat_id)
+            subscriptions = InfoManager.subscriptions.of_chat(update.message.chat_id)
+            if not subscriptions:
+                self.send_msg(update.message.chat_id, labels.NO_SUBS)
+                return
+            snapshot = InfoManager.snapshot
+            subscriptions = [(res_id, menu_id) for res_id, menu_id in subscriptions
+                             if snapshot.has_menu(res_id, menu_id)]  # Skip menus that have left the catalog
+            entries = [entry for entry in InfoManager.get_menu_history(public_parameters.HISTORY_DAYS)
+                       if (entry.res_id, entry.menu_id) in subscriptions]
+            for res_id, menu_id in subscriptions:
+                for info in self.menu_history_to_show(res_id, menu_id, entries, snapshot):
+                    self.send_msg(update.message.chat_id, info)
+            if not entries:
+                self.send_msg(update.message.chat_id, labels.NO_HISTORY)
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+
+    @handler_seconds.timed('search')
+    def search_cmd(self, bot, update, args):
+        """
+        Command Handler for search
+        Send a keypad with the menus of today containing all words of the text
+
+        :param bot: API's bot instance
+        :param update: API's update instance
+        :param args: Words to search
+        """
+        try:
+            self.report_busy(update.message.chat_id)
+            text = ' '.join(SearchIndex.normalize(' '.join(args)))
+            if not text:
+                self.send_msg(update.message.chat_id, labels.SEARCH_USAGE)
+                return
+            self.reload()  # Update info
+            snapshot = InfoManager.snapshot
+            results = InfoManager.search_menus(text, snapshot)
+            self.send_search_results(update.message.chat_id, text, results, snapshot=snapshot)
+            InfoManager.report_search(update.message.chat_id, text, len(results), mode=ReportMode.MANUAL)
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+
+    @handler_seconds.timed('alert')
+    def alert_cmd(self, bot, update, args):
+        """
+        Command Handler for alert
+        Schedule a search (or remove it if it was scheduled). Without text, send the scheduled searches
+
+        :param bot: API's bot instance
+        :param update: API's update instance
+        :param args: Words to search
+        """
+        try:
+            chat_id = update.message.chat_id
+            self.report_busy(chat_id)
+            text = ' '.join(SearchIndex.normalize(' '.join(args)))
+            if not text:
+                texts = InfoManager.saved_searches.of_chat(chat_id)
+                info = labels.ALERTS + public_parameters.NEW_LINE + public_parameters.NEW_LINE.join(texts) \
+                    if texts else labels.NO_ALERTS
+                self.send_msg(chat_id, info, parse_mode=None)
+            elif InfoManager.saved_searches.check(chat_id, text):
+                InfoManager.remove_search(chat_id, text)
+                self.unschedule_idle_chat(chat_id)
+                self.send_msg(chat_id, labels.ALERT_REMOVED % text, parse_mode=None)
+            else:
+                InfoManager.add_search(chat_id, text)
+                self.schedule_chat(chat_id)
+                self.send_msg(chat_id, labels.ALERT_ADDED % text, parse_mode=None)
         except Exception as err:
             logging.getLogger(__name__).exception(err)
 
+    @handler_seconds.timed('help')
     def help_cmd(self, bot, update):
         """
         Command Handler for help
@@ -100,78 +234,73 @@ class DaganBot(MenuBot):
 
     """ Callback Query Handler """
 
+    @handler_seconds.timed('button')
     def button(self, bot, update):
         """
-        Button handler
+        Button handler. Decode the callback data and call the handler of its action
 
         :param bot: API's bot instance
         :param update: API's update instance
         """
         try:
             self.reload()  # Update info
-            prev_update = update.callback_query  # Get previous update
-            cb_info = prev_update.data  # Get callback info
-            if cb_info == public_parameters.CBDATA_CANCEL:
-                """ Cancel request """
-                self.remove_msg(*self.get_ids_in_update(prev_update))
-
-            elif cb_info == public_parameters.CBDATA_START_CMD:
-                """ Start command """
-                self.start_cmd(bot, prev_update)
-
-            elif cb_info == public_parameters.CBDATA_INFO_CMD:
-                """ Info command """
-                self.info_cmd(bot, prev_update)
-
-            elif cb_info.startswith(public_parameters.CBDATA_REP_REQ):
-                """ Report request """
-                cb_info = cb_info.split(public_parameters.CBDATA_REP_REQ, 1)[-1]  # Get information below REQUEST code
-
-                if cb_info.startswith(public_parameters.CBDATA_RESTAURANT):
-                    """ Request restaurant info """
-                    res_id = int(cb_info.replace(public_parameters.CBDATA_RESTAURANT, '', 1))
-                    # Info below restaurant Callback code is the restaurant id
-                    with InfoManager.data_lock.reader():
-                        self.send_restaurant_report(*self.get_ids_in_update(prev_update), res_id)
-
-                elif cb_info.startswith(public_parameters.CBDATA_MENU):
-                    """ Request menu info """
-                    res_id, menu_id, prev_cb = self.get_res_menu_id_in_request(cb_info)
-                    with InfoManager.data_lock.reader():
-                        self.send_menu_report(*self.get_ids_in_update(prev_update), res_id, menu_id)
-
-            elif cb_info.startswith(public_parameters.CBDATA_INFO_REQ):
-                """ Info request """
-                cb_info = cb_info.split(public_parameters.CBDATA_INFO_REQ, 1)[-1]  # Get information below REQUEST code
-                res_id = int(cb_info.replace(public_parameters.CBDATA_RESTAURANT, '', 1))
-                with InfoManager.data_lock.reader():
-                    self.send_info_restaurant(*self.get_ids_in_update(prev_update), res_id)
-
-            elif cb_info.startswith(public_parameters.CBDATA_SUBS_REQ):
-                """ Subscription """
-                cb_info = cb_info.replace(public_parameters.CBDATA_SUBS_REQ, '', 1)
-                res_id, menu_id, prev_cb = self.get_res_menu_id_in_request(cb_info)
-                InfoManager.subscribe(update.effective_chat.id, res_id, menu_id)
-                with InfoManager.data_lock.reader():
-                    if prev_cb == public_parameters.CBDATA_MENU:
-                        self.send_menu_report(*self.get_ids_in_update(prev_update), res_id, menu_id)
-                    elif prev_cb == public_parameters.CBDATA_INFO_REQ:
-                        self.send_info_restaurant(*self.get_ids_in_update(prev_update), res_id)
-
-            elif cb_info.startswith(public_parameters.CBDATA_UNSUBS_REQ):
-                """ Unsubscription request """
-                cb_info = cb_info.replace(public_parameters.CBDATA_UNSUBS_REQ, '', 1)
-                res_id, menu_id, prev_cb = self.get_res_menu_id_in_request(cb_info)
-                InfoManager.unsubscribe(update.effective_chat.id, res_id, menu_id)
-                with InfoManager.data_lock.reader():
-                    if prev_cb == public_parameters.CBDATA_MENU:
-                        self.send_menu_report(*self.get_ids_in_update(prev_update), res_id, menu_id)
-                    elif prev_cb == public_parameters.CBDATA_INFO_REQ:
-                        self.send_info_restaurant(*self.get_ids_in_update(prev_update), res_id)
-
+            data = CallbackData.decode(update.callback_query.data)  # Get callback info
+            handler = self.button_handlers.get(data.action)
+            if handler is None:
+                logging.getLogger(__name__).warning('Unknown button action: %s', data)
+            else:
+                handler(bot, update, data)
         except Exception as err:
             logging.getLogger(__name__).exception(err)
 
+    def cancel_btn(self, bot, update, data):
+        """ Cancel request """
+        self.remove_msg(*self.get_ids_in_update(update.callback_query))
+
+    def start_btn(self, bot, update, data):
+        """ Start command """
+        self.start_cmd(bot, update.callback_query)
+
+    def info_btn(self, bot, update, data):
+        """ Info command """
+        self.info_cmd(bot, update.callback_query)
+
+    def restaurant_report_btn(self, bot, update, data):
+        """ Request restaurant info """
+        self.send_restaurant_report(*self.get_ids_in_update(update.callback_query), data.res_id)
+
+    def menu_report_btn(self, bot, update, data):
+        """ Request menu info """
+        self.send_menu_report(*self.get_ids_in_update(update.callback_query), data.res_id, data.menu_id)
+
+    def restaurant_info_btn(self, bot, update, data):
+        """ Info request """
+        self.send_info_restaurant(*self.get_ids_in_update(update.callback_query), data.res_id)
+
+    def subscription_btn(self, bot, update, data):
+        """ Subscription """
+        InfoManager.subscribe(update.effective_chat.id, data.res_id, data.menu_id)
+        self.schedule_chat(update.effective_chat.id)
+        self.refresh_origin(update, data)
+
+    def unsubscription_btn(self, bot, update, data):
+        """ Unsubscription request """
+        InfoManager.unsubscribe(update.effective_chat.id, data.res_id, data.menu_id)
+        self.unschedule_idle_chat(update.effective_chat.id)
+        self.refresh_origin(update, data)
+
+    def refresh_origin(self, update, data):
+        """
+        Send again the message which contains a [un]subscription button, to show the new status
+
+        :param update: API's update instance
+        :param data: CallbackData of the button
+        """
+        if data.origin == public_parameters.CBDATA_REP_MENU:
+            self.send_menu_report(*self.get_ids_in_update(update.callback_query), data.res_id, data.menu_id)
+        elif data.origin == public_parameters.CBDATA_INFO_RES:
+            self.send_info_restaurant(*self.get_ids_in_update(update.callback_query), data.res_id)
+
     """ Data Senders """
 
     def send_start_keypad(self, chat_id):
@@ -180,14 +309,10 @@ class DaganBot(MenuBot):
 
         :param chat_id: If of char to write
         """
-        ar = InfoManager.get_available_restaurants()
-        if not ar:
+        keyboard = self.start_keypad()
+        if not keyboard:
             self.send_msg(chat_id, labels.NO_INFO)
         else:
-            keyboard = [InlineKeyboardButton(restaurant.name, callback_data=public_parameters.CBDATA_REP_REQ +
-                                                                            self.generate_restaurant_cb(
-                                                                                restaurant.res_id))
-                        for restaurant in ar]
             self.send_msg(chat_id, labels.CHOOSE_RESTAURANT, keyboard)
 
     def send_restaurant_report(self, chat_id, msg_id, res_id):
@@ -199,25 +324,26 @@ class DaganBot(MenuBot):
         :param msg_id: Id of previous message
         :param res_id: Id of the restaurant
         """
-        if res_id in [item.res_id for item in InfoManager.get_available_restaurants()]:
+        snapshot = InfoManager.snapshot
+        if res_id in [item.res_id for item in snapshot.available_restaurants()]:
             menu_list = []
-            for menu in InfoManager.restaurants[res_id].menus.values():
-                if menu.today_menu is not None:
+            for menu in snapshot.restaurants[res_id].menus.values():
+                if snapshot.get_today_menu(res_id, menu.menu_id) is not None:
                     menu_list.append(menu)
 
             if len(menu_list) == 1:
                 # Just one menu for this restaurant - The bot sends its info
-                self.send_menu_report(chat_id, msg_id, res_id, menu_list[0].menu_id)
+                self.send_menu_report(chat_id, msg_id, res_id, menu_list[0].menu_id, snapshot)
             else:  # More than one menu. The Bot sends a new keypad of menus
                 keyboard = [InlineKeyboardButton(menu.name,
-                                                 callback_data=public_parameters.CBDATA_REP_REQ + self.generate_menu_cb(
-                                                     res_id, menu.menu_id))
+                                                 callback_data=self.generate_menu_cb(
+                                                     public_parameters.CBDATA_REP_MENU, res_id, menu.menu_id))
                             for menu in menu_list]
                 self.edit_msg(chat_id, msg_id, labels.CHOOSE_MENU, keyboard, cols=1)
         else:  # Restaurant not present in current available info
             self.edit_msg(chat_id, msg_id.message_id, labels.NO_INFO)
 
-    def send_menu_report(self, chat_id, msg_id, res_id, menu_id):
+    def send_menu_report(self, chat_id, msg_id, res_id, menu_id, snapshot=None):
         """
         Send the info of the requested menu
 
@@ -225,19 +351,18 @@ class DaganBot(MenuBot):
         :param msg_id: Id of previous message
         :param res_id: Id of the restaurant
         :param menu_id: Id of the menu
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: Future of the message for subscription messages (reported when it is delivered)
         """
-        keypad = [InlineKeyboardButton(labels.AGAIN_BTN, callback_data=public_parameters.CBDATA_START_CMD),
-                  self.generate_sub_rem_btn(chat_id, res_id, menu_id, public_parameters.CBDATA_MENU)]
-        available_restaurants_ids = [res.res_id for res in InfoManager.get_available_restaurants()]
-        available_menu_codes = [menu_id if menu.today_menu is not None else None
-                                for menu_id, menu in InfoManager.restaurants[res_id].menus.items()]
-
-        if res_id in available_restaurants_ids and menu_id in available_menu_codes:
-            info = self.menu_today_to_show(res_id, menu_id)
+        keypad = [InlineKeyboardButton(labels.AGAIN_BTN,
+                                       callback_data=CallbackData.encode(public_parameters.CBDATA_START_CMD)),
+                  self.generate_sub_rem_btn(chat_id, res_id, menu_id, public_parameters.CBDATA_REP_MENU)]
+        snapshot = snapshot or InfoManager.snapshot
+        if snapshot.get_today_menu(res_id, menu_id) is not None:
+            info = self.menu_today_to_show(res_id, menu_id, snapshot)
             if msg_id is None:
                 # It is a subscription message
-                self.send_msg(chat_id, info, keypad, with_cancel=False)
-                InfoManager.report_menu(chat_id, res_id, menu_id, mode=ReportMode.AUTO)
+                return self.send_msg(chat_id, info, keypad, with_cancel=False, priority=SendQueue.BULK)
             else:
                 # It is a regular message
                 self.edit_msg(chat_id, msg_id, info, keypad, with_cancel=False)
@@ -245,17 +370,37 @@ class DaganBot(MenuBot):
         elif msg_id is not None:
             self.edit_msg(chat_id, msg_id, labels.NO_INFO, keypad, with_cancel=False)
 
+    def send_search_results(self, chat_id, text, results, priority=SendQueue.INTERACTIVE, snapshot=None):
+        """
+        Send a keypad with the menus found by a search
+
+        :param chat_id: Id of chat
+        :param text: Searched text
+        :param results: List of (res_id, menu_id), found in the menus of snapshot
+        :param priority: SendQueue.INTERACTIVE or SendQueue.BULK
+        :param snapshot: InfoSnapshot of the search. None for the current one
+        :return: Future of the message for bulk messages
+        """
+        if not results:
+            return self.send_msg(chat_id, labels.NO_RESULTS % text, parse_mode=None, priority=priority)
+        keyboard = []
+        restaurants = (snapshot or InfoManager.snapshot).restaurants
+        for res_id, menu_id in results:
+            res = restaurants[res_id]
+            keyboard.append(InlineKeyboardButton(res.name + public_parameters.RESTAURANT_MENU_SEPARATOR +
+                                                 res.menus[menu_id].name,
+                                                 callback_data=self.generate_menu_cb(public_parameters.CBDATA_REP_MENU,
+                                                                                     res_id, menu_id)))
+        return self.send_msg(chat_id, labels.SEARCH_RESULTS % text, keyboard, cols=1, parse_mode=None,
+                             priority=priority)
+
     def send_info_keypad(self, chat_id):
         """
         Send a keypad with all menus available
 
         :param chat_id: If of char to write
         """
-        keyboard = [
-            InlineKeyboardButton(res.name,
-                                 callback_data=public_parameters.CBDATA_INFO_REQ + self.generate_restaurant_cb(
-                                     res_id)) for res_id, res in InfoManager.restaurants.items()]
-        self.send_msg(chat_id, labels.CHOOSE_RESTAURANT, keyboard)
+        self.send_msg(chat_id, labels.CHOOSE_RESTAURANT, self.info_keypad())
 
     def send_info_restaurant(self, chat_id, msg_id, res_id):
         """
@@ -265,7 +410,7 @@ class DaganBot(MenuBot):
         :param msg_id: Id of previous message
         :param res_id: Id of the restaurant
         """
-        res = InfoManager.restaurants[res_id]
+        res = InfoManager.snapshot.restaurants[res_id]
         name = public_parameters.BOLD_START + res.name + public_parameters.BOLD_END
         # Title
         self.edit_msg(chat_id, msg_id, name)
@@ -276,76 +421,290 @@ class DaganBot(MenuBot):
         if res.phone:
             self.send_contact(chat_id, phone=res.phone, name=res.name)
         # Menus / Subs
-        keypad = [self.generate_sub_rem_btn(chat_id, res_id, menu.menu_id, public_parameters.CBDATA_INFO_REQ, menu.name)
+        keypad = [self.generate_sub_rem_btn(chat_id, res_id, menu.menu_id, public_parameters.CBDATA_INFO_RES, menu.name)
                   for menu in res.menus.values()]
-        keypad.append(InlineKeyboardButton(labels.INFO_BTN, callback_data=public_parameters.CBDATA_INFO_CMD))
+        keypad.append(InlineKeyboardButton(labels.INFO_BTN,
+                                           callback_data=CallbackData.encode(public_parameters.CBDATA_INFO_CMD)))
 
         self.send_msg(chat_id, labels.SUBS_MENUS, keypad, with_cancel=False)
 
     """ Subscription handlers """
 
+    def schedule_chat(self, chat_id):
+        """
+        Schedule the next delivery of the automatic messages of a chat, in its delivery window
+
+        :param chat_id: Id of chat
+        """
+        self.scheduler.schedule(chat_id, InfoManager.get_schedule(chat_id).next_delivery(datetime.datetime.now()))
+        self.schedule_event.set()
+
+    def unschedule_idle_chat(self, chat_id):
+        """
+        Remove a chat from the scheduler if it has no subscriptions nor scheduled searches
+
+        :param chat_id: Id of chat
+        """
+        if not self.has_deliveries(chat_id):
+            self.scheduler.schedule(chat_id, None)
+
+    @staticmethod
+    def has_deliveries(chat_id):
+        """
+        :param chat_id: Id of chat
+        :return: True if the chat has subscriptions or scheduled searches
+        """
+        return bool(InfoManager.subscriptions.of_chat(chat_id) or InfoManager.saved_searches.of_chat(chat_id))
+
+    def deactivate_chat(self, chat_id):
+        """
+        Stop the automatic messages of a chat which has blocked the bot. They are enabled again by its next /start
+
+        :param chat_id: Id of chat
+        """
+        logging.getLogger(__name__).warning('Chat %s has blocked the bot, its automatic messages are muted', chat_id)
+        InfoManager.set_mute(chat_id, True)
+        self.scheduler.schedule(chat_id, None)
+
+    def reactivate_chat(self, chat_id):
+        """
+        Enable again the automatic messages of a chat muted by deactivate_chat
+
+        :param chat_id: Id of chat
+        """
+        if InfoManager.get_schedule(chat_id).mute:
+            InfoManager.set_mute(chat_id, False)
+            if self.has_deliveries(chat_id):
+                self.schedule_chat(chat_id)
+
+    def retry_deliveries(self, chat_ids):
+        """
+        Schedule again the chats with failed automatic messages, DELIVERY_RETRY_SECONDS later if their window is
+        still open then. Otherwise they keep the next opening of their window
+
+        :param chat_ids: Iterable of chat ids
+        """
+        retry = datetime.datetime.now() + datetime.timedelta(seconds=public_parameters.DELIVERY_RETRY_SECONDS)
+        for chat_id in chat_ids:
+            if InfoManager.get_schedule(chat_id).is_open(retry):
+                self.scheduler.schedule(chat_id, retry)
+
     def check_scheduled_task(self):
         """
         Method executed by the subscription checker thread.
-        Send the info a subscribed menu if there are no previous messages for this user and menu today.
-        It only works at parametrized days and hours
+        Wake up when the delivery window of a chat opens (or a chat is scheduled) and send its pending messages
         """
-        stopped = threading.Event()
-        while not stopped.wait(public_parameters.THREAD_TIMER_SECONDS):
-            # Execute below code each THREAD_TIMER_SECONDS seconds
-            # Check time
-            try:
-                logging.getLogger(__name__).info('Checking scheduled task...')
-                weekday = datetime.datetime.today().weekday()
-                hour = datetime.datetime.today().hour + (datetime.datetime.today().minute / 60)
-                if weekday in public_parameters.SUBS_WEEKDAY_LIST and \
-                        public_parameters.SUBS_HOUR_INTERVAL[0] <= hour < public_parameters.SUBS_HOUR_INTERVAL[
-                    1]:  # Valid day and hout
-                    self.reload()  # Reload info
-                    with InfoManager.report_lock.reader():
-                        reports = InfoManager.read_menu_reports()  # Get actual reports
-                    with InfoManager.data_lock.reader():
-                        for chat in InfoManager.chats.values():
-                            for sub in chat.subscriptions:
-                                if sub.chat_id not in reports.keys() \
-                                        or sub.res_id not in reports[sub.chat_id].keys() \
-                                        or sub.menu_id not in reports[sub.chat_id][sub.res_id]:  # No previous report
-                                    try:
-                                        self.report_busy(sub.chat_id)
-                                        self.send_menu_report(sub.chat_id, None, sub.res_id, sub.menu_id)
-                                    except Exception as err:
-                                        logging.getLogger(__name__).exception(err)
+        while True:
+            wait = self.check_subscriptions()
+            self.schedule_event.wait(wait)
+            self.schedule_event.clear()
+
+    def check_subscriptions(self):
+        """
+        Send the pending subscriptions and searches of the chats whose delivery window has opened, and schedule
+        their next window (or a retry in this one, if a message failed)
+        :return: Seconds to wait until the next window opens (THREAD_TIMER_SECONDS at most)
+        """
+        try:
+            now = datetime.datetime.now()
+            due = self.scheduler.pop_due(now)
+            if due:
+                logging.getLogger(__name__).info('Checking scheduled task for %d chats...', len(due))
+                self.reload()  # Reload info
+                for chat_id in due:
+                    self.scheduler.schedule(chat_id, InfoManager.get_schedule(chat_id).next_opening(now)
+                                            if self.has_deliveries(chat_id) else None)
+                self.notify_chats(due)
                 logging.getLogger(__name__).info('Checking scheduled task... Done')
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+        wait = self.scheduler.wait_time(datetime.datetime.now())
+        return public_parameters.THREAD_TIMER_SECONDS if wait is None else \
+            min(wait, public_parameters.THREAD_TIMER_SECONDS)
+
+    def dispatch_menu_events(self):
+        """
+        Method executed by the menu events thread.
+        Send a menu to its pending subscribers as soon as a reload reports it as available or changed
+        """
+        while True:
+            event = InfoManager.events.get()
+            self.dispatch_menu_event(event)
+            InfoManager.events.task_done()
+
+    def dispatch_menu_event(self, event):
+        """
+        Notify the pending subscribers of the menu (or the pending searches, when the reload ends) of an event
+
+        :param event: MenuEvent
+        """
+        try:
+            logging.getLogger(__name__).info('Dispatching %s', event)
+            if event.kind == MenuEvent.REFRESHED:
+                self.notify_searches()
+            else:
+                self.notify_subscribers(event.res_id, event.menu_id)
+        except Exception as err:
+            logging.getLogger(__name__).exception(err)
+
+    @fanout_seconds.timed('chat')
+    def notify_chats(self, chat_ids):
+        """
+        Send to some chats the available menus they are subscribed and the results of their scheduled searches, if
+        there are no previous messages for them today. The messages of all chats are sent at once
+
+        :param chat_ids: Iterable of chat ids
+        """
+        futures = {}
+        failed = set()
+        with self.notify_lock:
+            snapshot = InfoManager.snapshot
+            for chat_id in chat_ids:
+                try:
+                    self.submit_chat_deliveries(chat_id, snapshot, futures)
+                except Exception as err:
+                    logging.getLogger(__name__).exception(err)
+                    failed.add(chat_id)
+        self.retry_deliveries(failed | self.wait_deliveries(futures))
+
+    def submit_chat_deliveries(self, chat_id, snapshot, futures):
+        """
+        Send the pending subscriptions and searches of a chat. notify_lock must be held
+
+        :param chat_id: Id of chat
+        :param snapshot: InfoSnapshot with the menus to send
+        :param futures: Dict to add the sent messages to (see wait_deliveries)
+        """
+        for res_id, menu_id in InfoManager.subscriptions.of_chat(chat_id):
+            if snapshot.get_today_menu(res_id, menu_id) is not None and \
+                    not InfoManager.menu_reports.check(chat_id, res_id, menu_id):
+                self.submit_delivery(futures, chat_id, (res_id, menu_id),
+                                     functools.partial(self.send_menu_report, chat_id, None, res_id, menu_id,
+                                                       snapshot),
+                                     functools.partial(InfoManager.report_menu, chat_id, res_id, menu_id,
+                                                       mode=ReportMode.AUTO))
+        for text in InfoManager.saved_searches.of_chat(chat_id):
+            if (chat_id, text) in self.sending or InfoManager.search_reports.check(chat_id, text):
+                continue
+            results = InfoManager.search_menus(text, snapshot)
+            if results:
+                self.submit_delivery(futures, chat_id, text,
+                                     functools.partial(self.send_search_results, chat_id, text, results,
+                                                       SendQueue.BULK, snapshot),
+                                     functools.partial(InfoManager.report_search, chat_id, text, len(results),
+                                                       mode=ReportMode.AUTO))
+
+    @fanout_seconds.timed('subscribers')
+    def notify_subscribers(self, res_id, menu_id):
+        """
+        Send the info of a menu to its subscribers in their delivery window, if there are no previous messages for
+        them and this menu today
+
+        :param res_id: Id of the restaurant
+        :param menu_id: Id of the menu
+        """
+        futures = {}
+        with self.notify_lock:
+            snapshot = InfoManager.snapshot
+            for chat_id in self.in_delivery_window(InfoManager.get_pending_subscribers(res_id, menu_id)):
+                # Subscribed chats without previous report
+                self.submit_delivery(futures, chat_id, (res_id, menu_id),
+                                     functools.partial(self.send_menu_report, chat_id, None, res_id, menu_id,
+                                                       snapshot),
+                                     functools.partial(InfoManager.report_menu, chat_id, res_id, menu_id,
+                                                       mode=ReportMode.AUTO))
+        self.retry_deliveries(self.wait_deliveries(futures))
+
+    @fanout_seconds.timed('searches')
+    def notify_searches(self):
+        """
+        Send the results of the scheduled searches to the chats in their delivery window which have not received
+        them today. Each text is searched once for all its chats
+        """
+        futures = {}
+        with self.notify_lock:
+            snapshot = InfoManager.snapshot
+            for text in InfoManager.saved_searches.by_key.keys():
+                pending = self.in_delivery_window(InfoManager.get_pending_searchers(text))
+                results = InfoManager.search_menus(text, snapshot) if pending else None
+                if not results:
+                    continue
+                for chat_id in pending:
+                    self.submit_delivery(futures, chat_id, text,
+                                         functools.partial(self.send_search_results, chat_id, text, results,
+                                                           SendQueue.BULK, snapshot),
+                                         functools.partial(InfoManager.report_search, chat_id, text, len(results),
+                                                           mode=ReportMode.AUTO))
+        self.retry_deliveries(self.wait_deliveries(futures))
+
+    def submit_delivery(self, futures, chat_id, key, send, report):
+        """
+        Send an automatic message, unless the same message is still being sent by another notification.
+        notify_lock must be held
+
+        :param futures: Dict to add the message to (see wait_deliveries)
+        :param chat_id: Id of chat
+        :param key: Key of the message in the chat: (res_id, menu_id) for a menu, or the text of a search
+        :param send: Function that sends the message and returns its Future (or None if it is not sent)
+        :param report: Function that reports the delivered message
+        """
+        if (chat_id, key) in self.sending:
+            return
+        future = send()
+        if future is not None:
+            self.sending.add((chat_id, key))
+            futures[future] = chat_id, key, report
+
+    def wait_deliveries(self, futures):
+        """
+        Wait for automatic messages and report the delivered ones. It must be called without notify_lock, so other
+        notifications are not blocked by the network
+
+        :param futures: Dict {Future of a message: (chat id, key of the message, function that reports it)}
+        :return: Set of chat ids with failed messages to retry. Chats which have blocked the bot are deactivated
+        """
+        failed = set()
+        blocked = set()
+        for future in concurrent.futures.as_completed(futures):
+            chat_id, key, report = futures[future]
+            try:
+                future.result()
+                report()
+                DaganBot.deliveries.labels('sent').inc()
+            except Unauthorized:
+                DaganBot.deliveries.labels('blocked').inc()
+                blocked.add(chat_id)
             except Exception as err:
                 logging.getLogger(__name__).exception(err)
-
-    """ Auxiliary methods """
+                DaganBot.deliveries.labels('failed').inc()
+                failed.add(chat_id)
+            finally:
+                with self.notify_lock:
+                    self.sending.discard((chat_id, key))
+        for chat_id in blocked:
+            self.deactivate_chat(chat_id)
+        return failed - blocked
 
     @staticmethod
-    def get_res_menu_id_in_request(cb_info):
+    def in_delivery_window(chat_ids):
         """
-        Get restaurant and menu ids stored in a callback data
-        :param cb_info: Text to process
-        :return: res_id, menu_id, prev_cb
+        Filter the chats whose delivery window is open now (the others are notified when it opens)
+        :param chat_ids: Iterable of chat ids
+        :return: List of chat ids
         """
-        cb_info = cb_info.replace(public_parameters.CBDATA_MENU, '', 1)  # Remove initial code
-        menu_id, res_id = cb_info.split(public_parameters.CBDATA_RESTAURANT)
-        prev_cb = None
-        tmp_list = res_id.split(public_parameters.CBDATA_PREVIOUS_TYPE)
-        if len(tmp_list) == 2:
-            res_id = tmp_list[0]
-            prev_cb = tmp_list[1]
-        # Menu - Restaurant ids are separated with public_parameters.CBDATA_RESTAURANT
-        return int(res_id), int(menu_id), prev_cb
+        now = datetime.datetime.now()
+        return [chat_id for chat_id in chat_ids if InfoManager.get_schedule(chat_id).is_open(now)]
+
+    """ Auxiliary methods """
 
-    def generate_sub_rem_btn(self, chat_id, res_id, menu_id, prev_msg_type, name=None):
+    def generate_sub_rem_btn(self, chat_id, res_id, menu_id, origin, name=None):
         """
         Returns a subscription button. Its value depends of subscription status for this chat and menu
 
         :param chat_id: Id of chat
         :param res_id: Id of restaurant
         :param menu_id: Id of menu
-        :param prev_msg_type: Callback data of the type of message that calls the [un]subscription
+        :param origin: CBDATA_* code of the message that calls the [un]subscription
         :param name: Extra text button
         :return: The subscription button
         """
@@ -353,17 +712,14 @@ class DaganBot(MenuBot):
             msg = labels.REM_BTN
             if name is not None:
                 msg = name + labels.SUBS_SEPARATOR + msg
-            return InlineKeyboardButton(msg,
-                                        callback_data=public_parameters.CBDATA_UNSUBS_REQ + self.generate_menu_cb(
-                                            res_id, menu_id) + public_parameters.CBDATA_PREVIOUS_TYPE + prev_msg_type)
+            return InlineKeyboardButton(msg, callback_data=self.generate_menu_cb(public_parameters.CBDATA_UNSUBS,
+                                                                                  res_id, menu_id, origin))
         else:
             msg = labels.SUB_BTN
             if name is not None:
                 msg = name + labels.SUBS_SEPARATOR + msg
-            return InlineKeyboardButton(msg,
-                                        callback_data=public_parameters.CBDATA_SUBS_REQ +
-                                                      self.generate_menu_cb(res_id, menu_id) +
-                                                      public_parameters.CBDATA_PREVIOUS_TYPE + prev_msg_type)
+            return InlineKeyboardButton(msg, callback_data=self.generate_menu_cb(public_parameters.CBDATA_SUBS,
+                                                                                  res_id, menu_id, origin))
 
     @staticmethod
     def get_ids_in_update(update):
@@ -9,12 +9,24 @@ HELP = "*Menús del campus de la UPV*" \
        "\r\n\t - O mediante la página de información del bar" \
        "\r\n\r\nInformación: Escribe /info para acceder a la información de un bar y gestionar tus suscripciones" \
        "\r\n\r\nSuscripciones activas: Escribe /subscriptions para revisar tus suscripciones actuales " \
+       "\r\n\r\nHistórico: Escribe /history para ver los menús de la última semana de tus suscripciones" \
+       "\r\n\r\nBúsqueda: Escribe /search y las palabras a buscar en los menús de hoy" \
+       "\r\n\r\nAlertas: Escribe /alert y las palabras a buscar para recibir los menús que las contengan " \
+       "(otra vez para eliminarla). Escribe /alert para revisar tus alertas" \
        "\r\n\r\nLicencia GPLv3: https://github.com/asaezper/dagan" \
        "\r\n\r\nVersión: "
 CHOOSE_RESTAURANT = 'Selecciona el bar: '
 CHOOSE_MENU = 'Selecciona el menú: '
 NO_INFO = "Sin información :("
 NO_SUBS = 'Sin subscripciones :('
+NO_HISTORY = 'Sin histórico :('
+SEARCH_USAGE = 'Escribe /search y las palabras a buscar'
+SEARCH_RESULTS = 'Menús con "%s":'
+NO_RESULTS = 'Sin menús con "%s" :('
+ALERTS = 'Alertas:'
+NO_ALERTS = 'Sin alertas :('
+ALERT_ADDED = 'Alerta creada: "%s"'
+ALERT_REMOVED = 'Alerta eliminada: "%s"'
 
 """
 Buttons
@@ -5,12 +5,70 @@ INTERNAL_INFO
 """
 SQL_TIME_FORMAT = '%Y-%m-%d'
 
+"""
+EXECUTION MODE
+"""
+RUN_MODE_POLLING = 'polling'  # Updater threads polling Telegram
+RUN_MODE_ASYNCIO = 'asyncio'  # Single event loop (AsyncRunner)
+RUN_MODE_WEBHOOK = 'webhook'  # Updates received by a local HTTP server (WebhookServer)
+RUN_MODE = RUN_MODE_POLLING  # Default mode. It can be overridden with RUN_MODE at private_parameters
+
+ASYNC_WORKERS = 8  # Threads for blocking work (handlers, HTTP, DB) in asyncio mode
+ASYNC_MAX_UPDATES = 1000  # Updates processed at once in asyncio mode
+ASYNC_POLL_TIMEOUT = 10  # Seconds of long polling for updates in asyncio mode
+ASYNC_POLL_RETRY_SECONDS = 5  # Seconds to wait after a polling error in asyncio mode
+
+# Webhook mode. WEBHOOK_URL (public url registered at Telegram) and WEBHOOK_SECRET must be set at private_parameters
+WEBHOOK_LISTEN = '127.0.0.1'  # Address of the local HTTP server (behind a reverse proxy with TLS)
+WEBHOOK_PORT = 8443  # Port of the local HTTP server
+WEBHOOK_PATH = '/dagan'  # Path of the webhook
+WEBHOOK_MAX_BODY = 1048576  # Maximum size of an update (bytes)
+
+"""
+METRICS
+"""
+METRICS_LISTEN = '127.0.0.1'  # Address of the local HTTP server with the metrics (Prometheus text format)
+METRICS_PORT = None  # Port of the local HTTP server with the metrics. None to disable it
+METRICS_PATH = '/metrics'  # Path of the metrics
+METRICS_LOG_SECONDS = 0  # Seconds between two dumps of the metrics to the log. 0 to disable them
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Bounds of durations (s)
+LOCK_HOLD_WARNING_SECONDS = 1  # Holds of a lock longer than this are logged with their call site. None to disable it
+LOCK_WAIT_WARNING_SECONDS = 1  # Waits for a lock longer than this are logged. None to disable it
+LOCK_CALL_SITE_DEPTH = 3  # Frames of the call site saved for each holder of a lock
+
+"""
+DATABASE
+"""
+REPORT_FLUSH_SIZE = 100  # Buffered menu and search reports that trigger a write at DB
+REPORT_FLUSH_SECONDS = 5  # Maximum seconds a report is kept in memory before writing it at DB
+REPORT_FLUSH_ATTEMPTS = 5  # Failed writes of the buffer before its reports are discarded. Retries wait longer each time
+REPORT_RETENTION_DAYS = 30  # Days of menu reports kept one by one. Older ones are compacted into daily aggregates
+REPORT_ROLLUP_SECONDS = 86400  # Seconds between two compactions of old menu reports. None to disable them
+CATALOG_CHECK_SECONDS = 600  # Minimum seconds between checks of the version marker of restaurants and menus
+HISTORY_PATH = resource_path('history')  # Directory of the archive of menus served each day
+HISTORY_DAYS = 7  # Past days shown by the history command
+HISTORY_DATE_FORMAT = '%d/%m'  # Format of the days shown by the history command
+DB_POOL_SIZE = 8  # Connections kept open: workers of the dispatcher (4) and the background threads
+DB_POOL_OVERFLOW = 8  # Extra connections opened on peaks, closed when they are returned
+DB_JOURNAL_MODE = 'WAL'  # SQLite journal. With WAL, readers do not block the writer nor wait for it
+DB_SYNCHRONOUS = 'NORMAL'  # SQLite sync of writes to disk. NORMAL is safe with WAL
+DB_BUSY_TIMEOUT_MS = 5000  # Milliseconds a SQLite connection waits for a lock held by another connection
+DB_MMAP_SIZE = 67108864  # Bytes of the SQLite file read through memory mapping
+DB_CACHED_STATEMENTS = 256  # Prepared statements cached by each SQLite connection
+
 """
 UPV INFO
 """
 
 TOKEN_FILE = resource_path('_tmp_token_file_.json')  # File to save the last token (Used after a reboot)
 INFO_EXP_TIME = 300  # Seconds to cache UPV Info
+INFO_REFRESH_MARGIN = 30  # Seconds before expiration to refresh UPV Info (and token) in background
+INFO_RETRY_SECONDS = 30  # Seconds to wait before retrying a failed refresh
+UPV_POOL_SIZE = 4  # Connections kept alive with the UPV API
+UPV_CONNECT_TIMEOUT = 5  # Seconds to connect to the UPV API (read timeouts are defined for each endpoint)
+UPV_INFO_CHUNK_SIZE = 8192  # Bytes read at once from the UPV info response
+UPV_INFO_SOURCES = []  # (campus, bar) of each UPV info source. Empty for the default campus and bar of upv_parameters
+UPV_INFO_WORKERS = 4  # Sources requested at once (up to UPV_POOL_SIZE, to reuse the connections)
 
 """
 HMI
@@ -32,25 +90,34 @@ BOLD_END = '*'
 """
 KEYPAD CALLBACK DATA
 """
-CBDATA_START_CMD = 'S'  # Callback data for Start command
-CBDATA_INFO_CMD = 'I'  # Callback data for Info command
-
-CBDATA_INFO_REQ = 'F'  # Callback data for a request of info from a restaurant
-CBDATA_REP_REQ = 'Q'  # Callback data for a regular restaurant/menu report request
-CBDATA_SUBS_REQ = 'B'  # Callback data for a subscription request
-CBDATA_UNSUBS_REQ = 'U'  # Callback data for a unsubscription request
+# Action codes of the keypad buttons (packed by CallbackData). Codes must not change: old keypads keep them
+CBDATA_CANCEL = 0  # Cancel request
+CBDATA_START_CMD = 1  # Start command
+CBDATA_INFO_CMD = 2  # Info command
+CBDATA_REP_RES = 3  # Regular report request of a restaurant
+CBDATA_REP_MENU = 4  # Regular report request of a menu
+CBDATA_INFO_RES = 5  # Request of info from a restaurant
+CBDATA_SUBS = 6  # Subscription request
+CBDATA_UNSUBS = 7  # Unsubscription request
 
-CBDATA_RESTAURANT = 'R'  # Value used to identify a restaurant id
-CBDATA_MENU = 'M'  # Value used to identify a menu id
-
-CBDATA_PREVIOUS_TYPE = 'P'  # Value used to report the previous message type (request or cmd)
-
-CBDATA_CANCEL = '-'  # Callback data for a cancel request
+"""
+OUTBOUND MESSAGES
+"""
+SEND_WORKERS = 8  # Threads sending interactive replies to Telegram
+SEND_BULK_WORKERS = 8  # Threads sending massive messages (subscriptions) to Telegram
+SEND_GLOBAL_RATE = 30  # Messages per second to all chats
+SEND_CHAT_RATE = 1  # Messages per second to the same chat
+SEND_CHAT_BURST = 5  # Messages that can be sent at once to the same chat
+SEND_CHAT_BUCKETS = 10000  # Chats whose rate is tracked. The least recently used ones are forgotten
+MESSAGE_MAX_LENGTH = 4096  # Characters of a message accepted by Telegram
+SEND_MAX_RETRIES = 3  # Retries of a failed message
+SEND_BACKOFF_SECONDS = 1  # Initial wait before retrying a message after a network error
 
 """
 SUBSCRIPTIONS
 """
-THREAD_TIMER_SECONDS = 600  # Second to wait between each execution of the subscription thread
+THREAD_TIMER_SECONDS = 600  # Maximum seconds between two checks of the delivery windows of the chats
+DELIVERY_RETRY_SECONDS = 600  # Wait before sending again the failed automatic messages of a chat, in its window
 
-SUBS_WEEKDAY_LIST = list(range(4))  # Available Days for sending subscriptions 0 Monday - 6 Sunday
-SUBS_HOUR_INTERVAL = [12, 15]  # Available hours for sending subscriptions
+SUBS_WEEKDAY_LIST = list(range(4))  # Default days for sending subscriptions to a chat 0 Monday - 6 Sunday
+SUBS_HOUR_INTERVAL = [12, 15]  # Default hours for sending subscriptions to a chat
@@ -0,0 +1,37 @@
+from types import MappingProxyType
+
+
+class CatalogRestaurant:
+    """
+    Static info of a restaurant, detached from DB
+    """
+    __slots__ = ('res_id', 'name', 'phone', 'web', 'latitude', 'longitude', 'menus')
+
+    def __init__(self, restaurant):
+        """
+        :param restaurant: Restaurant entity
+        """
+        self.res_id = restaurant.res_id
+        self.name = restaurant.name
+        self.phone = restaurant.phone
+        self.web = restaurant.web
+        self.latitude = restaurant.latitude
+        self.longitude = restaurant.longitude
+        # Read-only {menu_id: CatalogMenu}
+        self.menus = MappingProxyType({menu_id: CatalogMenu(menu) for menu_id, menu in restaurant.menus.items()})
+
+
+class CatalogMenu:
+    """
+    Static info of a menu, detached from DB. Today info of the menu is kept apart
+    """
+    __slots__ = ('res_id', 'menu_id', 'name', 'codename')
+
+    def __init__(self, menu):
+        """
+        :param menu: Menu entity
+        """
+        self.res_id = menu.res_id
+        self.menu_id = menu.menu_id
+        self.name = menu.name
+        self.codename = menu.codename
@@ -1,63 +1,160 @@
+import atexit
 import datetime
+import logging
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, distinct, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 
 from dagan.data import public_parameters, private_parameters
-from dagan.database.entities import Restaurant, Chat, MenuReport, ReportMode, Subscription
+from dagan.database.catalog import CatalogRestaurant
+from dagan.database.entities import Restaurant, CatalogVersion, Chat, MenuReport, MenuReportDaily, ReportMode, \
+    Subscription, ScheduledSearch, SearchReport
+from dagan.database.report_ledger import ReportLedger
+from dagan.utils.dagan_lock import DaganLock
 from dagan.utils.dagan_rw_lock import DaganRWLock
+from dagan.utils.metrics import Metrics
 
 
 class DBManager:
     Session = None
-    db_lock = DaganRWLock()  # Lock for access to the DB
+    db_lock = DaganRWLock('db')  # Writers of chats and readers of the shared chats. Reads of the DB need none (WAL)
+    db_seconds = Metrics.histogram('dagan_db_seconds', 'Duration of the DB operations', ('operation',))
     chats = None
-    menu_reports = None
-    search_reports = None
+    menu_reports = None  # ReportLedger with the menus reported today
+    search_reports = None  # ReportLedger with the scheduled searches reported today
+    report_buffer = []  # Menu and search reports waiting to be written at DB [(table, report)]
+    report_buffer_lock = DaganLock('report_buffer')
+    # Writers of the report tables. They do not touch the shared chats, so they do not take db_lock: concurrent writes
+    # of chats wait for the DB (busy_timeout) instead of blocking the readers of chats
+    report_write_lock = DaganLock('report_write')
+    report_flush_event = threading.Event()  # Write the buffer before its scheduled time
+    report_flusher = None
+    report_flush_failures = 0  # Consecutive failed writes of the buffer (kept at DBManager, shared with subclasses)
+    rollup_time = 0  # Next compaction of old menu reports
 
     @classmethod
     def initialize(cls):
-        session_factory = sessionmaker(bind=create_engine(private_parameters.DB_URL))
+        # Chats are shared by all threads: a commit must not expire them while others read them
+        session_factory = sessionmaker(bind=cls.create_engine(private_parameters.DB_URL), expire_on_commit=False)
         cls.Session = scoped_session(session_factory)
 
         cls.chats = cls.read_chats()
-        cls.menu_reports = cls.read_menu_reports()
+        cls.menu_reports = ReportLedger(cls.read_menu_reports())
+        cls.search_reports = ReportLedger(cls.read_search_reports())
+        Metrics.gauge('dagan_report_buffer_size', 'Menu and search reports waiting to be written at DB',
+                      lambda: len(cls.report_buffer))
+        cls.report_flusher = threading.Thread(target=cls.__flush_task, daemon=True)
+        cls.report_flusher.start()
+        atexit.register(cls.flush_reports)
 
     @classmethod
+    def create_engine(cls, url):
+        """
+        Create the engine of the DB, with a pool of connections shared by all threads. SQLite connections are
+        configured by __configure_sqlite when they are opened
+        :param url: URL of the DB
+        """
+        connect_args = {}
+        sqlite = make_url(url).get_backend_name() == 'sqlite'
+        if sqlite:
+            connect_args = {'check_same_thread': False, 'cached_statements': public_parameters.DB_CACHED_STATEMENTS}
+        engine = create_engine(url, poolclass=QueuePool, pool_size=public_parameters.DB_POOL_SIZE,
+                               max_overflow=public_parameters.DB_POOL_OVERFLOW, connect_args=connect_args)
+        if sqlite:
+            event.listen(engine, 'connect', cls.__configure_sqlite)
+        return engine
+
+    @staticmethod
+    def __configure_sqlite(connection, _connection_record):
+        """
+        Set the pragmas of a new SQLite connection
+        """
+        cursor = connection.cursor()
+        try:
+            journal_mode = cursor.execute('PRAGMA journal_mode=' + public_parameters.DB_JOURNAL_MODE).fetchone()[0]
+            if journal_mode.upper() != public_parameters.DB_JOURNAL_MODE.upper():
+                logging.getLogger(__name__).warning('SQLite journal mode %s not available, using %s',
+                                                    public_parameters.DB_JOURNAL_MODE, journal_mode)
+            cursor.execute('PRAGMA synchronous=' + public_parameters.DB_SYNCHRONOUS)
+            cursor.execute('PRAGMA busy_timeout=%d' % public_parameters.DB_BUSY_TIMEOUT_MS)
+            cursor.execute('PRAGMA mmap_size=%d' % public_parameters.DB_MMAP_SIZE)
+        finally:
+            cursor.close()
+
+    @classmethod
+    @db_seconds.timed('read_restaurants')
     def read_restaurants(cls):
-        with cls.db_lock.reader():
-            restaurants = {}
-            for item in cls.Session().query(Restaurant).all():
-                restaurants[item.res_id] = item
+        restaurants = {}
+        for item in cls.Session().query(Restaurant).all():
+            restaurants[item.res_id] = item
+        cls.Session.remove()
+        return restaurants
+
+    @classmethod
+    def read_catalog(cls):
+        """
+        Read restaurants and menus as plain objects, detached from DB
+        :return: Dict {res_id: CatalogRestaurant}
+        """
+        return {res_id: CatalogRestaurant(res) for res_id, res in cls.read_restaurants().items()}
+
+    @classmethod
+    @db_seconds.timed('read_catalog_version')
+    def read_catalog_version(cls):
+        """
+        Read the version marker of restaurants and menus
+        :return: Current version, or None if the DB has no marker
+        """
+        try:
+            return cls.Session().query(CatalogVersion.version).scalar()
+        except Exception as err:
+            logging.getLogger(__name__).warning('Catalog version not available: ' + str(err))
+            return None
+        finally:
             cls.Session.remove()
-            return restaurants
 
     @classmethod
+    @db_seconds.timed('read_chats')
     def read_chats(cls):
-        with cls.db_lock.reader():
-            chats = {}
-            for item in cls.Session().query(Chat).all():
-                chats[item.chat_id] = item
-            cls.Session.remove()
-            return chats
+        chats = {}
+        for item in cls.Session().query(Chat).all():
+            chats[item.chat_id] = item
+        cls.Session.remove()
+        return chats
 
     @classmethod
+    @db_seconds.timed('read_menu_reports')
     def read_menu_reports(cls):
-        menu_report = {}  # {chat_id: {res_id: {list_of_menu_ids}}
-        with cls.db_lock.reader():
-            result_list = cls.Session().query(MenuReport).filter(
-                MenuReport.report_date >= datetime.date.today().strftime(public_parameters.SQL_TIME_FORMAT)).all()
-            for item in result_list:
-                if item.chat_id not in menu_report.keys():
-                    menu_report[item.chat_id] = {}
-                if item.res_id not in menu_report[item.chat_id].keys():
-                    menu_report[item.chat_id][item.res_id] = []
-                if item.menu_id not in menu_report[item.chat_id][item.res_id]:
-                    menu_report[item.chat_id][item.res_id].append(item.menu_id)
-            cls.Session.remove()
-            return menu_report
+        """
+        Read the menus reported today
+        :return: Set of (chat_id, res_id, menu_id)
+        """
+        cls.flush_reports()  # Pending reports must be read too
+        result_list = cls.Session().query(MenuReport.chat_id, MenuReport.res_id, MenuReport.menu_id).filter(
+            MenuReport.report_date >= datetime.date.today().strftime(public_parameters.SQL_TIME_FORMAT)).all()
+        menu_reports = {(item.chat_id, item.res_id, item.menu_id) for item in result_list}
+        cls.Session.remove()
+        return menu_reports
 
     @classmethod
+    @db_seconds.timed('read_search_reports')
+    def read_search_reports(cls):
+        """
+        Read the searches reported today
+        :return: Set of (chat_id, text_to_search)
+        """
+        result_list = cls.Session().query(SearchReport.chat_id, SearchReport.text_to_search).filter(
+            SearchReport.search_date >= datetime.date.today().strftime(public_parameters.SQL_TIME_FORMAT)).all()
+        search_reports = {(item.chat_id, item.text_to_search) for item in result_list}
+        cls.Session.remove()
+        return search_reports
+
+    @classmethod
+    @db_seconds.timed('subscribe')
     def subscribe(cls, chat_id, res_id, menu_id):
         sub = Subscription()
         sub.res_id = res_id
@@ -75,13 +172,13 @@ class DBManager:
             try:
                 session.commit()
                 cls.chats[chat_id] = c
-                session.refresh(cls.chats[chat_id])
             except:
-                session.rollback()
+                cls.__rollback(session, chat_id)
             finally:
                 cls.Session.remove()
 
     @classmethod
+    @db_seconds.timed('unsubscribe')
     def unsubscribe(cls, chat_id, res_id, menu_id):
         with cls.db_lock.writer():
             session = cls.Session()
@@ -92,26 +189,222 @@ class DBManager:
                     break
             try:
                 session.commit()
-                session.refresh(cls.chats[chat_id])
             except:
-                session.rollback()
+                cls.__rollback(session, chat_id)
             finally:
                 cls.Session.remove()
 
     @classmethod
-    def report_menu(cls, chat_id, res_id, menu_id, report_date=None, mode=ReportMode.MANUAL):
-        mr = MenuReport()
-        mr.res_id = res_id
-        mr.menu_id = menu_id
-        mr.chat_id = chat_id
-        mr.report_date = datetime.datetime.now()
-        mr.mode = mode
+    @db_seconds.timed('set_mute')
+    def set_mute(cls, chat_id, mute):
+        """
+        Enable or disable the automatic messages of a chat stored at DB
+        :param chat_id: Id of the chat
+        :param mute: True to disable them
+        """
         with cls.db_lock.writer():
+            if chat_id not in cls.chats.keys():
+                return
             session = cls.Session()
-            session.add(mr)
+            session.add(cls.chats[chat_id])
+            cls.chats[chat_id].mute = mute
             try:
                 session.commit()
             except:
+                cls.__rollback(session, chat_id)
+            finally:
+                cls.Session.remove()
+
+    @classmethod
+    @db_seconds.timed('add_search')
+    def add_search(cls, chat_id, text):
+        search = ScheduledSearch()
+        search.chat_id = chat_id
+        search.text_to_search = text
+        with cls.db_lock.writer():
+            session = cls.Session()
+            if chat_id not in cls.chats.keys():
+                c = Chat()
+                c.chat_id = chat_id
+            else:
+                c = cls.chats[chat_id]
+            c.scheduled_searches.append(search)
+            session.add(c)
+            try:
+                session.commit()
+                cls.chats[chat_id] = c
+            except:
+                cls.__rollback(session, chat_id)
+            finally:
+                cls.Session.remove()
+
+    @classmethod
+    @db_seconds.timed('remove_search')
+    def remove_search(cls, chat_id, text):
+        with cls.db_lock.writer():
+            session = cls.Session()
+            session.add(cls.chats[chat_id])
+            for search in cls.chats[chat_id].scheduled_searches:
+                if search.text_to_search == text:
+                    cls.chats[chat_id].scheduled_searches.remove(search)
+                    break
+            try:
+                session.commit()
+            except:
+                cls.__rollback(session, chat_id)
+            finally:
+                cls.Session.remove()
+
+    @classmethod
+    def __rollback(cls, session, chat_id):
+        """
+        Undo a failed change of a chat. The rollback expires the shared chat, so it is read again before its session is
+        closed (expired attributes cannot be loaded without a session)
+        """
+        session.rollback()
+        if chat_id in cls.chats.keys():
+            session.refresh(cls.chats[chat_id])
+
+    @classmethod
+    def report_search(cls, chat_id, text, results, report_date=None, mode=ReportMode.MANUAL):
+        """
+        Save a search report. It is kept in memory and written at DB with the next flush of the buffer
+        """
+        report_date = report_date or datetime.datetime.now()
+        cls.search_reports.add(chat_id, text, report_date=report_date)
+        cls.__buffer_report(SearchReport.__table__, {'chat_id': chat_id, 'text_to_search': text, 'results': results,
+                                                     'search_date': report_date, 'mode': mode})
+
+    @classmethod
+    def report_menu(cls, chat_id, res_id, menu_id, report_date=None, mode=ReportMode.MANUAL):
+        """
+        Save a menu report. It is kept in memory and written at DB with the next flush of the buffer
+        """
+        report = {'chat_id': chat_id, 'res_id': res_id, 'menu_id': menu_id,
+                  'report_date': report_date or datetime.datetime.now(), 'mode': mode}
+        cls.menu_reports.add(chat_id, res_id, menu_id, report_date=report_date)
+        cls.__buffer_report(MenuReport.__table__, report)
+
+    @classmethod
+    def __buffer_report(cls, table, report):
+        """
+        Add a report to the buffer, and wake up the flusher if it is full
+
+        :param table: Table of the report
+        :param report: Dict with the values of the row
+        """
+        with cls.report_buffer_lock:
+            cls.report_buffer.append((table, report))
+            buffered = len(cls.report_buffer)
+        if buffered >= public_parameters.REPORT_FLUSH_SIZE:
+            cls.report_flush_event.set()
+
+    @classmethod
+    @db_seconds.timed('flush_reports')
+    def flush_reports(cls):
+        """
+        Write all buffered reports at DB in a single transaction, with one insert for each table. If it fails, the
+        reports are put back at the front of the buffer for the next flush, up to REPORT_FLUSH_ATTEMPTS times
+
+        :return: True if the buffer was written (or it was empty)
+        """
+        with cls.report_buffer_lock:
+            reports = cls.report_buffer[:]
+            del cls.report_buffer[:]  # Emptied in place, it is shared with subclasses
+        if not reports:
+            return True
+        rows = {}  # {table: list of reports}
+        for table, report in reports:
+            rows.setdefault(table, []).append(report)
+        with cls.report_write_lock:
+            session = cls.Session()
+            try:
+                for table, table_rows in rows.items():
+                    session.execute(table.insert().prefix_with('OR IGNORE'), table_rows)
+                session.commit()
+                DBManager.report_flush_failures = 0
+                return True
+            except Exception as err:
                 session.rollback()
+                DBManager.report_flush_failures += 1
+                if DBManager.report_flush_failures < public_parameters.REPORT_FLUSH_ATTEMPTS:
+                    logging.getLogger(__name__).warning('Reports not written (attempt %d), kept for a retry: %s',
+                                                        DBManager.report_flush_failures, err)
+                    with cls.report_buffer_lock:
+                        cls.report_buffer[:0] = reports
+                else:
+                    logging.getLogger(__name__).error('%d reports discarded after %d attempts',
+                                                      len(reports), DBManager.report_flush_failures)
+                    logging.getLogger(__name__).exception(err)
+                    DBManager.report_flush_failures = 0
+                return False
             finally:
                 cls.Session.remove()
+
+    @classmethod
+    @db_seconds.timed('rollup_menu_reports')
+    def rollup_menu_reports(cls, retention_days=public_parameters.REPORT_RETENTION_DAYS):
+        """
+        Compact the menu reports older than some days into daily aggregates (MenuReportDaily). Each day is compacted
+        in its own transaction, so writers are not blocked by a long one
+
+        :param retention_days: Days of menu reports kept one by one
+        :return: Number of compacted reports
+        """
+        limit = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=retention_days),
+                                          datetime.time())
+        report_day = func.date(MenuReport.report_date)
+        days = [datetime.datetime.strptime(item[0], public_parameters.SQL_TIME_FORMAT).date()
+                for item in cls.Session().query(report_day).filter(
+                    MenuReport.report_date < limit).distinct().order_by(report_day)]
+        cls.Session.remove()
+
+        daily = MenuReportDaily.__table__
+        compacted = 0
+        for day in days:
+            start = datetime.datetime.combine(day, datetime.time())
+            in_day = (MenuReport.report_date >= start) & (MenuReport.report_date < start + datetime.timedelta(days=1))
+            aggregates = select([report_day, MenuReport.res_id, MenuReport.menu_id, MenuReport.mode, func.count(),
+                                 func.count(distinct(MenuReport.chat_id))]).where(in_day).group_by(
+                report_day, MenuReport.res_id, MenuReport.menu_id, MenuReport.mode)
+            with cls.report_write_lock:
+                session = cls.Session()
+                try:
+                    for _, res_id, menu_id, mode, reports, chats in session.execute(aggregates).fetchall():
+                        key = (daily.c.report_day == day) & (daily.c.res_id == res_id) & \
+                              (daily.c.menu_id == menu_id) & (daily.c.mode == mode)
+                        # The day was compacted before only with a change of the clock: add to its aggregates
+                        if not session.execute(daily.update().where(key).values(
+                                reports=daily.c.reports + reports, chats=daily.c.chats + chats)).rowcount:
+                            session.execute(daily.insert().values(report_day=day, res_id=res_id,
+                                                                  menu_id=menu_id, mode=mode, reports=reports,
+                                                                  chats=chats))
+                    compacted += session.execute(MenuReport.__table__.delete().where(in_day)).rowcount
+                    session.commit()
+                except Exception as err:
+                    session.rollback()
+                    logging.getLogger(__name__).exception(err)
+                    break
+                finally:
+                    cls.Session.remove()
+        return compacted
+
+    @classmethod
+    def __flush_task(cls):
+        """
+        Method executed by the report flusher thread.
+        Write the buffer each REPORT_FLUSH_SECONDS seconds, or as soon as it has REPORT_FLUSH_SIZE reports. Failed
+        writes are retried later each time. Old menu reports are compacted each REPORT_ROLLUP_SECONDS seconds
+        """
+        while True:
+            cls.report_flush_event.wait(public_parameters.REPORT_FLUSH_SECONDS)
+            cls.report_flush_event.clear()
+            try:
+                if not cls.flush_reports():
+                    # Back off: the event of a full buffer would retry at once
+                    time.sleep(public_parameters.REPORT_FLUSH_SECONDS * DBManager.report_flush_failures)
+                if public_parameters.REPORT_ROLLUP_SECONDS is not None and time.time() >= cls.rollup_time:
+                    cls.rollup_time = time.time() + public_parameters.REPORT_ROLLUP_SECONDS
+                    cls.rollup_menu_reports()
+            except Exception as err:
+                logging.getLogger(__name__).exception(err)
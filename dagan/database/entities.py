@@ -3,7 +3,8 @@ import enum
 
 import sqlalchemy
 import unidecode
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, DateTime, ForeignKeyConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Float, Date, DateTime, ForeignKeyConstraint, \
+    Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, reconstructor
 from sqlalchemy.orm.collections import attribute_mapped_collection
@@ -47,7 +48,11 @@ class Menu(Base):
     @reconstructor
     def init_on_load(self):
         self.codename = self.generate_codename(self.name)
-        self.today_menu = None
+
+
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+    version = Column(Integer, primary_key=True)  # Increased by DB triggers with each change of restaurants or menus
 
 
 class Chat(Base):
@@ -64,6 +69,7 @@ class Chat(Base):
 
 class Subscription(Base):
     __tablename__ = 'subscription'
+    __table_args__ = (Index('subscription_menu', 'res_id', 'menu_id'),)
     res_id = Column(Integer, primary_key=True)
     menu_id = Column(Integer, primary_key=True)
     menu = relationship("Menu", lazy='select')
@@ -81,6 +87,7 @@ class ScheduledSearch(Base):
 
 class MenuReport(Base):
     __tablename__ = 'menu_report'
+    __table_args__ = (Index('menu_report_date', 'report_date', 'chat_id', 'res_id', 'menu_id'),)
     res_id = Column(Integer, primary_key=True)
     menu_id = Column(Integer, primary_key=True)
     menu = relationship("Menu", lazy='select')
@@ -91,8 +98,20 @@ class MenuReport(Base):
     mode = Column(sqlalchemy.Enum(ReportMode), nullable=False)
 
 
+class MenuReportDaily(Base):
+    __tablename__ = 'menu_report_daily'  # Menu reports older than REPORT_RETENTION_DAYS, compacted by day
+    report_day = Column(Date, primary_key=True)
+    res_id = Column(Integer, primary_key=True)
+    menu_id = Column(Integer, primary_key=True)
+    ForeignKeyConstraint([res_id, menu_id], [Menu.res_id, Menu.menu_id])
+    mode = Column(sqlalchemy.Enum(ReportMode), primary_key=True)
+    reports = Column(Integer, nullable=False)
+    chats = Column(Integer, nullable=False)
+
+
 class SearchReport(Base):
     __tablename__ = 'search_report'
+    __table_args__ = (Index('search_report_date', 'search_date', 'chat_id', 'text_to_search'),)
     chat_id = Column(Integer, ForeignKey('chat.chat_id'), primary_key=True)
     chat = relationship("Chat", lazy='select')
     text_to_search = Column(String, primary_key=True)
@@ -0,0 +1,154 @@
+import datetime
+import functools
+import os
+import struct
+import threading
+import zlib
+
+
+class HistoryEntry:
+    """
+    Menu served in a past day
+    """
+    __slots__ = ('date', 'res_id', 'menu_id', 'first', 'second', 'others', 'observations', 'price')
+
+    def __init__(self, date, res_id, menu_id, fields):
+        """
+        :param date: Day of the menu
+        :param res_id: Id of the restaurant
+        :param menu_id: Id of the menu
+        :param fields: Values of MenuHistory.FIELDS
+        """
+        self.date = date
+        self.res_id = res_id
+        self.menu_id = menu_id
+        self.first, self.second, self.others, self.observations, self.price = fields
+
+
+class MenuHistory:
+    """
+    Append-only archive of the menus of each day, with a file per month. Each record is a fixed size header
+    (day, res_id, menu_id, size) followed by the fields of the menu compressed, so queries can skip the records
+    they do not need without decompressing them.
+    A menu is only appended again the same day if its fields have changed
+    """
+    HEADER = struct.Struct('<Iiii')  # Ordinal of the day, res_id, menu_id, size of the fields
+    FIELDS = ('first', 'second', 'others', 'observations', 'price')
+    SEPARATOR = '\x1f'
+    FILE_NAME = '%Y-%m.bin'
+
+    def __init__(self, path):
+        """
+        :param path: Directory of the archive
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.day = None  # Day of the last records
+        self.last_records = {}  # Fields of the last record of each menu of that day {(res_id, menu_id): bytes}
+
+    def add(self, date, today_menus):
+        """
+        Archive the menus of a day, skipping the ones already archived without changes
+
+        :param date: Day of the menus
+        :param today_menus: Dict {(res_id, menu_id): TodayMenu}
+        :return: Number of records appended
+        """
+        with self.lock:
+            if date != self.day:
+                self.day = date
+                self.last_records = self.__read_day(date)
+            records = []
+            for (res_id, menu_id), tm in today_menus.items():
+                data = self.pack_fields(tm)
+                if self.last_records.get((res_id, menu_id)) != data:
+                    self.last_records[(res_id, menu_id)] = data
+                    records.append(self.HEADER.pack(date.toordinal(), res_id, menu_id, len(data)) + data)
+            if records:
+                os.makedirs(self.path, exist_ok=True)
+                with open(self.file_path(date), 'ab') as file:
+                    file.write(b''.join(records))
+            return len(records)
+
+    def query(self, start_date, end_date, res_id=None, menu_id=None):
+        """
+        Read the archived menus of some days. Only the last version of each menu in a day is returned
+
+        :param start_date: First day (included)
+        :param end_date: Last day (included)
+        :param res_id: Id of the restaurant. None for all
+        :param menu_id: Id of the menu. None for all
+        :return: List of HistoryEntry sorted by day, res_id and menu_id
+        """
+        start, end = start_date.toordinal(), end_date.toordinal()
+        found = {}
+        month = datetime.date(start_date.year, start_date.month, 1)
+        while month <= end_date:
+            for day, rec_res_id, rec_menu_id, data in self.__iter_records(self.file_path(month)):
+                if start <= day <= end and (res_id is None or res_id == rec_res_id) and \
+                        (menu_id is None or menu_id == rec_menu_id):
+                    found[(day, rec_res_id, rec_menu_id)] = data()
+            month = (month + datetime.timedelta(days=31)).replace(day=1)
+        return [HistoryEntry(datetime.date.fromordinal(day), rec_res_id, rec_menu_id, self.unpack_fields(data))
+                for (day, rec_res_id, rec_menu_id), data in sorted(found.items())]
+
+    def file_path(self, date):
+        """
+        :return: Path of the file with the records of the month of a day
+        """
+        return os.path.join(self.path, date.strftime(self.FILE_NAME))
+
+    def __read_day(self, date):
+        """
+        Read the last record of each menu of a day
+        :return: Dict {(res_id, menu_id): bytes}
+        """
+        day = date.toordinal()
+        records = self.__iter_records(self.file_path(date), repair=True)
+        return {(res_id, menu_id): data() for rec_day, res_id, menu_id, data in records if rec_day == day}
+
+    def __iter_records(self, file_path, repair=False):
+        """
+        Read the records of a file. An incomplete record at the end (an interrupted write) is discarded
+
+        :param file_path: Path of the file
+        :param repair: Remove the incomplete record from the file. Only with the lock, there must not be writers
+        :return: Generator of (day ordinal, res_id, menu_id, function that reads the fields)
+        """
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            pos = 0
+            while pos + self.HEADER.size <= size:
+                file.seek(pos)
+                day, res_id, menu_id, length = self.HEADER.unpack(file.read(self.HEADER.size))
+                if pos + self.HEADER.size + length > size:
+                    break
+                data_pos = pos + self.HEADER.size
+                yield day, res_id, menu_id, functools.partial(self.__read_at, file, data_pos, length)
+                pos = data_pos + length
+        if repair and pos < size:
+            with open(file_path, 'r+b') as file:
+                file.truncate(pos)  # New records must start after the last complete one
+
+    @staticmethod
+    def __read_at(file, pos, length):
+        file.seek(pos)
+        return file.read(length)
+
+    @classmethod
+    def pack_fields(cls, tm):
+        """
+        :param tm: TodayMenu
+        :return: Compressed fields of the menu
+        """
+        return zlib.compress(cls.SEPARATOR.join(getattr(tm, field) for field in cls.FIELDS).encode('utf-8'))
+
+    @classmethod
+    def unpack_fields(cls, data):
+        """
+        :param data: Compressed fields of a menu
+        :return: List of values of FIELDS
+        """
+        return zlib.decompress(data).decode('utf-8').split(cls.SEPARATOR)
@@ -0,0 +1,54 @@
+import datetime
+import threading
+
+
+class ReportLedger:
+    """
+    Items reported today to each chat, as a set of (chat_id, *item). Items are (res_id, menu_id) for menus and
+    (text_to_search,) for searches.
+    It is emptied when the day changes
+    """
+
+    def __init__(self, reports=()):
+        """
+        :param reports: Reports of today (chat_id, *item)
+        """
+        self.day = datetime.date.today()
+        self.reports = set(reports)
+        self.lock = threading.Lock()
+
+    def add(self, chat_id, *item, report_date=None):
+        """
+        Register a report
+
+        :param chat_id: Id of the chat
+        :param item: Fields of the reported item
+        :param report_date: Date of the report (now by default). Reports of other days are ignored
+        """
+        with self.lock:
+            self.__rollover()
+            if report_date is None or report_date.date() == self.day:
+                self.reports.add((chat_id,) + item)
+
+    def check(self, chat_id, *item):
+        with self.lock:
+            self.__rollover()
+            return (chat_id,) + item in self.reports
+
+    def pending(self, chat_ids, *item):
+        """
+        Filter the chats which have not received an item today
+
+        :param chat_ids: Iterable of chat ids
+        :param item: Fields of the item
+        :return: Set of chat ids
+        """
+        with self.lock:
+            self.__rollover()
+            return {chat_id for chat_id in chat_ids if (chat_id,) + item not in self.reports}
+
+    def __rollover(self):
+        today = datetime.date.today()
+        if today != self.day:
+            self.reports.clear()
+            self.day = today
@@ -0,0 +1,67 @@
+from types import MappingProxyType
+
+
+class ChatIndex:
+    """
+    Immutable two-way index between chats and keys (like subscribed menus or searched texts).
+    Changes return a new index, so readers can use the published one without locks. Chats and keys without any pair
+    are removed
+    """
+    __slots__ = ('by_chat', 'by_key')
+
+    def __init__(self, by_chat=None, by_key=None):
+        self.by_chat = MappingProxyType(by_chat or {})  # {chat_id: frozenset of keys}
+        self.by_key = MappingProxyType(by_key or {})  # Inverted index {key: frozenset of chat_ids}
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Build the index from the pairs read at DB
+        :param pairs: Iterable of (chat_id, key)
+        :return: New index
+        """
+        by_chat = {}
+        by_key = {}
+        for chat_id, key in pairs:
+            by_chat.setdefault(chat_id, set()).add(key)
+            by_key.setdefault(key, set()).add(chat_id)
+        return cls({chat_id: frozenset(keys) for chat_id, keys in by_chat.items()},
+                   {key: frozenset(chat_ids) for key, chat_ids in by_key.items()})
+
+    def has_pair(self, chat_id, key):
+        return key in self.by_chat.get(chat_id, ())
+
+    def of_chat(self, chat_id):
+        """
+        :param chat_id: Id of the chat
+        :return: Sorted list of keys of the chat
+        """
+        return sorted(self.by_chat.get(chat_id, ()))
+
+    def of_key(self, key):
+        """
+        :param key: Key
+        :return: Frozenset of chat ids with the key
+        """
+        return self.by_key.get(key, frozenset())
+
+    def with_pair(self, chat_id, key):
+        return self.__replace(chat_id, key, self.by_chat.get(chat_id, frozenset()) | {key},
+                              self.of_key(key) | {chat_id})
+
+    def without_pair(self, chat_id, key):
+        return self.__replace(chat_id, key, self.by_chat.get(chat_id, frozenset()) - {key},
+                              self.of_key(key) - {chat_id})
+
+    def __replace(self, chat_id, key, chat_keys, key_chats):
+        """
+        Copy the index changing the keys of a chat and the chats of a key
+        """
+        by_chat = dict(self.by_chat)
+        by_key = dict(self.by_key)
+        for index, item, values in ((by_chat, chat_id, chat_keys), (by_key, key, key_chats)):
+            if values:
+                index[item] = values
+            else:
+                index.pop(item, None)
+        return type(self)(by_chat, by_key)
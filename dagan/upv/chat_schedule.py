@@ -0,0 +1,66 @@
+import datetime
+import json
+
+from dagan.data import public_parameters
+
+
+class ChatSchedule:
+    """
+    Delivery window of the automatic messages of a chat: some days of the week, between two hours
+    """
+    __slots__ = ('mute', 'start_hour', 'end_hour', 'days')
+
+    def __init__(self, mute=False, start_hour=None, end_hour=None, days=None):
+        """
+        :param mute: No automatic messages
+        :param start_hour: Hour of the day (float) when the window opens. SUBS_HOUR_INTERVAL by default
+        :param end_hour: Hour of the day (float) when the window closes. SUBS_HOUR_INTERVAL by default
+        :param days: Days of the week (0 Monday - 6 Sunday). SUBS_WEEKDAY_LIST by default
+        """
+        self.mute = mute
+        self.start_hour = public_parameters.SUBS_HOUR_INTERVAL[0] if start_hour is None else start_hour
+        self.end_hour = public_parameters.SUBS_HOUR_INTERVAL[1] if end_hour is None else end_hour
+        self.days = frozenset(public_parameters.SUBS_WEEKDAY_LIST if days is None else days)
+
+    @classmethod
+    def from_chat(cls, chat):
+        """
+        :param chat: Chat read at DB
+        :return: Schedule of the chat
+        """
+        try:
+            days = json.loads(chat.days)
+        except (TypeError, ValueError):
+            days = None  # Default days
+        return cls(bool(chat.mute), chat.start_hour, chat.end_hour, days)
+
+    def is_open(self, now):
+        """
+        :param now: Datetime
+        :return: True if automatic messages can be sent at that moment
+        """
+        hour = now.hour + (now.minute / 60)
+        return not self.mute and now.weekday() in self.days and self.start_hour <= hour < self.end_hour
+
+    def next_opening(self, now):
+        """
+        :param now: Datetime
+        :return: Datetime when the window opens after that moment, or None if it never opens
+        """
+        if self.mute or not self.days or self.start_hour >= self.end_hour:
+            return None
+        for offset in range(8):
+            day = now.date() + datetime.timedelta(days=offset)
+            if day.weekday() in self.days:
+                opening = datetime.datetime.combine(day, datetime.time()) + \
+                          datetime.timedelta(hours=self.start_hour)
+                if opening > now:
+                    return opening
+        return None
+
+    def next_delivery(self, now):
+        """
+        :param now: Datetime
+        :return: That moment if the window is open, otherwise when it opens (None if it never opens)
+        """
+        return now if self.is_open(now) else self.next_opening(now)
@@ -0,0 +1,62 @@
+import heapq
+import itertools
+import threading
+
+
+class DeliveryScheduler:
+    """
+    Heap of chats ordered by the next time their delivery window opens.
+    Each wake-up only takes the chats whose window has opened. Rescheduling a chat leaves its previous entry in the
+    heap, which is discarded when it is popped
+    """
+
+    def __init__(self):
+        self.heap = []  # [(time, count, chat_id)]
+        self.entries = {}  # Current time of each scheduled chat {chat_id: time}
+        self.counter = itertools.count()  # Tie-breaker of equal times
+        self.lock = threading.Lock()
+
+    def schedule(self, chat_id, when):
+        """
+        Set the next delivery of a chat
+
+        :param chat_id: Id of the chat
+        :param when: Datetime, or None to remove the chat
+        """
+        with self.lock:
+            if when is None:
+                self.entries.pop(chat_id, None)
+                return
+            self.entries[chat_id] = when
+            heapq.heappush(self.heap, (when, next(self.counter), chat_id))
+
+    def pop_due(self, now):
+        """
+        Take the chats whose delivery time has arrived. They are no longer scheduled
+
+        :param now: Datetime
+        :return: List of chat ids
+        """
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                when, count, chat_id = heapq.heappop(self.heap)
+                if self.entries.get(chat_id) == when:
+                    del self.entries[chat_id]
+                    due.append(chat_id)
+        return due
+
+    def wait_time(self, now):
+        """
+        :param now: Datetime
+        :return: Seconds until the next delivery (None if there are no chats)
+        """
+        with self.lock:
+            while self.heap and self.entries.get(self.heap[0][2]) != self.heap[0][0]:
+                heapq.heappop(self.heap)  # Rescheduled or removed chat
+            if not self.heap:
+                return None
+            return max((self.heap[0][0] - now).total_seconds(), 0)
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,134 +1,515 @@
 import datetime
-import json
 import logging
+import threading
 import time
-
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 from dagan.data import public_parameters
 from dagan.database.db_manager import DBManager
 from dagan.database.entities import ReportMode
+from dagan.database.menu_history import MenuHistory
+from dagan.upv.chat_schedule import ChatSchedule
 from dagan.upv.data import upv_parameters
+from dagan.upv.info_parser import InfoParser
+from dagan.upv.info_snapshot import InfoSnapshot
+from dagan.upv.menu_diff import MenuDiff
+from dagan.upv.menu_event import MenuEvent
+from dagan.upv.saved_searches import SavedSearches
+from dagan.upv.search_index import SearchIndex
+from dagan.upv.subscriptions import Subscriptions
 from dagan.upv.today_menu import TodayMenu
 from dagan.upv.token import Token
-from dagan.utils.dagan_rw_lock import DaganRWLock
+from dagan.upv.upv_client import UpvClient
+from dagan.utils.dagan_lock import DaganLock
+from dagan.utils.metrics import Metrics
+from dagan.utils.notifying import NotifyingEvent, NotifyingQueue
 
 
 class InfoManager(DBManager):
-    data_lock = DaganRWLock()  # Lock for access to info data (restaurants, chats, searches, ...)
-    report_lock = DaganRWLock()  # Lock for access to report data (reported menus, results, ...)
-    restaurants = None
+    write_lock = DaganLock('info_write')  # Lock for writers of info data. Readers use the published snapshots without locks
+    snapshot = InfoSnapshot()  # Catalog and menus of today, replaced as a whole by each info change
+    catalog_version = None  # Version marker of the DB when the catalog was read
+    catalog_check_time = 0  # Last time the version marker was checked
+    catalog_invalid = True  # The catalog must be read with the next refresh (it has not been read yet)
+    feed_items = {}  # TodayMenu of each item of the last UPV info {item fields as a sorted tuple: TodayMenu}
+    source_feeds = {}  # Last info of each source {(campus, bar): (day, {item fields as a sorted tuple: TodayMenu})}
+    source_expirations = {}  # Expiration time of the info of each source {(campus, bar): time}
+    fetch_pool = ThreadPoolExecutor(public_parameters.UPV_INFO_WORKERS)  # Requests of the sources run concurrently
+    subscriptions = Subscriptions()  # Immutable snapshot of subscriptions, replaced by each change
+    saved_searches = SavedSearches()  # Immutable snapshot of scheduled searches, replaced by each change
+    schedules = MappingProxyType({})  # Read-only {chat_id: ChatSchedule}, replaced by each change
+    search_index = SearchIndex()  # Words of today menus
+    events = NotifyingQueue()  # Menu events (MenuEvent) published by each info reload
     token = Token()
+    upv_client = UpvClient()
     expiration_time = time.time()
+    next_retry = 0  # Time before which a failed refresh is not retried on demand (INFO_RETRY_SECONDS backoff)
+    refresh_lock = DaganLock('refresh', hold_warning=None)  # Only one refresh at once. It requests UPV by design
+    refresh_event = NotifyingEvent()  # Wake up the refresher before its scheduled time
+    refresher = None
+    refresh_listeners = []  # Functions called with the MenuDiff when new info of restaurants is published
+    menu_history = MenuHistory(public_parameters.HISTORY_PATH)  # Archive of the menus of each day
+    refresh_seconds = Metrics.histogram('dagan_refresh_seconds', 'Duration of the refreshes of the UPV info')
+    source_seconds = Metrics.histogram('dagan_upv_info_seconds', 'Duration of the request and parse of a UPV source',
+                                       ('campus', 'bar'))
+    source_errors = Metrics.counter('dagan_upv_info_errors_total', 'Failed requests of a UPV source', ('campus', 'bar'))
 
     @classmethod
-    def initialize(cls):
+    def initialize(cls, refresher=True):
+        """
+        Load the data and start the refresher thread
+
+        :param refresher: Start the refresher thread. Otherwise the owner must call scheduled_refresh()
+        """
         DBManager.initialize()
+        Metrics.gauge('dagan_menu_events_queue_size', 'Menu events waiting to be dispatched', cls.events.qsize)
+        with cls.db_lock.reader():
+            cls.subscriptions = Subscriptions.from_chats(cls.chats)
+            cls.saved_searches = SavedSearches.from_chats(cls.chats)
+            cls.schedules = MappingProxyType({chat_id: ChatSchedule.from_chat(chat)
+                                              for chat_id, chat in cls.chats.items()})
+        cls.add_refresh_listener(cls.archive_menus)
+        cls.add_refresh_listener(cls.index_menus)
         cls.reload()
+        if refresher:
+            cls.refresher = threading.Thread(target=cls.__refresh_task, daemon=True)
+            cls.refresher.start()
+
+    @classmethod
+    def add_refresh_listener(cls, listener):
+        """
+        Register a function to call each time the restaurants info is replaced
+        :param listener: Function to call with the MenuDiff of the menus of today
+        """
+        cls.refresh_listeners.append(listener)
 
     @classmethod
     def reload(cls):
         """
-        Reload (if it is needed) the token of UPV APi and the information of restaurants
+        Make sure there is information of restaurants. Expired information is still served while the refresher
+        renews it in background, so only the first load blocks the caller. After a failed refresh the refresher is
+        not woken up until its retry time
         """
-        cls.__reload_token()
-        cls.__reload_info()
+        if cls.snapshot.restaurants is None:
+            cls.refresh()
+        elif not cls.is_active() and time.time() >= cls.next_retry:
+            cls.refresh_event.set()
 
     @classmethod
-    def __reload_token(cls):
+    @refresh_seconds.timed()
+    def refresh(cls):
         """
-        Check if token is valid. If not, request it and save it
+        Reload the token of UPV APi (if it is needed), the catalog of restaurants (if it has changed) and the
+        information of restaurants
         """
-        if not cls.token.is_active():
-            cls.token.load(cls._request_token())
-            cls.token.save()
+        with cls.refresh_lock:
+            cls.__reload_token()
+            catalog, version = cls.__read_changed_catalog()
+            cls.__reload_info(catalog)
+            if catalog is not None:
+                cls.catalog_version = version
+                cls.catalog_invalid = False
 
-    @staticmethod
-    def _request_token():
-        text = ''
+    @classmethod
+    def __read_changed_catalog(cls):
+        """
+        Read restaurants and menus if they have not been read yet or the version marker of the DB has changed.
+        The marker is checked once each CATALOG_CHECK_SECONDS
+        :return: Tuple (catalog, version). Catalog is None if it has not changed
+        """
+        if not cls.catalog_invalid and time.time() < cls.catalog_check_time + public_parameters.CATALOG_CHECK_SECONDS:
+            return None, cls.catalog_version
+        cls.catalog_check_time = time.time()
+        version = cls.read_catalog_version()
+        if not cls.catalog_invalid and version == cls.catalog_version:
+            return None, version
+        return cls.read_catalog(), version
+
+    @classmethod
+    def __refresh_task(cls):
+        """
+        Method executed by the refresher thread.
+        Renew the information INFO_REFRESH_MARGIN seconds before it expires (or when a reload finds it expired)
+        """
+        wait = cls.refresh_delay()
+        while True:
+            cls.refresh_event.wait(wait)
+            cls.refresh_event.clear()
+            wait = cls.scheduled_refresh()
+
+    @classmethod
+    def scheduled_refresh(cls):
+        """
+        Refresh the information, keeping the current one if it fails
+        :return: Seconds to wait until the next refresh
+        """
         try:
-            text = requests.post(upv_parameters.UPV_TOKEN_URL, timeout=upv_parameters.UPV_TOKEN_TIMEOUT,
-                                 headers=upv_parameters.UPV_TOKEN_HEADERS, data=upv_parameters.UPV_TOKEN_TYPE,
-                                 auth=(upv_parameters.UPV_USER, upv_parameters.UPV_PSW)).text
+            cls.refresh()
         except Exception as err:
             logging.getLogger(__name__).exception(err)
-        return text
+        if cls.refresh_delay() <= 0:
+            # Refresh failed, current information is kept until next try
+            cls.next_retry = time.time() + public_parameters.INFO_RETRY_SECONDS
+            return public_parameters.INFO_RETRY_SECONDS
+        return cls.refresh_delay()
 
     @classmethod
-    def __reload_info(cls):
-        """
-        Check if restaurants info is still valid. If not, request it and save ir
-        :return:
-        """
-        if not cls.is_active():
-            with cls.data_lock.writer():
-                cls.restaurants = cls.read_restaurants()
-                text = cls._request_info()
-                for item in json.loads(text):
-                    # Text is a list of dictionaries, and each dictionary contains info from the menu of a restaurant
-                    # (and all restaurant's information)
-                    tm = TodayMenu(item)
-                    if tm.res_id in cls.restaurants.keys():
-                        found = False
-                        for menu in cls.restaurants[tm.res_id].menus.values():
-                            if menu.codename == tm.codename:
-                                menu.today_menu = tm
-                                found = True
-                                break
-                        if not found:
-                            logging.getLogger(__name__).warning('Menu not matched!! ' + str(item))
-                    else:
-                        logging.getLogger(__name__).warning('Restaurant Id not found!! ' + str(item))
-
-    @classmethod
-    def _request_info(cls):
+    def refresh_delay(cls):
+        """
+        :return: Seconds until the information must be refreshed
+        """
+        return max(cls.expiration_time - time.time() - public_parameters.INFO_REFRESH_MARGIN, 0)
+
+    @classmethod
+    def __reload_token(cls):
+        """
+        Check if token is valid (and it is not going to expire soon). If not, request it and save it
+        """
+        if not cls.token.is_active(public_parameters.INFO_REFRESH_MARGIN):
+            cls.token.load(cls._request_token())
+            cls.token.save()
+
+    @classmethod
+    def _request_token(cls):
         text = ''
         try:
-            text = requests.get(
-                upv_parameters.UPV_INFO_URL + '?' + upv_parameters.UPV_INFO_DATE_PARAM + '=' + cls.current_date() + '&' + upv_parameters.UPV_INFO_CAMPUS_PARAM + '=' + upv_parameters.UPV_INFO_CAMPUS_DEFAULT + '&' + upv_parameters.UPV_INFO_BAR_PARAM + '=' + upv_parameters.UPV_INFO_BAR_DEFAULT,
-                timeout=upv_parameters.UPV_INFO_TIMEOUT, headers={
-                    upv_parameters.UPV_INFO_HEADER_AUTH: cls.token.token_type + " " + cls.token.access_token + ':' + upv_parameters.UPV_UUID}).text
-            for org, dst in public_parameters.ALL_INFO_REPLACE:
-                text = text.replace(org, dst)
-            cls.expiration_time = time.time() + public_parameters.INFO_EXP_TIME  # With each load we reset the expiration counter
+            text = cls.upv_client.request_token()
         except Exception as err:
             logging.getLogger(__name__).exception(err)
         return text
 
+    @classmethod
+    def __reload_info(cls, catalog=None):
+        """
+        Request the restaurants info of the sources about to expire and swap it with the current one if something has
+        changed. Items of the info that have not changed keep their previous TodayMenu, and only the menus added,
+        changed or removed are replaced in a copy of the previous menus
+
+        :param catalog: New catalog {res_id: CatalogRestaurant} to publish with the info. None to keep the current one
+        """
+        sources = cls.get_sources()
+        cls.__reload_sources([source for source in sources if cls.source_expirations.get(source, 0) -
+                              public_parameters.INFO_REFRESH_MARGIN <= time.time()])
+        cls.__drop_expired_feeds(sources)
+        cls.expiration_time = min(cls.source_expirations.get(source, 0) for source in sources)
+        feed_items = {}
+        for source in sources:
+            feed_items.update(cls.source_feeds.get(source, (None, {}))[1])
+        if catalog is None and feed_items.keys() == cls.feed_items.keys():
+            return  # Nothing has changed
+
+        restaurants = catalog if catalog is not None else cls.snapshot.restaurants
+        menus = {(res_id, menu.codename): menu for res_id, res in restaurants.items() for menu in res.menus.values()}
+        today_menus = {}
+        for key, tm in feed_items.items():
+            menu = menus.get((tm.res_id, tm.codename))
+            if menu is not None:
+                today_menus[(menu.res_id, menu.menu_id)] = tm
+            elif tm.res_id in restaurants.keys():
+                logging.getLogger(__name__).warning('Menu not matched!! ' + str(dict(key)))
+            else:
+                logging.getLogger(__name__).warning('Restaurant Id not found!! ' + str(dict(key)))
+        cls.feed_items = feed_items
+        diff = MenuDiff.between(cls.snapshot.today_menus, today_menus)
+        if catalog is None and not diff:
+            return  # Only items without a menu have changed
+        # Catalog and menus are published at once
+        cls.snapshot = InfoSnapshot(restaurants, diff.apply(cls.snapshot.today_menus) if diff else
+                                    cls.snapshot.today_menus)
+        for listener in cls.refresh_listeners:
+            try:
+                listener(diff)
+            except Exception as err:
+                logging.getLogger(__name__).exception(err)
+        cls.__publish_events(diff)
+
+    @classmethod
+    def __reload_sources(cls, sources):
+        """
+        Request the info of some sources at once. The info of a source which fails is kept until it expires, and
+        it is requested again with the next refresh
+
+        :param sources: List of (campus, bar)
+        """
+        day = datetime.date.today()
+        futures = [(source, cls.fetch_pool.submit(cls.__request_feed, *source)) for source in sources]
+        for source, future in futures:
+            try:
+                feed = future.result()
+            except Exception as err:
+                logging.getLogger(__name__).exception(err)
+                cls.source_errors.labels(*source).inc()
+                continue
+            if feed is not None:  # Otherwise it has not been modified since the last request (of the same day)
+                cls.source_feeds[source] = (day, feed)
+            # With each load we reset the expiration counter
+            cls.source_expirations[source] = time.time() + public_parameters.INFO_EXP_TIME
+
+    @classmethod
+    def __drop_expired_feeds(cls, sources):
+        """
+        Forget the info of the sources which has expired (the source has failed since then) or is from another day
+
+        :param sources: List of (campus, bar)
+        """
+        today = datetime.date.today()
+        for source in sources:
+            day, feed = cls.source_feeds.get(source, (None, None))
+            if feed is not None and (day != today or cls.source_expirations.get(source, 0) <= time.time()):
+                logging.getLogger(__name__).warning('Info of %s/%s from %s expired', source[0], source[1], day)
+                del cls.source_feeds[source]
+                cls.upv_client.forget_validators(*source)
+
+    @classmethod
+    def __request_feed(cls, campus, bar):
+        """
+        Request and parse the info of a source
+        :param campus: Campus code
+        :param bar: Bar code
+        :return: Dict {item fields as a sorted tuple: TodayMenu}, or None if it has not been modified
+        """
+        with cls.source_seconds.time(campus, bar):
+            chunks = cls._request_info(campus, bar)
+            if chunks is None:
+                return None
+            return dict(cls.__iter_feed(chunks))
+
+    @staticmethod
+    def get_sources():
+        """
+        :return: List of (campus, bar) with the info to serve
+        """
+        return public_parameters.UPV_INFO_SOURCES or [(upv_parameters.UPV_INFO_CAMPUS_DEFAULT,
+                                                       upv_parameters.UPV_INFO_BAR_DEFAULT)]
+
+    @classmethod
+    def __iter_feed(cls, chunks):
+        """
+        Parse the UPV info while it is received
+        :param chunks: Text of the info, or an iterable of pieces of text
+        :return: Generator of (item fields as a sorted tuple, TodayMenu)
+        """
+        for item in InfoParser.iter_items(chunks):
+            # Text is a list of dictionaries, and each dictionary contains info from the menu of a restaurant
+            # (and all restaurant's information)
+            key = tuple(sorted(item.items()))
+            yield key, cls.feed_items.get(key) or TodayMenu(item)
+
+    @classmethod
+    def archive_menus(cls, diff):
+        """
+        Save the menus of today in the history: all of them with the first load of a day, and then the new or changed
+        ones. Menus already saved without changes are skipped
+
+        :param diff: MenuDiff of the load
+        """
+        today = datetime.date.today()
+        cls.menu_history.add(today, cls.snapshot.today_menus if cls.menu_history.day != today else diff.updated())
+
+    @classmethod
+    def index_menus(cls, diff):
+        """
+        Update the search index with the menus of today. Only new or changed menus are indexed
+
+        :param diff: MenuDiff of the load
+        """
+        cls.search_index.update(diff)
+
+    @classmethod
+    def search_menus(cls, text, snapshot=None):
+        """
+        Find the menus of today with all words of a text
+        :param text: Text to search
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: Sorted list of (res_id, menu_id)
+        """
+        today_menus = (snapshot or cls.snapshot).today_menus
+        return [key for key in cls.search_index.search(text) if key in today_menus]
+
+    @classmethod
+    def get_menu_history(cls, days, res_id=None, menu_id=None):
+        """
+        Return the menus served in the last days (today is not included)
+        :param days: Number of days
+        :param res_id: Id of the restaurant. None for all
+        :param menu_id: Id of the menu. None for all
+        :return: List of HistoryEntry sorted by day
+        """
+        today = datetime.date.today()
+        return cls.menu_history.query(today - datetime.timedelta(days=days), today - datetime.timedelta(days=1),
+                                      res_id, menu_id)
+
+    @classmethod
+    def __publish_events(cls, diff):
+        """
+        Publish an event for each new or modified menu of a load
+        :param diff: MenuDiff of the load
+        """
+        for key in diff.added.keys():
+            cls.events.put(MenuEvent(MenuEvent.AVAILABLE, *key))
+        for key in diff.changed.keys():
+            cls.events.put(MenuEvent(MenuEvent.CHANGED, *key))
+        cls.events.put(MenuEvent(MenuEvent.REFRESHED, None, None))
+
+    @classmethod
+    def get_today_menus(cls):
+        """
+        Return the info of all menus available today
+        :return: Read-only dict {(res_id, menu_id): TodayMenu}
+        """
+        return cls.snapshot.today_menus
+
+    @classmethod
+    def get_today_menu(cls, res_id, menu_id):
+        """
+        Return the info of a menu for today
+        :param res_id: Id of the restaurant
+        :param menu_id: Id of the menu
+        :return: TodayMenu, or None if the menu is not available today
+        """
+        return cls.snapshot.get_today_menu(res_id, menu_id)
+
+    @classmethod
+    def _request_info(cls, campus, bar):
+        """
+        :param campus: Campus code
+        :param bar: Bar code
+        :return: Text of the UPV info (or pieces of it while it is received). None if it has not been modified
+        :raise: Errors of the request. They are logged by the caller, with the failed source
+        """
+        return cls.upv_client.request_info(cls.token, cls.current_date(), campus, bar)
+
     @classmethod
     def get_available_restaurants(cls):
-        available_restaurants = []
-        for res in cls.restaurants.values():
-            for menu in res.menus.values():
-                if menu.today_menu is not None:
-                    available_restaurants.append(res)
-                    break
-        return available_restaurants
+        return cls.snapshot.available_restaurants()
 
     @classmethod
     def check_subscription(cls, chat_id, res_id, menu_id):
-        found = False
-        if chat_id in cls.chats.keys():
-            for sub in cls.chats[chat_id].subscriptions:
-                if sub.res_id == res_id and sub.menu_id == menu_id:
-                    found = True
-                    break
-        return found
+        return cls.subscriptions.check(chat_id, res_id, menu_id)
+
+    @classmethod
+    def get_available_menus(cls):
+        """
+        Return the keys of all menus with info for today
+        :return: List of (res_id, menu_id)
+        """
+        return cls.snapshot.available_menus()
+
+    @classmethod
+    def get_pending_subscribers(cls, res_id, menu_id):
+        """
+        Return the chats subscribed to a menu which have not received it today
+        :param res_id: Id of the restaurant
+        :param menu_id: Id of the menu
+        :return: Set of chat ids
+        """
+        subscribers = cls.subscriptions.of_menu(res_id, menu_id)
+        if not subscribers:
+            return set()
+        return cls.menu_reports.pending(subscribers, res_id, menu_id)
+
+    @classmethod
+    def get_pending_searchers(cls, text):
+        """
+        Return the chats with a scheduled search which have not received its results today
+        :param text: Text to search
+        :return: Set of chat ids
+        """
+        searchers = cls.saved_searches.of_text(text)
+        if not searchers:
+            return set()
+        return cls.search_reports.pending(searchers, text)
+
+    @classmethod
+    def get_schedule(cls, chat_id):
+        """
+        :param chat_id: Id of the chat
+        :return: ChatSchedule of the chat (the default one if it is not stored at DB)
+        """
+        return cls.schedules.get(chat_id) or ChatSchedule()
+
+    @classmethod
+    def get_delivery_chats(cls):
+        """
+        :return: Set of chat ids with subscriptions or scheduled searches
+        """
+        return cls.subscriptions.by_chat.keys() | cls.saved_searches.by_chat.keys()
 
     @classmethod
     def subscribe(cls, chat_id, res_id, menu_id):
-        with cls.data_lock.writer():
+        with cls.write_lock:
             DBManager.subscribe(chat_id, res_id, menu_id)
+            if cls.__db_subscription(chat_id, res_id, menu_id):
+                cls.subscriptions = cls.subscriptions.with_subscription(chat_id, res_id, menu_id)
+            cls.__load_schedule(chat_id)
 
     @classmethod
     def unsubscribe(cls, chat_id, res_id, menu_id):
-        with cls.data_lock.writer():
+        with cls.write_lock:
             DBManager.unsubscribe(chat_id, res_id, menu_id)
+            if not cls.__db_subscription(chat_id, res_id, menu_id):
+                cls.subscriptions = cls.subscriptions.without_subscription(chat_id, res_id, menu_id)
+
+    @classmethod
+    def add_search(cls, chat_id, text):
+        with cls.write_lock:
+            DBManager.add_search(chat_id, text)
+            if cls.__db_search(chat_id, text):
+                cls.saved_searches = cls.saved_searches.with_search(chat_id, text)
+            cls.__load_schedule(chat_id)
+
+    @classmethod
+    def remove_search(cls, chat_id, text):
+        with cls.write_lock:
+            DBManager.remove_search(chat_id, text)
+            if not cls.__db_search(chat_id, text):
+                cls.saved_searches = cls.saved_searches.without_search(chat_id, text)
+
+    @classmethod
+    def set_mute(cls, chat_id, mute):
+        """
+        Enable or disable the automatic messages of a chat (like when it blocks the bot)
+        :param chat_id: Id of the chat
+        :param mute: True to disable them
+        """
+        with cls.write_lock:
+            DBManager.set_mute(chat_id, mute)
+            cls.__load_schedule(chat_id, replace=True)
+
+    @classmethod
+    def __load_schedule(cls, chat_id, replace=False):
+        """
+        Publish the schedule of a chat stored at DB, if it was not known
+        :param replace: Publish it even if it was known (it has changed)
+        """
+        with cls.db_lock.reader():
+            if chat_id in cls.chats.keys() and (replace or chat_id not in cls.schedules.keys()):
+                schedules = dict(cls.schedules)
+                schedules[chat_id] = ChatSchedule.from_chat(cls.chats[chat_id])
+                cls.schedules = MappingProxyType(schedules)
+
+    @classmethod
+    def __db_search(cls, chat_id, text):
+        """
+        Check a scheduled search in the chats stored at DB
+        """
+        with cls.db_lock.reader():
+            return chat_id in cls.chats.keys() and any(search.text_to_search == text
+                                                       for search in cls.chats[chat_id].scheduled_searches)
+
+    @classmethod
+    def __db_subscription(cls, chat_id, res_id, menu_id):
+        """
+        Check a subscription in the chats stored at DB
+        """
+        with cls.db_lock.reader():
+            return chat_id in cls.chats.keys() and any(sub.res_id == res_id and sub.menu_id == menu_id
+                                                       for sub in cls.chats[chat_id].subscriptions)
 
     @classmethod
     def report_menu(cls, chat_id, res_id, menu_id, report_date=None, mode=ReportMode.MANUAL):
-        with cls.report_lock.writer():
-            DBManager.report_menu(chat_id, res_id, menu_id, report_date, mode)
+        DBManager.report_menu(chat_id, res_id, menu_id, report_date, mode)
 
     @classmethod
     def is_active(cls):
@@ -0,0 +1,127 @@
+import json
+import re
+
+from dagan.data import public_parameters
+
+
+class InfoParser:
+    """
+    Incremental parser of the UPV info (a JSON list of dictionaries). Items are decoded one by one while the text
+    arrives, so only the current item is kept in memory. Each piece of text is scanned once
+    """
+    decoder = json.JSONDecoder(strict=False)  # Fields can contain raw control chars (like tabs)
+    WHITESPACE = ' \t\r\n'
+    STRING_SPECIAL = re.compile(r'["\\]')  # Chars that can end a string
+    VALUE_SPECIAL = re.compile(r'["{}\[\]]')  # Chars that can end a value, out of strings
+
+    @classmethod
+    def iter_items(cls, chunks):
+        """
+        Decode the items of the info. Raw new lines of the text are removed before decoding it, as the UPV sends
+        them inside the fields
+
+        :param chunks: Text of the info, or an iterable of pieces of text
+        :return: Generator of dictionaries
+        """
+        if isinstance(chunks, str):
+            chunks = (chunks,)
+        chunks = cls.__remove_new_lines(chunks)
+        buffer = ''
+        pos = 0
+        started = False
+        item = None  # Pieces of the current item, while its end has not been received
+        state = None  # State of the scan of the current item
+        while True:
+            if item is None:
+                pos = cls.__skip(buffer, pos, ',' if started else '')
+                if pos < len(buffer):
+                    if not started:
+                        if buffer[pos] != '[':
+                            raise ValueError('UPV info is not a list')
+                        started = True
+                        pos += 1
+                        continue
+                    if buffer[pos] == ']':
+                        for _ in chunks:
+                            pass  # Read the response to the end, so its source can finish it
+                        return
+                    if buffer[pos] != '{':
+                        raise ValueError('UPV info item is not a dictionary')
+                    item, state = [], [0, False, False]
+            if item is not None and pos < len(buffer):
+                end = cls.__scan(buffer, pos, state)
+                item.append(buffer[pos:end])
+                pos = len(buffer) if end is None else end
+                if end is not None:
+                    yield cls.decoder.decode(''.join(item))
+                    item = None
+                    continue
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError('UPV info is incomplete')
+            buffer, pos = buffer[pos:] + chunk, 0
+
+    @classmethod
+    def __scan(cls, text, pos, state):
+        """
+        Look for the end of the current item in a piece of text
+
+        :param text: Piece of text
+        :param pos: Position of text where the scan continues
+        :param state: [depth of nested values, inside a string, after an escape char] of the item. It is updated
+        :return: Position of text after the end of the item, or None if the item continues after the text
+        """
+        depth, in_string, escaped = state
+        while True:
+            if escaped:
+                if pos >= len(text):
+                    break
+                pos += 1  # Escaped char
+                escaped = False
+                continue
+            match = (cls.STRING_SPECIAL if in_string else cls.VALUE_SPECIAL).search(text, pos)
+            if match is None:
+                break
+            pos = match.end()
+            char = match.group()
+            if char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = not in_string
+            elif char in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+        state[:] = depth, in_string, escaped
+        return None
+
+    @classmethod
+    def __skip(cls, buffer, pos, separators):
+        """
+        :return: Position of the first char of buffer (from pos) which is not whitespace or a separator
+        """
+        while pos < len(buffer) and (buffer[pos] in cls.WHITESPACE or buffer[pos] in separators):
+            pos += 1
+        return pos
+
+    @staticmethod
+    def __remove_new_lines(chunks):
+        """
+        Remove the raw new lines of the pieces of the info. New lines escaped in its strings are kept
+
+        :param chunks: Iterable of pieces of text
+        :return: Generator of pieces of text
+        """
+        carry = ''  # A final CR could be the start of a CRLF split between pieces
+        for chunk in chunks:
+            text = carry + chunk
+            carry = '\r' if text.endswith('\r') else ''
+            if carry:
+                text = text[:-1]
+            for org, dst in public_parameters.ALL_INFO_REPLACE:
+                text = text.replace(org, dst)
+            yield text
+        if carry:
+            yield carry
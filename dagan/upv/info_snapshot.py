@@ -0,0 +1,51 @@
+from types import MappingProxyType
+
+
+class InfoSnapshot:
+    """
+    Immutable snapshot of the published info of restaurants: the catalog and the menus of today, which always match
+    each other. Each change publishes a new snapshot with a single reference swap, so a reader that takes it once
+    never pairs a catalog with the menus of another one
+    """
+    __slots__ = ('restaurants', 'today_menus')
+
+    def __init__(self, restaurants=None, today_menus=None):
+        """
+        :param restaurants: Catalog {res_id: CatalogRestaurant}. None if it has not been read yet
+        :param today_menus: Menus of today {(res_id, menu_id): TodayMenu}, all of them in the catalog
+        """
+        self.restaurants = _read_only(restaurants) if restaurants is not None else None
+        self.today_menus = _read_only(today_menus or {})
+
+    def get_today_menu(self, res_id, menu_id):
+        """
+        :return: TodayMenu, or None if the menu is not available today
+        """
+        return self.today_menus.get((res_id, menu_id))
+
+    def has_menu(self, res_id, menu_id):
+        """
+        :return: True if the menu is in the catalog
+        """
+        res = self.restaurants.get(res_id) if self.restaurants is not None else None
+        return res is not None and menu_id in res.menus
+
+    def available_restaurants(self):
+        """
+        :return: List of CatalogRestaurant with menus today
+        """
+        available_ids = {res_id for res_id, menu_id in self.today_menus.keys()}
+        return [res for res_id, res in self.restaurants.items() if res_id in available_ids]
+
+    def available_menus(self):
+        """
+        :return: List of (res_id, menu_id) with info for today
+        """
+        return list(self.today_menus.keys())
+
+
+def _read_only(mapping):
+    """
+    :return: Read-only view of a dict. Views are kept, so an unchanged catalog keeps its identity
+    """
+    return mapping if isinstance(mapping, MappingProxyType) else MappingProxyType(mapping)
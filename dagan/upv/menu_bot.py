@@ -1,70 +1,169 @@
+from telegram import InlineKeyboardButton
+
+from dagan.bot_base.callback_data import CallbackData
 from dagan.bot_base.telegram_bot import TelegramBot
 from dagan.data import public_parameters, labels
 from dagan.upv.info_manager import InfoManager
 
 
 class MenuBot(TelegramBot):
-    def __init__(self, bot):
+    def __init__(self, bot, threads=True):
         super(MenuBot, self).__init__(bot)
-        InfoManager.initialize()
+        self.rendered_menus = {}  # Rendered info of today menus {(res_id, menu_id): (TodayMenu, text)}
+        self.rendered_catalog = None  # Catalog of restaurants used by the rendered menus
+        self.start_buttons = (None, None)  # Buttons of available restaurants (InfoSnapshot, buttons)
+        self.info_buttons = (None, None)  # Buttons of all restaurants (catalog, buttons)
+        InfoManager.add_refresh_listener(self.prerender)
+        InfoManager.initialize(refresher=threads)
 
     @staticmethod
     def reload():
         InfoManager.reload()
 
+    def prerender(self, diff):
+        """
+        Render the messages and keypads of new info of restaurants, before they are requested. Only new or changed
+        menus are rendered again, unless the catalog has changed
+
+        :param diff: MenuDiff of the load
+        """
+        snapshot = InfoManager.snapshot
+        if self.rendered_catalog is not snapshot.restaurants:
+            self.rendered_catalog = snapshot.restaurants
+            self.rendered_menus = {}  # Names of restaurants or menus could have changed
+            keys = snapshot.available_menus()
+        else:
+            rendered_menus = dict(self.rendered_menus)
+            for key in diff.removed:
+                rendered_menus.pop(key, None)  # Forget menus without info
+            self.rendered_menus = rendered_menus
+            keys = diff.updated().keys()
+        for res_id, menu_id in keys:
+            self.menu_today_to_show(res_id, menu_id, snapshot)
+        self.start_keypad(snapshot)
+        self.info_keypad(snapshot)
+
+    def start_keypad(self, snapshot=None):
+        """
+        Buttons of restaurants with menus available
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: List of buttons
+        """
+        snapshot = snapshot or InfoManager.snapshot
+        rendered_snapshot, buttons = self.start_buttons
+        if rendered_snapshot is not snapshot:
+            buttons = [InlineKeyboardButton(res.name, callback_data=self.generate_restaurant_cb(
+                public_parameters.CBDATA_REP_RES, res.res_id))
+                       for res in snapshot.available_restaurants()]
+            self.start_buttons = snapshot, buttons
+        return buttons
+
+    def info_keypad(self, snapshot=None):
+        """
+        Buttons of all restaurants
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: List of buttons
+        """
+        restaurants, buttons = self.info_buttons
+        if restaurants is not (snapshot or InfoManager.snapshot).restaurants:
+            restaurants = (snapshot or InfoManager.snapshot).restaurants
+            buttons = [InlineKeyboardButton(res.name, callback_data=self.generate_restaurant_cb(
+                public_parameters.CBDATA_INFO_RES, res_id))
+                       for res_id, res in restaurants.items()]
+            self.info_buttons = restaurants, buttons
+        return buttons
+
     @staticmethod
-    def generate_restaurant_cb(res_id):
+    def generate_restaurant_cb(action, res_id):
         """
         Generate callback data from a restaurant
 
+        :param action: CBDATA_* code of the action
         :param res_id: Restaurant id
         :return: Callback data
         """
-        return public_parameters.CBDATA_RESTAURANT + str(res_id)
+        return CallbackData.encode(action, res_id)
 
     @staticmethod
-    def generate_menu_cb(res_id, menu_id):
+    def generate_menu_cb(action, res_id, menu_id, origin=0):
         """
         Generate callback data from a menu
 
+        :param action: CBDATA_* code of the action
         :param res_id: Restaurant id
         :param menu_id: Menu id
+        :param origin: CBDATA_* code of the message with the button
         :return: Callback data
         """
-        return public_parameters.CBDATA_MENU + str(menu_id) + public_parameters.CBDATA_RESTAURANT + str(res_id)
+        return CallbackData.encode(action, res_id, menu_id, origin)
 
     @staticmethod
-    def menu_name_to_show(res_id, menu_id):
-        res = InfoManager.restaurants[res_id]
+    def menu_name_to_show(res_id, menu_id, snapshot=None):
+        res = (snapshot or InfoManager.snapshot).restaurants[res_id]
         menu = res.menus[menu_id]
 
         return public_parameters.BOLD_START + res.name + public_parameters.RESTAURANT_MENU_SEPARATOR + \
                menu.name + public_parameters.BOLD_END + public_parameters.NEW_LINE
 
     @staticmethod
-    def menu_today_to_show(res_id, menu_id):
-        res = InfoManager.restaurants[res_id]
+    def menu_history_to_show(res_id, menu_id, entries, snapshot=None):
+        """
+        Texts with the past days of a menu, split in messages not longer than the limit of Telegram
+
+        :param res_id: Restaurant id
+        :param menu_id: Menu id
+        :param entries: List of HistoryEntry (sorted by day)
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: List of texts to send, empty if there are no entries of this menu
+        """
+        days = []
+        for entry in entries:
+            if entry.res_id == res_id and entry.menu_id == menu_id:
+                parts = [public_parameters.NEW_LINE, public_parameters.BOLD_START,
+                         entry.date.strftime(public_parameters.HISTORY_DATE_FORMAT), public_parameters.BOLD_END,
+                         public_parameters.NEW_LINE]
+                parts += [value + public_parameters.NEW_LINE for value in (entry.first, entry.second) if value]
+                days.append(''.join(parts))
+        return [text.strip() for text in MenuBot.split_msg(MenuBot.menu_name_to_show(res_id, menu_id, snapshot),
+                                                           days)]
+
+    def menu_today_to_show(self, res_id, menu_id, snapshot=None):
+        """
+        Text of a today menu. It is rendered once for each info of the menu
+
+        :param res_id: Restaurant id
+        :param menu_id: Menu id
+        :param snapshot: InfoSnapshot taken by the caller. None for the current one
+        :return: Text to send
+        """
+        snapshot = snapshot or InfoManager.snapshot
+        res = snapshot.restaurants[res_id]
         menu = res.menus[menu_id]
+        today_menu = snapshot.get_today_menu(res_id, menu_id)
+        rendered_menu, text = self.rendered_menus.get((res_id, menu_id)) or (None, None)
+        if rendered_menu is not today_menu:
+            text = self.render_menu(res, menu, today_menu)
+            self.rendered_menus[(res_id, menu_id)] = today_menu, text
+        return text
+
+    @staticmethod
+    def render_menu(res, menu, today_menu):
+        """
+        Build the text of a today menu
 
-        text = public_parameters.BOLD_START + res.name + public_parameters.RESTAURANT_MENU_SEPARATOR
-        text += menu.name + public_parameters.BOLD_END + public_parameters.NEW_LINE
-        if menu.today_menu.price:
-            text += labels.PRICE + menu.today_menu.price
-        text += public_parameters.NEW_LINE
-        if menu.today_menu.first:
-            text += public_parameters.NEW_LINE + public_parameters.BOLD_START + labels.FIRST + \
-                    public_parameters.BOLD_END + public_parameters.NEW_LINE
-            text += menu.today_menu.first + public_parameters.NEW_LINE
-        if menu.today_menu.second:
-            text += public_parameters.NEW_LINE + public_parameters.BOLD_START + labels.SECOND + \
-                    public_parameters.BOLD_END + public_parameters.NEW_LINE
-            text += menu.today_menu.second + public_parameters.NEW_LINE
-        if menu.today_menu.others:
-            text += public_parameters.NEW_LINE + public_parameters.BOLD_START + \
-                    labels.OTHERS + public_parameters.BOLD_END + public_parameters.NEW_LINE
-            text += menu.today_menu.others + public_parameters.NEW_LINE
-        if menu.today_menu.observations:
-            text += public_parameters.NEW_LINE + public_parameters.BOLD_START + \
-                    labels.OBSERVATIONS + public_parameters.BOLD_END + public_parameters.NEW_LINE
-            text += menu.today_menu.observations + public_parameters.NEW_LINE
-        return text.strip()
+        :param res: Restaurant
+        :param menu: Menu
+        :param today_menu: Today info of the menu
+        :return: Text to send
+        """
+        parts = [public_parameters.BOLD_START, res.name, public_parameters.RESTAURANT_MENU_SEPARATOR, menu.name,
+                 public_parameters.BOLD_END, public_parameters.NEW_LINE]
+        if today_menu.price:
+            parts += [labels.PRICE, today_menu.price]
+        parts.append(public_parameters.NEW_LINE)
+        for label, value in ((labels.FIRST, today_menu.first), (labels.SECOND, today_menu.second),
+                             (labels.OTHERS, today_menu.others), (labels.OBSERVATIONS, today_menu.observations)):
+            if value:
+                parts += [public_parameters.NEW_LINE, public_parameters.BOLD_START, label, public_parameters.BOLD_END,
+                          public_parameters.NEW_LINE, value, public_parameters.NEW_LINE]
+        return ''.join(parts).strip()
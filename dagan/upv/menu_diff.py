@@ -0,0 +1,57 @@
+class MenuDiff:
+    """
+    Changes of the menus of today between two loads of the UPV info
+    """
+    __slots__ = ('added', 'changed', 'removed')
+
+    def __init__(self, added=None, changed=None, removed=None):
+        """
+        :param added: Menus without info in the previous load {(res_id, menu_id): TodayMenu}
+        :param changed: Menus whose info differs from the previous load {(res_id, menu_id): TodayMenu}
+        :param removed: Set of (res_id, menu_id) without info in the new load
+        """
+        self.added = added or {}
+        self.changed = changed or {}
+        self.removed = removed or set()
+
+    @classmethod
+    def between(cls, previous, current):
+        """
+        :param previous: Menus of the previous load {(res_id, menu_id): TodayMenu}
+        :param current: Menus of the new load {(res_id, menu_id): TodayMenu}
+        :return: MenuDiff from previous to current. Menus with the same info are not changed
+        """
+        diff = cls(removed=previous.keys() - current.keys())
+        for key, tm in current.items():
+            previous_tm = previous.get(key)
+            if previous_tm is None:
+                diff.added[key] = tm
+            elif previous_tm != tm:
+                diff.changed[key] = tm
+        return diff
+
+    def updated(self):
+        """
+        :return: Added and changed menus {(res_id, menu_id): TodayMenu}
+        """
+        updated = dict(self.added)
+        updated.update(self.changed)
+        return updated
+
+    def apply(self, menus):
+        """
+        :param menus: Menus of the previous load {(res_id, menu_id): TodayMenu}. It is not modified
+        :return: New dict with the menus of the new load. Menus with the same info keep their previous TodayMenu
+        """
+        menus = dict(menus)
+        menus.update(self.updated())
+        for key in self.removed:
+            del menus[key]
+        return menus
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return 'MenuDiff(added=%s, changed=%s, removed=%s)' % (sorted(self.added), sorted(self.changed),
+                                                              sorted(self.removed))
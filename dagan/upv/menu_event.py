@@ -0,0 +1,15 @@
+class MenuEvent:
+    """
+    Change in the availability of a menu, detected when the UPV info is reloaded
+    """
+    AVAILABLE = 'available'  # Menu without info in the previous load
+    CHANGED = 'changed'  # Menu whose info differs from the previous load
+    REFRESHED = 'refreshed'  # A load has published all its events (without menu)
+
+    def __init__(self, kind, res_id, menu_id):
+        self.kind = kind
+        self.res_id = res_id
+        self.menu_id = menu_id
+
+    def __repr__(self):
+        return 'MenuEvent(%s, %s, %s)' % (self.kind, self.res_id, self.menu_id)
@@ -0,0 +1,34 @@
+from dagan.upv.chat_index import ChatIndex
+
+
+class SavedSearches(ChatIndex):
+    """
+    Immutable snapshot of the scheduled searches of all chats: an index between chats and searched texts
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_chats(cls, chats):
+        """
+        Build the snapshot from the chats read at DB
+        :param chats: Dict {chat_id: Chat}
+        :return: New snapshot
+        """
+        return cls.from_pairs((search.chat_id, search.text_to_search)
+                              for chat in chats.values() for search in chat.scheduled_searches)
+
+    def check(self, chat_id, text):
+        return self.has_pair(chat_id, text)
+
+    def of_text(self, text):
+        """
+        :param text: Text to search
+        :return: Frozenset of chat ids with this search
+        """
+        return self.of_key(text)
+
+    def with_search(self, chat_id, text):
+        return self.with_pair(chat_id, text)
+
+    def without_search(self, chat_id, text):
+        return self.without_pair(chat_id, text)
@@ -0,0 +1,85 @@
+import bisect
+import re
+import threading
+
+import unidecode
+
+
+class SearchIndex:
+    """
+    Inverted index of the words of today menus. It is updated incrementally: only the menus whose TodayMenu has
+    been replaced are indexed again
+    """
+    FIELDS = ('first', 'second', 'others', 'observations')
+    WORD = re.compile('[a-z0-9]+')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.menus = {}  # Indexed menus {(res_id, menu_id): (TodayMenu, frozenset of words)}
+        self.postings = {}  # {word: set of (res_id, menu_id)}
+        self.words = []  # Sorted list of indexed words, to search them by prefix
+
+    @staticmethod
+    def normalize(text):
+        """
+        Fold a text like Menu.generate_codename (lower case, without accents) and split it in words
+        :param text: Text
+        :return: List of words
+        """
+        return SearchIndex.WORD.findall(unidecode.unidecode(text.lower()))
+
+    def update(self, diff):
+        """
+        Index the changes of a new load
+
+        :param diff: MenuDiff of the load
+        :return: Set of (res_id, menu_id) indexed again (new or changed menus)
+        """
+        updated = diff.updated()
+        with self.lock:
+            for key in diff.removed | updated.keys():
+                if key in self.menus:
+                    self.__remove(key)
+            for key, tm in updated.items():
+                self.__add(key, tm)
+        return set(updated.keys())
+
+    def search(self, text):
+        """
+        Find the menus with all words of a text. A word matches any indexed word starting with it
+
+        :param text: Text to search
+        :return: Sorted list of (res_id, menu_id)
+        """
+        words = self.normalize(text)
+        if not words:
+            return []
+        with self.lock:
+            found = None
+            for word in sorted(words, key=len, reverse=True):  # Longer words match less menus
+                keys = set()
+                pos = bisect.bisect_left(self.words, word)
+                while pos < len(self.words) and self.words[pos].startswith(word):
+                    keys.update(self.postings[self.words[pos]])
+                    pos += 1
+                found = keys if found is None else found & keys
+                if not found:
+                    return []
+            return sorted(found)
+
+    def __add(self, key, tm):
+        words = frozenset(word for field in self.FIELDS for word in self.normalize(getattr(tm, field)))
+        self.menus[key] = tm, words
+        for word in words:
+            if word not in self.postings:
+                self.postings[word] = set()
+                bisect.insort(self.words, word)
+            self.postings[word].add(key)
+
+    def __remove(self, key):
+        tm, words = self.menus.pop(key)
+        for word in words:
+            self.postings[word].discard(key)
+            if not self.postings[word]:
+                del self.postings[word]
+                del self.words[bisect.bisect_left(self.words, word)]
@@ -0,0 +1,35 @@
+from dagan.upv.chat_index import ChatIndex
+
+
+class Subscriptions(ChatIndex):
+    """
+    Immutable snapshot of the subscriptions of all chats: an index between chats and (res_id, menu_id)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_chats(cls, chats):
+        """
+        Build the snapshot from the chats read at DB
+        :param chats: Dict {chat_id: Chat}
+        :return: New snapshot
+        """
+        return cls.from_pairs((sub.chat_id, (sub.res_id, sub.menu_id))
+                              for chat in chats.values() for sub in chat.subscriptions)
+
+    def check(self, chat_id, res_id, menu_id):
+        return self.has_pair(chat_id, (res_id, menu_id))
+
+    def of_menu(self, res_id, menu_id):
+        """
+        :param res_id: Id of the restaurant
+        :param menu_id: Id of the menu
+        :return: Frozenset of chat ids subscribed to the menu
+        """
+        return self.of_key((res_id, menu_id))
+
+    def with_subscription(self, chat_id, res_id, menu_id):
+        return self.with_pair(chat_id, (res_id, menu_id))
+
+    def without_subscription(self, chat_id, res_id, menu_id):
+        return self.without_pair(chat_id, (res_id, menu_id))
@@ -28,6 +28,22 @@ class TodayMenu:
         self.observations = self.clean_text(my_dict[self.OBSERVATIONS])
         self.price = self.clean_price(self.clean_text(my_dict[self.PRICE]))
 
+    def __eq__(self, other):
+        return isinstance(other, TodayMenu) and self.content() == other.content()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.content())
+
+    def content(self):
+        """
+        Return the information shown to the users
+        :return: Tuple with all fields of the menu
+        """
+        return self.res_id, self.codename, self.first, self.second, self.others, self.observations, self.price
+
     @staticmethod
     def clean_text(text):
         """
@@ -52,9 +52,10 @@ class Token:
             file.write(json.dumps({Token.ACCESS_TOKEN: self.access_token, Token.TOKEN_TYPE: self.token_type,
                                    Token.EXPIRATION_TIME: self.expiration_time}))
 
-    def is_active(self):
+    def is_active(self, margin=0):
         """
         Checks if there is a token and it has not expired
+        :param margin: Seconds that the token must still be valid
         :return: True if the instance references a valid token
         """
-        return self.access_token is not None and time.time() < self.expiration_time
+        return self.access_token is not None and time.time() + margin < self.expiration_time
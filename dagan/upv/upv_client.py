@@ -0,0 +1,125 @@
+import codecs
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from dagan.data import public_parameters
+from dagan.upv.data import upv_parameters
+from dagan.utils.metrics import Metrics
+
+
+class UpvClient:
+    """
+    Client of the UPV API. It keeps the connections alive in a pool, and uses conditional requests when the API
+    returns validators (ETag / Last-Modified)
+    """
+    TOKEN = 'token'
+    INFO = 'info'
+    request_seconds = Metrics.histogram('dagan_upv_request_seconds', 'Duration of the requests to the UPV API',
+                                        ('endpoint',))
+    requests_total = Metrics.counter('dagan_upv_requests_total', 'Requests to the UPV API', ('endpoint', 'result'))
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=public_parameters.UPV_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.validators = {}  # Validators of the last response of each source {(campus, bar): (date, etag, last_modified)}
+
+    def request_token(self):
+        """
+        Request a new token
+        :return: Text of the response
+        """
+        return self.__request(self.TOKEN, 'POST', upv_parameters.UPV_TOKEN_URL,
+                              (public_parameters.UPV_CONNECT_TIMEOUT, upv_parameters.UPV_TOKEN_TIMEOUT),
+                              headers=upv_parameters.UPV_TOKEN_HEADERS, data=upv_parameters.UPV_TOKEN_TYPE,
+                              auth=(upv_parameters.UPV_USER, upv_parameters.UPV_PSW)).text
+
+    def request_info(self, token, date, campus=upv_parameters.UPV_INFO_CAMPUS_DEFAULT,
+                     bar=upv_parameters.UPV_INFO_BAR_DEFAULT):
+        """
+        Request the menus of a day. The body is streamed: it is read while the returned generator is consumed
+
+        :param token: Valid Token
+        :param date: Day in UPV's API format
+        :param campus: Campus code
+        :param bar: Bar code
+        :return: Generator of pieces of text of the response, or None if it has not been modified since the last one
+        """
+        params = {upv_parameters.UPV_INFO_DATE_PARAM: date, upv_parameters.UPV_INFO_CAMPUS_PARAM: campus,
+                  upv_parameters.UPV_INFO_BAR_PARAM: bar}
+        headers = {upv_parameters.UPV_INFO_HEADER_AUTH: token.token_type + ' ' + token.access_token + ':' +
+                                                        upv_parameters.UPV_UUID}
+        last_date, etag, last_modified = self.validators.get((campus, bar), (None, None, None))
+        if last_date == date:  # Validators of other days are useless
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self.__request(self.INFO, 'GET', upv_parameters.UPV_INFO_URL,
+                                  (public_parameters.UPV_CONNECT_TIMEOUT, upv_parameters.UPV_INFO_TIMEOUT),
+                                  params=params, headers=headers, stream=True)
+        if response.status_code == requests.codes.not_modified:
+            response.close()
+            return None
+        self.validators.pop((campus, bar), None)
+        return self.__iter_text(response, (campus, bar), date)
+
+    def forget_validators(self, campus, bar):
+        """
+        Make the next request of a source unconditional. It must be called when its last info is discarded, as a
+        response not modified would leave the source without info
+
+        :param campus: Campus code
+        :param bar: Bar code
+        """
+        self.validators.pop((campus, bar), None)
+
+    def __iter_text(self, response, source, date):
+        """
+        Read the body of a response in pieces. The validators of the response are saved once it is fully read
+
+        :param response: Streamed response
+        :param source: (campus, bar)
+        :param date: Day of the menus
+        :return: Generator of pieces of text
+        """
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        try:
+            for chunk in response.iter_content(public_parameters.UPV_INFO_CHUNK_SIZE):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b'', final=True)
+        finally:
+            response.close()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.validators[source] = (date, etag, last_modified)
+
+    def __request(self, endpoint, method, url, timeout, **kwargs):
+        """
+        Send a request with the session and record its latency
+
+        :param endpoint: Name of the endpoint (label of the metrics)
+        :param method: HTTP method
+        :param url: Url
+        :param timeout: (connect, read) timeouts in seconds
+        :return: Response
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            self.request_seconds.labels(endpoint).observe(time.perf_counter() - start)
+            self.requests_total.labels(endpoint, 'error').inc()
+            raise
+        seconds = time.perf_counter() - start
+        self.request_seconds.labels(endpoint).observe(seconds)
+        self.requests_total.labels(endpoint, 'not_modified' if response.status_code == requests.codes.not_modified
+                                   else 'ok').inc()
+        logging.getLogger(__name__).debug('UPV %s request: %.3fs', endpoint, seconds)
+        return response
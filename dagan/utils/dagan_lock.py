@@ -0,0 +1,44 @@
+import threading
+
+from dagan.data import public_parameters
+from dagan.utils.lock_monitor import LockMonitor, EXCLUSIVE
+
+
+class DaganLock:
+    """
+    Mutex with the statistics of LockMonitor. Use it like threading.Lock
+    """
+
+    def __init__(self, name='lock', hold_warning=public_parameters.LOCK_HOLD_WARNING_SECONDS):
+        """
+        :param name: Name of the lock in the metrics and the log
+        :param hold_warning: Holds longer than these seconds are logged. None to disable it
+        """
+        self.lock = threading.Lock()
+        self.monitor = LockMonitor(name, hold_warning)
+        self.token = None  # Token of the current holder
+
+    def acquire(self):
+        start = self.monitor.waiting()
+        self.lock.acquire()
+        try:
+            self.token = self.monitor.acquired(EXCLUSIVE, start)
+        except BaseException:
+            self.lock.release()
+            raise
+        return True
+
+    def release(self):
+        token = self.token
+        self.token = None
+        self.lock.release()
+        self.monitor.released(token)
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
@@ -1,17 +1,52 @@
 from contextlib import contextmanager
 
+from dagan.data import public_parameters
+from dagan.utils.lock_monitor import LockMonitor, READER, WRITER
 from dagan.utils.rw_lock import RWLock
 
 
 class DaganRWLock(RWLock):
+    def __init__(self, name='lock', hold_warning=public_parameters.LOCK_HOLD_WARNING_SECONDS):
+        """
+        :param name: Name of the lock in the metrics and the log
+        :param hold_warning: Holds longer than these seconds are logged. None to disable it
+        """
+        super(DaganRWLock, self).__init__()
+        self.monitor = LockMonitor(name, hold_warning)
+
+    @property
+    def readers(self):
+        """
+        :return: Number of current readers
+        """
+        return self.monitor.count(READER)
+
     @contextmanager
     def reader(self):
+        start = self.monitor.waiting()
         self.reader_acquire()
-        yield
-        self.reader_release()
+        try:
+            token = self.monitor.acquired(READER, start)
+        except BaseException:
+            self.reader_release()
+            raise
+        try:
+            yield
+        finally:
+            self.reader_release()
+            self.monitor.released(token)
 
     @contextmanager
     def writer(self):
+        start = self.monitor.waiting()
         self.writer_acquire()
-        yield
-        self.writer_release()
+        try:
+            token = self.monitor.acquired(WRITER, start)
+        except BaseException:
+            self.writer_release()
+            raise
+        try:
+            yield
+        finally:
+            self.writer_release()
+            self.monitor.released(token)
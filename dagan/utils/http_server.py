@@ -0,0 +1,56 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class HttpServer:
+    """
+    Local HTTP server running in a daemon thread, with a thread for each request.
+    Its handler (a subclass of HttpHandler) reaches this instance as self.server.owner
+    """
+
+    def __init__(self, listen, port, handler_class):
+        """
+        :param listen: Address to listen
+        :param port: Port to listen (0 for any free port)
+        :param handler_class: Class of the request handler
+        """
+        self.httpd = _ThreadingHTTPServer((listen, port), handler_class)
+        self.httpd.owner = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HttpHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of an HttpServer. Requests are logged at debug level
+    """
+
+    def send_empty(self, code):
+        """
+        Send a response without body
+        :param code: HTTP status code
+        """
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, msg_format, *args):
+        logging.getLogger(type(self).__module__).debug(msg_format, *args)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    owner = None
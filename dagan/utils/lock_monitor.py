@@ -0,0 +1,146 @@
+import contextlib
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+
+from dagan.data import public_parameters
+from dagan.utils.metrics import Metrics
+
+READER = 'reader'
+WRITER = 'writer'
+EXCLUSIVE = 'exclusive'
+
+_INTERNAL_PATHS = (os.path.dirname(os.path.abspath(__file__)), os.path.abspath(contextlib.__file__))
+
+
+class LockMonitor:
+    """
+    Statistics of a lock: wait and hold times, the current holders and the call site of each one. Long holds and
+    long waits are logged, with the readers that overtook a waiting writer
+    """
+    wait_seconds = Metrics.histogram('dagan_lock_wait_seconds', 'Seconds waiting to acquire a lock', ('lock', 'mode'))
+    hold_seconds = Metrics.histogram('dagan_lock_hold_seconds', 'Seconds holding a lock', ('lock', 'mode'))
+    slow_holds = Metrics.counter('dagan_lock_slow_holds_total', 'Holds of a lock longer than its warning threshold',
+                                 ('lock', 'mode'))
+    slow_waits = Metrics.counter('dagan_lock_slow_waits_total', 'Waits for a lock longer than its warning threshold',
+                                 ('lock', 'mode'))
+    monitors = weakref.WeakSet()  # All monitors, for the gauge of holders
+
+    def __init__(self, name, hold_warning=public_parameters.LOCK_HOLD_WARNING_SECONDS,
+                 wait_warning=public_parameters.LOCK_WAIT_WARNING_SECONDS):
+        """
+        :param name: Name of the lock in the metrics and the log
+        :param hold_warning: Holds longer than these seconds are logged. None to disable it
+        :param wait_warning: Waits longer than these seconds are logged. None to disable it
+        """
+        self.name = name
+        self.hold_warning = hold_warning
+        self.wait_warning = wait_warning
+        self.lock = threading.Lock()
+        self.holders = {}  # {token: (mode, call site, thread name, acquire time)}
+        self.acquisitions = {READER: 0, WRITER: 0, EXCLUSIVE: 0}
+        self.tokens = itertools.count()
+        self.monitors.add(self)
+
+    def waiting(self):
+        """
+        Call it before waiting for the lock
+
+        :return: Start of the wait, for acquired()
+        """
+        with self.lock:
+            return time.perf_counter(), self.acquisitions[READER]
+
+    def acquired(self, mode, start):
+        """
+        Call it just after acquiring the lock
+
+        :param mode: READER, WRITER or EXCLUSIVE
+        :param start: Value returned by waiting()
+        :return: Token of the hold, for released()
+        """
+        now = time.perf_counter()
+        started, readers = start
+        call_site = self.call_site()
+        with self.lock:
+            token = next(self.tokens)
+            self.holders[token] = (mode, call_site, threading.current_thread().name, now)
+            self.acquisitions[mode] += 1
+            overtaking = self.acquisitions[READER] - readers
+        wait = now - started
+        self.wait_seconds.labels(self.name, mode).observe(wait)
+        if self.wait_warning is not None and wait > self.wait_warning:
+            self.slow_waits.labels(self.name, mode).inc()
+            if mode == WRITER:
+                logging.getLogger(__name__).warning('%s lock: writer waited %.3f s at %s while %d readers acquired it',
+                                                    self.name, wait, call_site, overtaking)
+            else:
+                logging.getLogger(__name__).warning('%s lock: %s waited %.3f s at %s', self.name, mode, wait,
+                                                    call_site)
+        return token
+
+    def released(self, token):
+        """
+        Call it just after releasing the lock
+
+        :param token: Value returned by acquired()
+        """
+        with self.lock:
+            mode, call_site, thread, acquired = self.holders.pop(token)
+        hold = time.perf_counter() - acquired
+        self.hold_seconds.labels(self.name, mode).observe(hold)
+        if self.hold_warning is not None and hold > self.hold_warning:
+            self.slow_holds.labels(self.name, mode).inc()
+            logging.getLogger(__name__).warning('%s lock: held %.3f s as %s by %s at %s', self.name, hold, mode, thread,
+                                                call_site)
+
+    def count(self, mode):
+        """
+        :return: Number of current holders of the lock in a mode
+        """
+        with self.lock:
+            return sum(1 for holder in self.holders.values() if holder[0] == mode)
+
+    def describe(self):
+        """
+        :return: List of texts of the current holders, like 'writer by Thread-1 for 1.500 s at db_manager.py:120 ...'
+        """
+        now = time.perf_counter()
+        with self.lock:
+            holders = list(self.holders.values())
+        return ['%s by %s for %.3f s at %s' % (mode, thread, now - acquired, call_site)
+                for mode, call_site, thread, acquired in holders]
+
+    @staticmethod
+    def call_site():
+        """
+        :return: Text of the innermost LOCK_CALL_SITE_DEPTH frames outside the locks and metrics, like
+        'db_manager.py:120 subscribe < info_manager.py:418 subscribe < dagan_bot.py:254 subscription_btn'
+        """
+        frames = []
+        frame = sys._getframe(1)
+        while frame is not None and len(frames) < public_parameters.LOCK_CALL_SITE_DEPTH:
+            path = frame.f_code.co_filename
+            if not path.startswith(_INTERNAL_PATHS):
+                frames.append('%s:%d %s' % (os.path.basename(path), frame.f_lineno, frame.f_code.co_name))
+            frame = frame.f_back
+        return ' < '.join(frames) or 'unknown'
+
+    @classmethod
+    def holders_by_lock(cls):
+        """
+        :return: Current holders of all locks {(lock, mode): holders}
+        """
+        holders = {}
+        for monitor in list(cls.monitors):
+            for mode in (READER, WRITER, EXCLUSIVE):
+                if monitor.acquisitions[mode]:
+                    holders[(monitor.name, mode)] = monitor.count(mode)
+        return holders
+
+
+Metrics.gauge('dagan_lock_holders', 'Current holders of a lock', LockMonitor.holders_by_lock, ('lock', 'mode'))
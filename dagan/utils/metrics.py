@@ -0,0 +1,279 @@
+import abc
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from dagan.data import public_parameters
+
+
+class Metric(metaclass=abc.ABCMeta):
+    """
+    Metric rendered in Prometheus text format
+    """
+    kind = None
+
+    def __init__(self, name, description, label_names=()):
+        """
+        :param name: Name of the metric
+        :param description: Help text of the metric
+        :param label_names: Names of its labels
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+    @abc.abstractmethod
+    def render(self):
+        """
+        :return: List of lines of the metric in Prometheus text format
+        """
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.description), '# TYPE %s %s' % (self.name, self.kind)]
+
+    def line(self, suffix, labels, sample):
+        """
+        :return: Line of a sample in Prometheus text format
+        """
+        text = ','.join('%s="%s"' % (key, str(label).replace('"', '\\"')) for key, label in labels)
+        return '%s%s%s %s' % (self.name, suffix, '{%s}' % text if text else '', _format(sample))
+
+
+class ObservedMetric(Metric):
+    """
+    Metric updated by the code, with a value for each combination of its labels
+    """
+
+    def __init__(self, name, description, label_names=()):
+        super(ObservedMetric, self).__init__(name, description, label_names)
+        self.values = {}  # {label values: value}
+        self.lock = threading.Lock()
+
+    def labels(self, *label_values):
+        """
+        :param label_values: Values of the labels, in the order of label_names
+        :return: Value of the metric for those labels
+        """
+        value = self.values.get(label_values)
+        if value is None:
+            with self.lock:
+                value = self.values.setdefault(label_values, self.new_value())
+        return value
+
+    @abc.abstractmethod
+    def new_value(self):
+        """
+        :return: New value of the metric for a combination of its labels
+        """
+
+    def render(self):
+        lines = self.header()
+        for label_values, value in sorted(self.values.items()):
+            for suffix, extra_labels, sample in value.samples():
+                lines.append(self.line(suffix, list(zip(self.label_names, label_values)) + extra_labels, sample))
+        return lines
+
+
+class Counter(ObservedMetric):
+    kind = 'counter'
+
+    def new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Histogram(ObservedMetric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=public_parameters.METRICS_BUCKETS):
+        """
+        :param buckets: Sorted upper bounds of the buckets
+        """
+        super(Histogram, self).__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+
+    def new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, amount):
+        self.labels().observe(amount)
+
+    def time(self, *label_values):
+        """
+        :return: Context manager that observes the seconds spent in it
+        """
+        return self.labels(*label_values).time()
+
+    def timed(self, *label_values):
+        """
+        :return: Decorator that observes the seconds spent by each call of a function
+        """
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.labels(*label_values).time():
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+class Gauge(Metric):
+    """
+    Metric read from a function when it is rendered (like the size of a queue)
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, description, function, label_names=()):
+        """
+        :param function: Function without arguments that returns the current value. With label_names, it returns a
+        dict {label values: value}
+        """
+        super(Gauge, self).__init__(name, description, label_names)
+        self.function = function
+
+    def render(self):
+        lines = self.header()
+        try:
+            values = self.function()
+        except Exception as err:
+            logging.getLogger(__name__).warning('Gauge %s not available: %s', self.name, err)
+            return lines
+        if not self.label_names:
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            lines.append(self.line('', list(zip(self.label_names, label_values)), value))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', [], self.value)]
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Observations of each bucket (not cumulative). Last one is +Inf
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, amount):
+        index = bisect.bisect_left(self.buckets, amount)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += amount
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        with self.lock:
+            counts = self.counts[:]
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', [('le', _format(bound))], cumulative))
+        samples.append(('_sum', [], total))
+        samples.append(('_count', [], cumulative))
+        return samples
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(round(value, 9))
+    return str(value)
+
+
+class Metrics:
+    """
+    Registry of the metrics of the bot. They are served in Prometheus text format (MetricsServer) or dumped to
+    the log
+    """
+    metrics = {}  # {name: Metric}
+    lock = threading.Lock()
+    dumper = None
+
+    @classmethod
+    def counter(cls, name, description, label_names=()):
+        return cls.__register(Counter(name, description, label_names))
+
+    @classmethod
+    def histogram(cls, name, description, label_names=(), buckets=public_parameters.METRICS_BUCKETS):
+        return cls.__register(Histogram(name, description, label_names, buckets))
+
+    @classmethod
+    def gauge(cls, name, description, function, label_names=()):
+        """
+        Register a gauge. A new gauge with the same name replaces the previous one (like a new queue instance)
+        """
+        gauge = Gauge(name, description, function, label_names)
+        with cls.lock:
+            cls.metrics[name] = gauge
+        return gauge
+
+    @classmethod
+    def __register(cls, metric):
+        """
+        :return: The metric registered with the same name, or the new one
+        """
+        with cls.lock:
+            return cls.metrics.setdefault(metric.name, metric)
+
+    @classmethod
+    def render(cls):
+        """
+        :return: Text of all metrics in Prometheus text format
+        """
+        with cls.lock:
+            metrics = sorted(cls.metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def start_log_dump(cls, seconds):
+        """
+        Start a thread that writes all metrics to the log periodically
+        :param seconds: Seconds between two dumps
+        """
+        cls.dumper = threading.Thread(target=cls.__dump_task, args=(seconds,), daemon=True)
+        cls.dumper.start()
+
+    @classmethod
+    def __dump_task(cls, seconds):
+        while True:
+            time.sleep(seconds)
+            try:
+                logging.getLogger(__name__).info('Metrics:\n%s', cls.render())
+            except Exception as err:
+                logging.getLogger(__name__).exception(err)
@@ -0,0 +1,33 @@
+from dagan.data import public_parameters
+from dagan.utils.http_server import HttpServer, HttpHandler
+from dagan.utils.metrics import Metrics
+
+
+class MetricsServer(HttpServer):
+    """
+    HTTP server that serves the metrics of the bot in Prometheus text format
+    """
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, listen=public_parameters.METRICS_LISTEN, port=public_parameters.METRICS_PORT,
+                 path=public_parameters.METRICS_PATH):
+        """
+        :param listen: Address to listen
+        :param port: Port to listen (0 for any free port)
+        :param path: Path of the metrics
+        """
+        super(MetricsServer, self).__init__(listen, port, _MetricsHandler)
+        self.path = path
+
+
+class _MetricsHandler(HttpHandler):
+    def do_GET(self):
+        if self.path != self.server.owner.path:
+            self.send_empty(404)
+            return
+        body = Metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', MetricsServer.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
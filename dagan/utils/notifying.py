@@ -0,0 +1,46 @@
+import queue
+import threading
+
+
+class NotifyingEvent(threading.Event):
+    """
+    threading.Event that also calls its listeners each time it is set, so an event loop can be woken up without
+    polling it (see AsyncRunner)
+    """
+
+    def __init__(self):
+        super(NotifyingEvent, self).__init__()
+        self.listeners = []  # Functions called (without arguments) after each set()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def set(self):
+        super(NotifyingEvent, self).set()
+        for listener in list(self.listeners):
+            listener()
+
+
+class NotifyingQueue(queue.Queue):
+    """
+    queue.Queue that also calls its listeners each time an item is put, so an event loop can be woken up without
+    polling it (see AsyncRunner)
+    """
+
+    def __init__(self, maxsize=0):
+        super(NotifyingQueue, self).__init__(maxsize)
+        self.listeners = []  # Functions called (without arguments) after each put()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def put(self, item, block=True, timeout=None):
+        super(NotifyingQueue, self).put(item, block, timeout)
+        for listener in list(self.listeners):
+            listener()
@@ -0,0 +1,130 @@
+import statistics
+import time
+import unittest
+
+from dagan.bot_base.callback_data import CallbackData
+from dagan.data import public_parameters
+from dagan.database.entities import ReportMode
+from dagan.upv.info_manager import InfoManager
+from dagan_tests.resources_test import bench_output
+from dagan_tests.resources_test.fake_telegram import make_update
+from dagan_tests.resources_test.offline_bot import OfflineBot
+
+RESTAURANTS = 20
+MENUS = 4
+CHATS = 2000  # Subscribed chats (ids 1 to CHATS)
+SUBSCRIPTIONS = 3  # Subscriptions of each chat
+RELOADS = 50
+BUTTONS = 2000
+BUTTON_CHATS = 200  # Chats pressing buttons (ids after the subscribed ones)
+DB_WRITES = 500
+
+
+class Benchmark(unittest.TestCase):
+    """
+    Offline benchmark of the hot paths of the bot (see OfflineBot).
+    Results are appended to bench_output.txt and compared with the last ones of a different commit
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.offline = OfflineBot(RESTAURANTS, MENUS, CHATS, SUBSCRIPTIONS)
+        cls.bot = cls.offline.bot
+        cls.dagan = cls.offline.dagan
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.offline.stop()
+
+    def test_button(self):
+        buttons = [CallbackData.encode(public_parameters.CBDATA_START_CMD)]
+        for res_id in range(RESTAURANTS):
+            buttons.append(CallbackData.encode(public_parameters.CBDATA_REP_RES, res_id))
+            buttons.append(CallbackData.encode(public_parameters.CBDATA_INFO_RES, res_id))
+            for menu_id in range(MENUS):
+                buttons.append(CallbackData.encode(public_parameters.CBDATA_REP_MENU, res_id, menu_id))
+                for action in (public_parameters.CBDATA_SUBS, public_parameters.CBDATA_UNSUBS):
+                    buttons.append(CallbackData.encode(action, res_id, menu_id, public_parameters.CBDATA_REP_MENU))
+        # Each chat presses all buttons in order, so it unsubscribes after subscribing
+        updates = [make_update(self.bot, index, CHATS + 1 + index // len(buttons) % BUTTON_CHATS,
+                               data=buttons[index % len(buttons)]) for index in range(BUTTONS)]
+
+        latencies = []
+        start = time.perf_counter()
+        for update in updates:
+            call_start = time.perf_counter()
+            self.dagan.button(self.bot, update)
+            latencies.append(time.perf_counter() - call_start)
+        self.record('button_rate', len(updates) / (time.perf_counter() - start), 'ops/s')
+        self.record_latency('button_latency', latencies)
+
+    def test_db_writes(self):
+        chat_ids = range(CHATS + BUTTON_CHATS + 1, CHATS + BUTTON_CHATS + 1 + DB_WRITES)
+        start = time.perf_counter()
+        for chat_id in chat_ids:
+            InfoManager.subscribe(chat_id, 0, 0)
+        self.record('db_subscribe_rate', len(chat_ids) / (time.perf_counter() - start), 'ops/s')
+
+        start = time.perf_counter()
+        for chat_id in chat_ids:
+            InfoManager.unsubscribe(chat_id, 0, 0)
+        self.record('db_unsubscribe_rate', len(chat_ids) / (time.perf_counter() - start), 'ops/s')
+
+        start = time.perf_counter()
+        for chat_id in chat_ids:
+            InfoManager.report_menu(chat_id, 0, 0, mode=ReportMode.AUTO)
+        InfoManager.flush_reports()
+        self.record('db_report_rate', len(chat_ids) / (time.perf_counter() - start), 'ops/s')
+
+    def test_fanout(self):
+        durations = []
+        sent = self.bot.total_calls()
+        start = time.perf_counter()
+        for res_id, menu_id in InfoManager.get_available_menus():
+            menu_start = time.perf_counter()
+            self.dagan.notify_subscribers(res_id, menu_id)
+            durations.append(time.perf_counter() - menu_start)
+        self.record('fanout_rate', (self.bot.total_calls() - sent) / (time.perf_counter() - start), 'msg/s')
+        self.record_latency('fanout_latency', durations)
+
+    def test_reload(self):
+        unchanged = []
+        changed = []
+        for _ in range(RELOADS):
+            unchanged.append(self.timed_refresh())
+            self.offline.change_info()
+            changed.append(self.timed_refresh())
+        self.record_latency('reload_unchanged_latency', unchanged)
+        self.record_latency('reload_changed_latency', changed)
+
+    @staticmethod
+    def timed_refresh():
+        """
+        Refresh the info of all sources, as if it had expired
+        :return: Seconds of the refresh
+        """
+        InfoManager.source_expirations.clear()
+        start = time.perf_counter()
+        InfoManager.refresh()
+        elapsed = time.perf_counter() - start
+        while not InfoManager.events.empty():  # Nobody dispatches them
+            InfoManager.events.get_nowait()
+        return elapsed
+
+    def record_latency(self, name, samples):
+        """
+        Record the median of some durations, with their mean and 95th percentile
+        :param name: Name of the measure
+        :param samples: List of seconds
+        """
+        samples = [sample * 1000 for sample in samples]
+        self.record(name, statistics.median(samples), 'ms', mean=statistics.mean(samples),
+                    p95=bench_output.percentile(samples, 95), samples=len(samples))
+
+    @staticmethod
+    def record(name, value, unit, **extra):
+        bench_output.record(name, value, unit, restaurants=RESTAURANTS, menus=MENUS, chats=CHATS, **extra)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import random
+import string
+import unittest
+
+from dagan.bot_base.callback_data import CallbackData
+from dagan.data import public_parameters
+
+
+class CallbackDataTest(unittest.TestCase):
+    def test_round_trip(self):
+        for action in range(public_parameters.CBDATA_UNSUBS + 1):
+            data = CallbackData.encode(action, 123456, 7, public_parameters.CBDATA_INFO_RES)
+            self.assertLessEqual(len(data.encode('utf-8')), 64)
+            self.assertEqual(CallbackData.decode(data),
+                             CallbackData(action, 123456, 7, public_parameters.CBDATA_INFO_RES))
+
+    def test_legacy(self):
+        self.assertEqual(CallbackData.decode('-'), CallbackData(public_parameters.CBDATA_CANCEL))
+        self.assertEqual(CallbackData.decode('QR2'), CallbackData(public_parameters.CBDATA_REP_RES, 2))
+        self.assertEqual(CallbackData.decode('QM0R2'), CallbackData(public_parameters.CBDATA_REP_MENU, 2, 0))
+        self.assertEqual(CallbackData.decode('BM1R2PF'), CallbackData(public_parameters.CBDATA_SUBS, 2, 1,
+                                                                      public_parameters.CBDATA_INFO_RES))
+        self.assertEqual(CallbackData.decode('UM0R2PM'), CallbackData(public_parameters.CBDATA_UNSUBS, 2, 0,
+                                                                      public_parameters.CBDATA_REP_MENU))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, CallbackData.encode, 256)
+        rand = random.Random(0)
+        alphabet = string.ascii_letters + string.digits + '-_'
+        for _ in range(10000):
+            data = ''.join(rand.choice(alphabet) for _ in range(rand.choice((CallbackData.LENGTH, 5))))
+            try:
+                self.assertIsInstance(CallbackData.decode(data), CallbackData)
+            except ValueError:
+                pass
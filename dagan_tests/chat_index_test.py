@@ -0,0 +1,46 @@
+import unittest
+from types import SimpleNamespace
+
+from dagan.upv.saved_searches import SavedSearches
+from dagan.upv.subscriptions import Subscriptions
+
+
+class ChatIndexTest(unittest.TestCase):
+    def setUp(self):
+        chats = {1: SimpleNamespace(subscriptions=[SimpleNamespace(chat_id=1, res_id=2, menu_id=3)],
+                                    scheduled_searches=[SimpleNamespace(chat_id=1, text_to_search='paella')]),
+                 2: SimpleNamespace(subscriptions=[], scheduled_searches=[])}
+        self.subscriptions = Subscriptions.from_chats(chats)
+        self.searches = SavedSearches.from_chats(chats)
+
+    def test_from_chats(self):
+        self.assertTrue(self.subscriptions.check(1, 2, 3))
+        self.assertFalse(self.subscriptions.check(2, 2, 3))
+        self.assertEqual(self.subscriptions.of_menu(2, 3), {1})
+        self.assertEqual(self.searches.of_chat(1), ['paella'])
+        self.assertEqual(self.searches.of_text('paella'), {1})
+        self.assertNotIn(2, self.subscriptions.by_chat)
+
+    def test_changes(self):
+        subscriptions = self.subscriptions.with_subscription(2, 2, 3).with_subscription(2, 4, 5)
+        self.assertIsInstance(subscriptions, Subscriptions)
+        self.assertEqual(subscriptions.of_chat(2), [(2, 3), (4, 5)])
+        self.assertEqual(subscriptions.of_menu(2, 3), {1, 2})
+        self.assertEqual(self.subscriptions.of_menu(2, 3), {1})  # The previous snapshot is not modified
+
+        subscriptions = subscriptions.without_subscription(1, 2, 3)
+        self.assertEqual(subscriptions.of_menu(2, 3), {2})
+        self.assertNotIn(1, subscriptions.by_chat)  # Emptied sets are removed in both directions
+        subscriptions = subscriptions.without_subscription(2, 2, 3)
+        self.assertNotIn((2, 3), subscriptions.by_key)
+
+        searches = self.searches.without_search(1, 'paella')
+        self.assertIsInstance(searches, SavedSearches)
+        self.assertEqual((dict(searches.by_chat), dict(searches.by_key)), ({}, {}))
+        searches = searches.without_search(1, 'paella')  # Already removed
+        self.assertFalse(searches.check(1, 'paella'))
+        self.assertEqual(searches.with_search(3, 'sopa').of_text('sopa'), {3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import datetime
+import unittest
+from types import SimpleNamespace
+
+from dagan.data import public_parameters
+from dagan.upv.chat_schedule import ChatSchedule
+
+MONDAY = datetime.date(2020, 1, 6)
+WEEKDAYS = range(5)
+
+
+def at(day, hour, minute=0):
+    """
+    :return: Datetime of a day (offset from MONDAY) and hour
+    """
+    return datetime.datetime.combine(MONDAY + datetime.timedelta(days=day), datetime.time(hour, minute))
+
+
+class ChatScheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.schedule = ChatSchedule(start_hour=12, end_hour=15.5, days=WEEKDAYS)
+
+    def test_window(self):
+        self.assertFalse(self.schedule.is_open(at(0, 11, 59)))
+        self.assertTrue(self.schedule.is_open(at(0, 12)))
+        self.assertTrue(self.schedule.is_open(at(0, 15, 29)))
+        self.assertFalse(self.schedule.is_open(at(0, 15, 30)))
+        self.assertFalse(self.schedule.is_open(at(5, 13)))  # Saturday
+        self.assertFalse(ChatSchedule(True, 12, 15.5, WEEKDAYS).is_open(at(0, 13)))
+
+    def test_next_opening(self):
+        self.assertEqual(self.schedule.next_opening(at(0, 11)), at(0, 12))
+        self.assertEqual(self.schedule.next_opening(at(0, 12)), at(1, 12))  # Day rollover
+        self.assertEqual(self.schedule.next_opening(at(0, 23, 59)), at(1, 12))
+        self.assertEqual(self.schedule.next_opening(at(4, 16)), at(7, 12))  # Friday to Monday
+        self.assertEqual(ChatSchedule(start_hour=0, end_hour=1, days=[6]).next_opening(at(6, 0)), at(13, 0))
+
+    def test_next_delivery(self):
+        self.assertEqual(self.schedule.next_delivery(at(0, 13)), at(0, 13))
+        self.assertEqual(self.schedule.next_delivery(at(0, 16)), at(1, 12))
+        for schedule in (ChatSchedule(True, 12, 15, WEEKDAYS), ChatSchedule(days=[]),
+                         ChatSchedule(start_hour=15, end_hour=12)):
+            self.assertIsNone(schedule.next_delivery(at(0, 13)))
+
+    def test_from_chat(self):
+        schedule = ChatSchedule.from_chat(SimpleNamespace(mute=0, start_hour=8, end_hour=10, days='[0, 2]'))
+        self.assertEqual((schedule.mute, schedule.start_hour, schedule.end_hour, schedule.days),
+                         (False, 8, 10, {0, 2}))
+        schedule = ChatSchedule.from_chat(SimpleNamespace(mute=1, start_hour=None, end_hour=None, days=None))
+        self.assertEqual((schedule.mute, schedule.start_hour, schedule.end_hour, schedule.days),
+                         (True,) + tuple(public_parameters.SUBS_HOUR_INTERVAL) +
+                         (frozenset(public_parameters.SUBS_WEEKDAY_LIST),))
+
+
+if __name__ == '__main__':
+    unittest.main()
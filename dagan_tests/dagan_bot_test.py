@@ -0,0 +1,40 @@
+import unittest
+
+from telegram.error import Unauthorized
+
+from dagan.upv.info_manager import InfoManager
+from dagan_tests.resources_test.fake_telegram import make_update
+from dagan_tests.resources_test.offline_bot import OfflineBot
+
+BLOCKED = 2  # Chat which has blocked the bot
+
+
+class DaganBotTest(unittest.TestCase):
+    def setUp(self):
+        self.offline = OfflineBot(2, 2, 3, 1)
+        self.dagan = self.offline.dagan
+
+    def tearDown(self):
+        self.offline.stop()
+
+    def test_blocked_chat(self):
+        bot = self.offline.bot
+        record_message = bot.send_message
+
+        def send_message(chat_id, text, **kwargs):
+            if chat_id == BLOCKED:
+                raise Unauthorized('Forbidden: bot was blocked by the user')
+            return record_message(chat_id, text, **kwargs)
+
+        bot.send_message = send_message
+        self.dagan.check_subscriptions()
+        self.assertTrue(InfoManager.get_schedule(BLOCKED).mute)
+        self.assertEqual(sorted(self.dagan.scheduler.entries), [1, 3])  # Not retried
+
+        self.dagan.start_cmd(bot, make_update(bot, 1, BLOCKED, text='/start'))
+        self.assertFalse(InfoManager.get_schedule(BLOCKED).mute)
+        self.assertIn(BLOCKED, self.dagan.scheduler.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import datetime
+import unittest
+
+from dagan.upv.chat_schedule import ChatSchedule
+from dagan.upv.delivery_scheduler import DeliveryScheduler
+
+START = datetime.datetime(2020, 1, 6, 12)
+
+
+def later(minutes):
+    return START + datetime.timedelta(minutes=minutes)
+
+
+class DeliverySchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = DeliveryScheduler()
+
+    def test_pop_due(self):
+        self.assertIsNone(self.scheduler.wait_time(START))
+        for chat_id, minutes in ((1, 10), (2, 0), (3, 10), (4, 20)):
+            self.scheduler.schedule(chat_id, later(minutes))
+        self.assertEqual(len(self.scheduler), 4)
+        self.assertEqual(self.scheduler.wait_time(later(-1)), 60)
+        self.assertEqual(self.scheduler.pop_due(later(-1)), [])
+        self.assertEqual(self.scheduler.pop_due(START), [2])
+        self.assertEqual(self.scheduler.wait_time(START), 600)
+        self.assertEqual(self.scheduler.pop_due(later(15)), [1, 3])
+        self.assertEqual(self.scheduler.wait_time(later(30)), 0)  # Late
+        self.assertEqual(self.scheduler.pop_due(later(30)), [4])
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.wait_time(later(30)))
+
+    def test_reschedule(self):
+        self.scheduler.schedule(1, later(10))
+        self.scheduler.schedule(2, later(15))
+        self.scheduler.schedule(1, later(20))  # Its schedule has changed
+        self.assertEqual(len(self.scheduler), 2)
+        self.assertEqual(self.scheduler.wait_time(START), 900)  # The old entry is discarded
+        self.assertEqual(self.scheduler.pop_due(later(15)), [2])
+        self.scheduler.schedule(1, later(5))  # Sooner
+        self.assertEqual(self.scheduler.pop_due(later(15)), [1])
+        self.assertEqual(self.scheduler.pop_due(later(30)), [])  # Nor the one of 20 minutes
+
+    def test_remove(self):
+        self.scheduler.schedule(1, later(10))
+        self.scheduler.schedule(2, later(20))
+        self.scheduler.schedule(1, None)
+        self.scheduler.schedule(3, None)  # Not scheduled
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.wait_time(START), 1200)
+        self.assertEqual(self.scheduler.pop_due(later(30)), [2])
+
+    def test_day_rollover(self):
+        schedule = ChatSchedule(start_hour=12, end_hour=14, days=range(7))
+        self.scheduler.schedule(1, schedule.next_delivery(later(-60)))
+        self.assertEqual(self.scheduler.pop_due(later(-1)), [])
+        self.assertEqual(self.scheduler.pop_due(START), [1])
+        # Delivered: the chat waits for the window of the next day, as check_subscriptions does
+        self.scheduler.schedule(1, schedule.next_opening(START))
+        self.assertEqual(self.scheduler.wait_time(later(60)), 23 * 3600)
+        self.assertEqual(self.scheduler.pop_due(later(24 * 60 - 1)), [])
+        self.assertEqual(self.scheduler.pop_due(later(24 * 60)), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
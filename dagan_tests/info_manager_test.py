@@ -0,0 +1,174 @@
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from dagan.database.catalog import CatalogRestaurant
+from dagan.upv.info_manager import InfoManager
+from dagan.upv.info_snapshot import InfoSnapshot
+from dagan.upv.menu_event import MenuEvent
+from dagan.upv.today_menu import TodayMenu
+from dagan.upv.upv_client import UpvClient
+from dagan.utils.notifying import NotifyingQueue
+from dagan_tests.resources_test import test_upv
+
+SOURCE = ('campus', 'bar')
+ETAG = '"revision-1"'
+ITEMS = 6  # Items of test_upv.INFO_JSON
+
+
+def load_catalog(info):
+    """
+    :param info: Text of the UPV info
+    :return: Catalog with the restaurants and menus of the info {res_id: CatalogRestaurant}
+    """
+    restaurants = {}
+    for item in json.loads(info):
+        tm = TodayMenu(item)
+        restaurant = restaurants.setdefault(tm.res_id, SimpleNamespace(res_id=tm.res_id, name=item['NOMBRE_BAR'],
+                                                                       phone=None, web=None, latitude=None,
+                                                                       longitude=None, menus={}))
+        menu_id = len(restaurant.menus)
+        restaurant.menus[menu_id] = SimpleNamespace(res_id=tm.res_id, menu_id=menu_id, name=tm.name,
+                                                    codename=tm.codename)
+    return {res_id: CatalogRestaurant(restaurant) for res_id, restaurant in restaurants.items()}
+
+
+class InfoManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = []  # Headers of each request of the info
+        self.client = UpvClient()
+        self.client.session.request = self.request
+        InfoManager.token.load(test_upv.TOKEN)
+        self.patches = [patch.object(InfoManager, 'upv_client', self.client),
+                        patch.dict(InfoManager.source_feeds, clear=True),
+                        patch.dict(InfoManager.source_expirations, clear=True)]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+
+    def request(self, method, url, timeout, headers=None, **kwargs):
+        """
+        UPV info which answers not modified to the requests with the validators of its last response
+        """
+        self.requests.append(headers)
+        response = MagicMock()
+        response.headers = {'ETag': ETAG}
+        response.encoding = 'utf-8'
+        if headers.get('If-None-Match') == ETAG:
+            response.status_code = requests.codes.not_modified
+        else:
+            response.status_code = requests.codes.ok
+            response.iter_content.return_value = [test_upv.INFO_JSON.encode('utf-8')]
+        return response
+
+    @staticmethod
+    def reload_source():
+        InfoManager._InfoManager__reload_sources([SOURCE])
+
+    def test_not_modified_keeps_feed(self):
+        not_modified = UpvClient.requests_total.labels(UpvClient.INFO, 'not_modified')
+        count = not_modified.value
+        self.reload_source()
+        feed = InfoManager.source_feeds[SOURCE][1]
+        self.assertEqual(len(feed), ITEMS)
+        self.reload_source()
+        self.assertEqual(self.requests[-1].get('If-None-Match'), ETAG)
+        self.assertIs(InfoManager.source_feeds[SOURCE][1], feed)
+        self.assertEqual(not_modified.value, count + 1)
+
+    def test_dropped_feed_is_requested_again(self):
+        self.reload_source()
+        InfoManager.source_expirations[SOURCE] = time.time() - 1
+        InfoManager._InfoManager__drop_expired_feeds([SOURCE])
+        self.assertNotIn(SOURCE, InfoManager.source_feeds)
+        self.reload_source()
+        self.assertNotIn('If-None-Match', self.requests[-1])
+        self.assertEqual(len(InfoManager.source_feeds[SOURCE][1]), ITEMS)
+
+    def test_failed_source(self):
+        self.client.session.request = MagicMock(side_effect=requests.ConnectionError('UPV is down'))
+        with self.assertLogs('dagan.upv.info_manager', 'ERROR') as logs:
+            self.reload_source()
+        self.assertEqual(len(logs.records), 1)  # Logged once, by the reload of the sources
+        self.assertNotIn(SOURCE, InfoManager.source_feeds)
+        self.assertNotIn(SOURCE, InfoManager.source_expirations)
+
+    def test_menu_events(self):
+        infos = [test_upv.generate_info(2, 2), test_upv.generate_info(2, 2), test_upv.generate_info(2, 2, revision=1)]
+        events = NotifyingQueue()
+
+        def reload_info(catalog=None):
+            InfoManager.source_expirations.clear()
+            InfoManager._InfoManager__reload_info(catalog)
+            published = []
+            while not events.empty():
+                event = events.get_nowait()
+                published.append((event.kind, event.res_id, event.menu_id))
+            return published
+
+        menus = [(res_id, menu_id) for res_id in range(2) for menu_id in range(2)]
+        with patch.object(InfoManager, '_request_info', side_effect=infos), \
+                patch.object(InfoManager, 'snapshot', InfoSnapshot()), \
+                patch.object(InfoManager, 'feed_items', {}), \
+                patch.object(InfoManager, 'events', events), \
+                patch.object(InfoManager, 'refresh_listeners', []):
+            self.assertEqual(reload_info(load_catalog(infos[0])),
+                             [(MenuEvent.AVAILABLE, res_id, menu_id) for res_id, menu_id in menus] +
+                             [(MenuEvent.REFRESHED, None, None)])
+            self.assertEqual(reload_info(), [])  # Same info: empty diff
+            self.assertEqual(reload_info(),
+                             [(MenuEvent.CHANGED, res_id, menu_id) for res_id, menu_id in menus] +
+                             [(MenuEvent.REFRESHED, None, None)])
+
+    def test_catalog_version(self):
+        infos = [test_upv.generate_info(2, 2), test_upv.generate_info(3, 2)]
+        versions = [1, 1, 2]
+        catalogs = [load_catalog(info) for info in infos]
+        with patch.object(InfoManager, '_request_info', side_effect=lambda campus, bar: infos[-1]), \
+                patch.object(InfoManager, 'read_catalog_version', side_effect=versions), \
+                patch.object(InfoManager, 'read_catalog', side_effect=catalogs), \
+                patch.object(InfoManager, 'snapshot', InfoSnapshot()), \
+                patch.object(InfoManager, 'feed_items', {}), \
+                patch.object(InfoManager, 'events', NotifyingQueue()), \
+                patch.object(InfoManager, 'refresh_listeners', []), \
+                patch.object(InfoManager, 'catalog_invalid', True), \
+                patch.object(InfoManager, 'catalog_version', None), \
+                patch.object(InfoManager, 'catalog_check_time', 0):
+            for restaurants in (2, 2, 3):
+                InfoManager.catalog_check_time = 0  # Check the version marker with each refresh
+                InfoManager.refresh()
+                self.assertEqual(len(InfoManager.snapshot.restaurants), restaurants)
+            self.assertEqual(InfoManager.catalog_version, 2)
+
+    def test_failed_refresh_backoff(self):
+        calls = []
+
+        def request_info(campus, bar):
+            calls.append((campus, bar))
+            raise requests.ConnectionError('UPV is down')
+
+        with patch.object(InfoManager, '_request_info', side_effect=request_info), \
+                patch.object(InfoManager, 'snapshot', InfoSnapshot({}, {})), \
+                patch.object(InfoManager, 'expiration_time', 0), \
+                patch.object(InfoManager, 'next_retry', 0), \
+                patch.object(InfoManager, 'catalog_invalid', False), \
+                patch.object(InfoManager, 'catalog_check_time', time.time()):
+            InfoManager.refresh_event.clear()
+            for _ in range(10):
+                InfoManager.reload()
+                if InfoManager.refresh_event.is_set():  # As the refresher thread does
+                    InfoManager.refresh_event.clear()
+                    InfoManager.scheduled_refresh()
+            self.assertFalse(InfoManager.is_active())
+        self.assertEqual(calls, InfoManager.get_sources())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import codecs
+import json
+import unittest
+
+from dagan.upv.info_parser import InfoParser
+from dagan_tests.resources_test import test_upv
+
+
+def split(text, size):
+    """
+    :return: List of pieces of text of size chars
+    """
+    return [text[pos:pos + size] for pos in range(0, len(text), size)]
+
+
+def decode(data, size):
+    """
+    Decode UTF-8 pieces of size bytes as UpvClient does, so multi-byte chars are split between pieces
+    :return: Generator of pieces of text
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for pos in range(0, len(data), size):
+        yield decoder.decode(data[pos:pos + size])
+    yield decoder.decode(b'', final=True)
+
+
+class InfoParserTest(unittest.TestCase):
+    def parse(self, chunks):
+        return list(InfoParser.iter_items(chunks))
+
+    def test_parity(self):
+        expected = json.loads(test_upv.INFO_JSON)
+        self.assertEqual(self.parse(test_upv.INFO_JSON), expected)
+        generated = test_upv.generate_info(3, 2, revision=1)
+        self.assertEqual(self.parse(generated), json.loads(generated))
+
+    def test_split_tokens(self):
+        expected = json.loads(test_upv.INFO_JSON)
+        for size in (1, 2, 3, 7, 64, 1000):
+            self.assertEqual(self.parse(split(test_upv.INFO_JSON, size)), expected, size)
+
+    def test_split_utf8(self):
+        data = test_upv.INFO_JSON.encode('utf-8')
+        expected = json.loads(test_upv.INFO_JSON)
+        for size in (1, 2, 3, 5):
+            self.assertEqual(self.parse(decode(data, size)), expected, size)
+
+    def test_escapes(self):
+        text = '[{"a": "\\u00e9\\u20ac", "b": "}\\"{[", "c": "\\\\"}, {"d": {"e": ["]"]}}]'
+        expected = json.loads(text)
+        for size in range(1, len(text) + 1):
+            self.assertEqual(self.parse(split(text, size)), expected, size)
+
+    def test_raw_new_lines(self):
+        text = '[{"a": "one\r\ntwo\nthree", "b": "\\n"},\r\n{"c": "four"}]\r\n'
+        expected = [{'a': 'onetwothree', 'b': '\n'}, {'c': 'four'}]
+        for size in range(1, len(text) + 1):  # Some sizes split the CRLF
+            self.assertEqual(self.parse(split(text, size)), expected, size)
+
+    def test_empty(self):
+        self.assertEqual(self.parse(' [ ] '), [])
+
+    def test_incomplete(self):
+        for end in range(0, len(test_upv.INFO_JSON), 50):
+            with self.assertRaisesRegex(ValueError, 'incomplete'):
+                self.parse(split(test_upv.INFO_JSON[:end], 16))
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'not a list'):
+            self.parse('{"a": 1}')
+        with self.assertRaisesRegex(ValueError, 'not a dictionary'):
+            self.parse('[{"a": 1}, 2]')
+        with self.assertRaises(ValueError):
+            self.parse('[{"a": }]')
+
+
+if __name__ == '__main__':
+    unittest.main()
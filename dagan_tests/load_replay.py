@@ -0,0 +1,168 @@
+import atexit
+import bisect
+import itertools
+import random
+import threading
+import time
+import unittest
+from queue import Queue, Empty
+
+from telegram.ext import Dispatcher
+
+from dagan.__main__ import add_handlers
+from dagan.bot_base.callback_data import CallbackData
+from dagan.data import public_parameters
+from dagan.database.db_manager import DBManager
+from dagan.upv.info_manager import InfoManager
+from dagan.utils.lock_monitor import LockMonitor, EXCLUSIVE
+from dagan_tests.resources_test import bench_output
+from dagan_tests.resources_test.fake_telegram import make_update
+from dagan_tests.resources_test.offline_bot import OfflineBot
+
+RESTAURANTS = 20
+MENUS = 4
+CHATS = 5000
+SUBSCRIPTIONS = 2
+UPDATES = 2000  # Updates replayed with each number of workers
+WORKERS = (1, 2, 4, 8, 16)  # Concurrent handlers
+TELEGRAM_LATENCY = 0.005  # Seconds of each call to the API
+REPLAY_TIMEOUT = 120  # Seconds to process the updates before the handlers are considered blocked
+SEED = 0
+
+COMMANDS = (('/start', 20), ('/info', 10), ('/subscriptions', 10), (None, 60))  # (text, weight). None is a button
+BUTTONS = ((public_parameters.CBDATA_REP_RES, 25), (public_parameters.CBDATA_REP_MENU, 25),
+           (public_parameters.CBDATA_INFO_RES, 10), (public_parameters.CBDATA_SUBS, 10),
+           (public_parameters.CBDATA_UNSUBS, 10), (public_parameters.CBDATA_START_CMD, 10),
+           (public_parameters.CBDATA_INFO_CMD, 5), (public_parameters.CBDATA_CANCEL, 5))  # (action, weight)
+
+
+def weighted_choice(rand, options):
+    """
+    :param rand: Random instance
+    :param options: Tuple of (value, weight)
+    :return: Random value, chosen with a probability proportional to its weight
+    """
+    values, weights = zip(*options)
+    cumulative = list(itertools.accumulate(weights))
+    return values[bisect.bisect(cumulative, rand.random() * cumulative[-1])]
+
+
+def generate_updates(bot, count, rand):
+    """
+    Generate a stream of commands and pressed buttons of random chats
+
+    :param bot: API's bot instance
+    :param count: Number of updates
+    :param rand: Random instance
+    :return: List of updates
+    """
+    updates = []
+    for update_id in range(count):
+        chat_id = rand.randint(1, CHATS)
+        text = weighted_choice(rand, COMMANDS)
+        if text is not None:
+            updates.append(make_update(bot, update_id, chat_id, text=text))
+            continue
+        action = weighted_choice(rand, BUTTONS)
+        data = CallbackData.encode(action, rand.randrange(RESTAURANTS), rand.randrange(MENUS),
+                                   public_parameters.CBDATA_REP_MENU)
+        updates.append(make_update(bot, update_id, chat_id, data=data))
+    return updates
+
+
+class LoadReplay(unittest.TestCase):
+    """
+    Replay synthetic updates through the dispatcher of the bot, with a growing number of concurrent handlers.
+    The API calls take TELEGRAM_LATENCY seconds (see OfflineBot). Results are appended to bench_output.txt
+    """
+
+    def setUp(self):
+        self.offline = OfflineBot(RESTAURANTS, MENUS, CHATS, SUBSCRIPTIONS, TELEGRAM_LATENCY)
+        self.dispatcher = Dispatcher(self.offline.bot, Queue(), use_context=False)
+        add_handlers(self.dispatcher, self.offline.dagan)
+        self.locks = {'db_lock': DBManager.db_lock, 'report_buffer_lock': DBManager.report_buffer_lock,
+                      'report_write_lock': DBManager.report_write_lock, 'write_lock': InfoManager.write_lock}
+        self.blocked = False
+
+    def tearDown(self):
+        if self.blocked:
+            atexit.unregister(DBManager.flush_reports)  # It would block the exit too
+        else:
+            self.offline.stop()
+
+    def test_replay(self):
+        rand = random.Random(SEED)
+        for workers in WORKERS:
+            updates = generate_updates(self.offline.bot, UPDATES, rand)
+            waits = self.lock_waits()
+            latencies, elapsed = self.replay(updates, workers)
+            latencies = [latency * 1000 for latency in latencies]
+            prefix = 'load_%d_workers_' % workers
+            self.record(prefix + 'rate', len(updates) / elapsed, 'upd/s')
+            self.record(prefix + 'latency', bench_output.percentile(latencies, 50), 'ms',
+                        p95=bench_output.percentile(latencies, 95), p99=bench_output.percentile(latencies, 99))
+            for (name, mode), (acquisitions, seconds) in sorted(self.lock_waits().items()):
+                previous_acquisitions, previous_seconds = waits.get((name, mode), (0, 0))
+                acquisitions -= previous_acquisitions
+                seconds -= previous_seconds
+                if acquisitions:
+                    self.record(prefix + name + ('' if mode == EXCLUSIVE else '_' + mode) + '_wait', seconds * 1000,
+                                'ms', acquisitions=acquisitions)
+
+    def lock_waits(self):
+        """
+        :return: Waits for the locks of the bot so far, recorded by their LockMonitor {(name, mode): (acquisitions,
+        seconds)}
+        """
+        names = {lock.monitor.name: name for name, lock in self.locks.items()}
+        waits = {}
+        for (lock, mode), value in list(LockMonitor.wait_seconds.values.items()):
+            if lock in names:
+                samples = {suffix: sample for suffix, _, sample in value.samples()}
+                waits[(names[lock], mode)] = (samples['_count'], samples['_sum'])
+        return waits
+
+    def replay(self, updates, workers):
+        """
+        Process updates with some threads
+
+        :param updates: List of updates
+        :param workers: Number of threads
+        :return: Tuple (list of seconds spent by each update, seconds spent by all updates)
+        """
+        pending = Queue()
+        for update in updates:
+            pending.put(update)
+        latencies = []
+
+        def work():
+            while True:
+                try:
+                    update = pending.get_nowait()
+                except Empty:
+                    return
+                start = time.perf_counter()
+                self.dispatcher.process_update(update)
+                latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(max(start + REPLAY_TIMEOUT - time.perf_counter(), 0))
+        self.blocked = any(thread.is_alive() for thread in threads)
+        if self.blocked:
+            self.fail('Handlers blocked with %d workers: %d of %d updates processed in %d seconds, holders %s' % (
+                workers, len(latencies), len(updates), REPLAY_TIMEOUT,
+                {name: lock.monitor.describe() for name, lock in self.locks.items()}))
+        return latencies, time.perf_counter() - start
+
+    @staticmethod
+    def record(name, value, unit, **extra):
+        bench_output.record(name, value, unit, restaurants=RESTAURANTS, menus=MENUS, chats=CHATS, updates=UPDATES,
+                            **extra)
+
+
+if __name__ == '__main__':
+    unittest.main()
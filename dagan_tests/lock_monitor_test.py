@@ -0,0 +1,56 @@
+import threading
+import time
+import unittest
+
+from dagan.utils.dagan_lock import DaganLock
+from dagan.utils.dagan_rw_lock import DaganRWLock
+
+
+class LockMonitorTest(unittest.TestCase):
+    def test_release_on_exception(self):
+        lock = DaganRWLock('test_exception')
+        with self.assertRaises(KeyError):
+            with lock.writer():
+                raise KeyError(0)
+        with self.assertRaises(KeyError):
+            with lock.reader():
+                raise KeyError(0)
+        with lock.writer():
+            self.assertEqual(lock.monitor.describe()[0][:6], 'writer')
+        self.assertEqual(lock.monitor.describe(), [])
+
+    def test_readers(self):
+        lock = DaganRWLock('test_readers')
+        with lock.reader():
+            with lock.reader():
+                self.assertEqual(lock.readers, 2)
+            self.assertEqual(lock.readers, 1)
+        self.assertEqual(lock.readers, 0)
+
+    def test_slow_hold(self):
+        lock = DaganLock('test_hold', hold_warning=0.01)
+        with self.assertLogs('dagan.utils.lock_monitor', 'WARNING') as logs:
+            with lock:
+                time.sleep(0.02)
+        self.assertIn('test_hold lock: held', logs.output[0])
+        self.assertIn('lock_monitor_test.py', logs.output[0])
+        self.assertIn('test_slow_hold', logs.output[0])
+
+    def test_starved_writer(self):
+        lock = DaganRWLock('test_starved')
+        lock.monitor.wait_warning = 0.01
+        reading = threading.Event()
+
+        def write():
+            reading.wait()
+            with lock.writer():
+                pass
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with self.assertLogs('dagan.utils.lock_monitor', 'WARNING') as logs:
+            with lock.reader():
+                reading.set()
+                time.sleep(0.05)
+            writer.join()
+        self.assertIn('test_starved lock: writer waited', logs.output[0])
@@ -0,0 +1,61 @@
+import json
+import unittest
+
+from dagan.upv.menu_diff import MenuDiff
+from dagan.upv.today_menu import TodayMenu
+from dagan_tests.resources_test import test_upv
+
+
+def load_menus(info):
+    """
+    :param info: Text of the UPV info
+    :return: Menus of the info {(res_id, menu_id): TodayMenu}, with the position of each item as menu_id
+    """
+    return {(int(item['ID_BAR']), menu_id): TodayMenu(item) for menu_id, item in enumerate(json.loads(info))}
+
+
+class MenuDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = load_menus(test_upv.generate_info(2, 3))
+        self.current = load_menus(test_upv.generate_info(2, 3))
+
+    def test_unchanged(self):
+        diff = MenuDiff.between(self.previous, self.current)
+        self.assertFalse(diff)
+        self.assertEqual(diff.updated(), {})
+        menus = diff.apply(self.previous)
+        self.assertEqual(menus, self.previous)
+        self.assertIsNot(menus, self.previous)
+
+    def test_added_changed_removed(self):
+        added = (9, 9)
+        changed = (1, 4)
+        removed = (0, 0)
+        self.current[added] = self.current.pop(removed)
+        item = json.loads(test_upv.generate_info(2, 3, revision=1))[changed[1]]
+        self.current[changed] = TodayMenu(item)
+        diff = MenuDiff.between(self.previous, self.current)
+        self.assertTrue(diff)
+        self.assertEqual(diff.added, {added: self.current[added]})
+        self.assertEqual(diff.changed, {changed: self.current[changed]})
+        self.assertEqual(diff.removed, {removed})
+        self.assertEqual(diff.updated().keys(), {added, changed})
+
+        menus = diff.apply(self.previous)
+        self.assertEqual(menus, self.current)
+        for key, tm in menus.items():  # Unchanged menus keep their previous TodayMenu
+            if key not in (added, changed):
+                self.assertIs(tm, self.previous[key])
+        self.assertIn(removed, self.previous)  # Not modified
+
+    def test_from_empty(self):
+        diff = MenuDiff.between({}, self.current)
+        self.assertEqual(diff.added, self.current)
+        self.assertFalse(diff.changed or diff.removed)
+        diff = MenuDiff.between(self.current, {})
+        self.assertEqual(diff.removed, self.current.keys())
+        self.assertEqual(diff.apply(self.current), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
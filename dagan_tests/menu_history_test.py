@@ -0,0 +1,96 @@
+import datetime
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from dagan.bot_base.telegram_bot import TelegramBot
+from dagan.database.menu_history import MenuHistory
+
+# Days of two months, so the records are in two files
+DAYS = [datetime.date(2020, 1, 30) + datetime.timedelta(days=day) for day in range(4)]
+
+
+def make_menu(day, revision=0):
+    """
+    :return: Object with the fields of a TodayMenu, different for each day and revision
+    """
+    return SimpleNamespace(first='Paella %s' % day, second='Ragú %d' % revision, others='', observations='#',
+                           price='%d€' % day.day)
+
+
+class MenuHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.history = MenuHistory(self.work_dir.name)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def assert_entry(self, entry, day, key, revision=0):
+        tm = make_menu(day, revision)
+        self.assertEqual((entry.date, entry.res_id, entry.menu_id), (day,) + key)
+        self.assertEqual([getattr(entry, field) for field in MenuHistory.FIELDS],
+                         [getattr(tm, field) for field in MenuHistory.FIELDS])
+
+    def test_round_trip(self):
+        for day in DAYS:
+            self.assertEqual(self.history.add(day, {(1, 2): make_menu(day), (3, 4): make_menu(day)}), 2)
+        self.assertEqual(sorted(os.listdir(self.work_dir.name)), ['2020-01.bin', '2020-02.bin'])
+
+        entries = self.history.query(DAYS[0], DAYS[-1])
+        self.assertEqual(len(entries), 2 * len(DAYS))
+        for index, day in enumerate(DAYS):
+            self.assert_entry(entries[2 * index], day, (1, 2))
+            self.assert_entry(entries[2 * index + 1], day, (3, 4))
+
+        entries = self.history.query(DAYS[1], DAYS[2], 3, 4)  # Across both files
+        self.assertEqual([entry.date for entry in entries], DAYS[1:3])
+        self.assertEqual(self.history.query(DAYS[0], DAYS[-1], 5), [])
+
+    def test_changed_menus(self):
+        day = DAYS[0]
+        self.assertEqual(self.history.add(day, {(1, 2): make_menu(day)}), 1)
+        self.assertEqual(self.history.add(day, {(1, 2): make_menu(day)}), 0)  # Unchanged
+        self.assertEqual(self.history.add(day, {(1, 2): make_menu(day, 1)}), 1)
+        self.assertEqual(MenuHistory(self.work_dir.name).add(day, {(1, 2): make_menu(day, 1)}), 0)  # Restarted
+        entries = self.history.query(day, day)
+        self.assertEqual(len(entries), 1)
+        self.assert_entry(entries[0], day, (1, 2), 1)  # Last version of the day
+
+    def test_truncated_tail(self):
+        day = DAYS[0]
+        self.history.add(day, {(1, 2): make_menu(day)})
+        file_path = self.history.file_path(day)
+        size = os.path.getsize(file_path)
+        for tail in (b'\x01\x02', MenuHistory.HEADER.pack(day.toordinal(), 3, 4, 100) + b'\x78'):
+            with open(file_path, 'ab') as file:
+                file.write(tail)  # Interrupted write
+            entries = self.history.query(day, day)
+            self.assertEqual(len(entries), 1)
+            self.assert_entry(entries[0], day, (1, 2))
+
+            history = MenuHistory(self.work_dir.name)  # Restarted: the tail is removed before appending
+            self.assertEqual(history.add(day, {(1, 2): make_menu(day), (3, 4): make_menu(day)}), 1)
+            entries = history.query(day, day)
+            self.assertEqual([(entry.res_id, entry.menu_id) for entry in entries], [(1, 2), (3, 4)])
+            self.assert_entry(entries[1], day, (3, 4))
+            with open(file_path, 'r+b') as file:
+                file.truncate(size)
+
+    def test_split_long_history(self):
+        days = [DAYS[0] + datetime.timedelta(days=day) for day in range(60)]
+        for day in days:
+            self.history.add(day, {(1, 2): make_menu(day)})
+        blocks = ['\n%s\n%s\n' % (entry.date, entry.first * 20) for entry in self.history.query(days[0], days[-1])]
+        header = 'Menu\n'
+        messages = TelegramBot.split_msg(header, blocks, max_length=1000)
+        self.assertGreater(len(messages), 1)
+        for message in messages:
+            self.assertTrue(message.startswith(header))
+            self.assertLessEqual(len(message), 1000)
+        self.assertEqual(''.join(message[len(header):] for message in messages), ''.join(blocks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from dagan.utils.metrics import Metrics
+from dagan.utils.metrics_server import MetricsServer
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MetricsServer('127.0.0.1', 0, '/metrics')
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d%s' % (self.server.port, path)) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as err:
+            return err.code, None
+
+    def test_render(self):
+        Metrics.counter('test_calls_total', 'Calls', ('method',)).labels('send').inc(2)
+        histogram = Metrics.histogram('test_call_seconds', 'Calls', buckets=(0.1, 1))
+        histogram.observe(0.5)
+        histogram.observe(5)
+        Metrics.gauge('test_queue_size', 'Queue', lambda: 3)
+
+        status, text = self.get('/metrics')
+        self.assertEqual(status, 200)
+        lines = text.splitlines()
+        self.assertIn('# TYPE test_calls_total counter', lines)
+        self.assertIn('test_calls_total{method="send"} 2', lines)
+        self.assertIn('test_call_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('test_call_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('test_call_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('test_call_seconds_sum 5.5', lines)
+        self.assertIn('test_call_seconds_count 2', lines)
+        self.assertIn('test_queue_size 3', lines)
+
+    def test_not_found(self):
+        self.assertEqual(self.get('/dagan')[0], 404)
@@ -19,7 +19,7 @@ class MockedExecution(unittest.TestCase):
     @patch('dagan.upv.info_manager.InfoManager._request_token')
     def test_execute(self, request_token, request_info):
         request_token.side_effect = lambda: test_upv.TOKEN
-        request_info.side_effect = lambda: test_upv.INFO_JSON
+        request_info.side_effect = lambda campus, bar: test_upv.INFO_JSON
 
         # private_parameters.BOT_TOKEN = ''
         private_parameters.DB_URL = 'sqlite:///' + resource_test_path('dagan_test.db')
@@ -0,0 +1,87 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from dagan.database.db_manager import DBManager
+from dagan.database.entities import MenuReport
+from dagan.database.report_ledger import ReportLedger
+from dagan_tests.resources_test import test_db
+
+YESTERDAY = datetime.datetime.now() - datetime.timedelta(days=1)
+
+
+class ReportLedgerTest(unittest.TestCase):
+    def test_one_report_by_day(self):
+        ledger = ReportLedger([(1, 2, 3)])
+        ledger.add(1, 2, 3)
+        ledger.add(1, 2, 3, report_date=datetime.datetime.now())
+        ledger.add(2, 2, 3, report_date=YESTERDAY)  # Ignored
+        ledger.add(2, 'paella')
+        self.assertEqual(ledger.reports, {(1, 2, 3), (2, 'paella')})
+        self.assertTrue(ledger.check(1, 2, 3))
+        self.assertFalse(ledger.check(2, 2, 3))
+        self.assertEqual(ledger.pending([1, 2, 3], 2, 3), {2, 3})
+        self.assertEqual(ledger.pending([1, 2], 'paella'), {1})
+
+    def test_rollover(self):
+        ledger = ReportLedger([(1, 2, 3)])
+        ledger.day -= datetime.timedelta(days=1)  # The day has changed since the last report
+        self.assertFalse(ledger.check(1, 2, 3))
+        self.assertEqual(ledger.reports, set())
+        self.assertEqual(ledger.day, datetime.date.today())
+        ledger.day -= datetime.timedelta(days=1)
+        ledger.add(1, 2, 3)  # Reports of the new day are kept
+        self.assertEqual(ledger.pending([1, 2], 2, 3), {2})
+
+
+class ReportLedgerDBTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.work_dir.name, 'dagan.db')
+        test_db.create_db(db_path, 2, 2, 3, 1)
+        engine = DBManager.create_engine('sqlite:///' + db_path)
+        self.patches = [patch.object(DBManager, 'Session', scoped_session(sessionmaker(bind=engine))),
+                        patch.object(DBManager, 'menu_reports', ReportLedger()),
+                        patch.object(DBManager, 'report_buffer', [])]
+        for patcher in self.patches:
+            patcher.start()
+        self.engine = engine
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.engine.dispose()
+        self.work_dir.cleanup()
+
+    def rows(self):
+        session = DBManager.Session()
+        try:
+            return session.query(MenuReport).count()
+        finally:
+            DBManager.Session.remove()
+
+    def test_bulk_insert(self):
+        now = datetime.datetime.now()
+        DBManager.report_menu(1, 0, 0, now)
+        DBManager.report_menu(1, 0, 0, now)  # Same row: ignored by the insert
+        DBManager.report_menu(1, 0, 0, now + datetime.timedelta(seconds=1))  # Another row of the same day
+        DBManager.report_menu(2, 0, 1)
+        DBManager.report_menu(3, 1, 0, YESTERDAY)  # Only at DB
+        buffered = list(DBManager.report_buffer)
+        self.assertTrue(DBManager.flush_reports())
+        self.assertEqual(self.rows(), 4)
+
+        DBManager.report_buffer.extend(buffered)  # A retried flush of the same reports
+        self.assertTrue(DBManager.flush_reports())
+        self.assertEqual(self.rows(), 4)
+
+        self.assertEqual(DBManager.menu_reports.reports, {(1, 0, 0), (2, 0, 1)})
+        self.assertEqual(ReportLedger(DBManager.read_menu_reports()).reports, DBManager.menu_reports.reports)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import time
+
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'bench_output.txt')
+REGRESSION_TOLERANCE = 0.2  # Change over the previous commit reported as a regression
+
+
+def current_commit():
+    """
+    :return: Commit of the working tree ('-dirty' if it has changes)
+    """
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(values, percent):
+    """
+    :param values: Sequence of numbers (not empty)
+    :param percent: Percentile, from 0 to 100
+    :return: Value of the percentile, interpolated between the closest ranks
+    """
+    values = sorted(values)
+    rank = (len(values) - 1) * percent / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def record(name, value, unit, **extra):
+    """
+    Append a measure to bench_output.txt (one JSON per line) and compare it with the last one of a different commit
+
+    :param name: Name of the measure
+    :param value: Value of the measure
+    :param unit: 'ms' (lower is better) or a rate (higher is better)
+    :param extra: Other values to save with the measure
+    :return: Text with the measure and its change
+    """
+    commit = current_commit()
+    previous = None
+    if os.path.exists(OUTPUT_PATH):
+        with open(OUTPUT_PATH, encoding='utf-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                if entry['name'] == name and entry['commit'] != commit:
+                    previous = entry
+    entry = dict(commit=commit, date=time.strftime('%Y-%m-%d %H:%M:%S'), name=name, value=value, unit=unit, **extra)
+    with open(OUTPUT_PATH, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry) + '\n')
+
+    report = '%s: %.3f %s' % (name, value, unit)
+    if previous is not None and previous['value']:
+        change = (value - previous['value']) / previous['value']
+        worse = change > REGRESSION_TOLERANCE if unit == 'ms' else change < -REGRESSION_TOLERANCE
+        report += ' (%+.1f%% over %s%s)' % (change * 100, previous['commit'], ', REGRESSION' if worse else '')
+    print(report)
+    return report
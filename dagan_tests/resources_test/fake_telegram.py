@@ -0,0 +1,76 @@
+import collections
+import itertools
+import threading
+import time
+
+from telegram import Update, Message
+
+
+class FakeBot:
+    """
+    API's bot instance that records the calls instead of sending them to Telegram
+    """
+    username = 'dagan_test_bot'  # Commands addressed to other bots are ignored by the dispatcher
+
+    def __init__(self, latency=0):
+        """
+        :param latency: Seconds that each call takes, to simulate the network
+        """
+        self.latency = latency
+        self.calls = collections.Counter()  # {method name: calls}
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.__record('send_message', chat_id)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return self.__record('edit_message_text', chat_id)
+
+    def delete_message(self, chat_id, message_id):
+        return self.__record('delete_message', chat_id)
+
+    def send_location(self, chat_id, latitude, longitude):
+        return self.__record('send_location', chat_id)
+
+    def send_contact(self, chat_id, phone_number, first_name):
+        return self.__record('send_contact', chat_id)
+
+    def send_chat_action(self, chat_id, action):
+        return self.__record('send_chat_action', chat_id)
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def __record(self, method, chat_id):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            message_id = next(self.message_ids)
+        return Message.de_json({'message_id': message_id, 'date': int(time.time()),
+                                'chat': {'id': chat_id, 'type': 'private'}}, self)
+
+
+def make_update(bot, update_id, chat_id, text=None, data=None):
+    """
+    Build an update like the ones received from Telegram
+
+    :param bot: API's bot instance
+    :param update_id: Id of the update
+    :param chat_id: Id of the chat (and user) which sends it
+    :param text: Text of a message (like a command)
+    :param data: Callback data of a pressed button
+    :return: Update
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'Test'}
+    message = {'message_id': update_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+               'from': user}
+    if data is not None:
+        return Update.de_json({'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(chat_id), 'data': data, 'message': message}}, bot)
+    message['text'] = text
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ')[0])}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from dagan.dagan_bot import DaganBot
+from dagan.data import public_parameters, private_parameters
+from dagan.database.menu_history import MenuHistory
+from dagan.upv.info_manager import InfoManager
+from dagan_tests.resources_test import test_db, test_upv
+from dagan_tests.resources_test.fake_telegram import FakeBot
+
+UNLIMITED_RATE = 10 ** 6  # Messages per second of the send queue, so it measures the bot and not the limits
+
+
+class OfflineBot:
+    """
+    DaganBot without network: Telegram is replaced by a FakeBot, UPV by generated info and the DB by a generated
+    SQLite file in a temporary directory. The bot is created with threads=False, so the owner calls its tasks
+    """
+
+    def __init__(self, restaurants, menus, chats, subscriptions, latency=0):
+        """
+        :param restaurants: Number of restaurants
+        :param menus: Number of menus of each restaurant
+        :param chats: Number of chats (ids 1 to chats), with their delivery window always open
+        :param subscriptions: Subscriptions of each chat
+        :param latency: Seconds that each call to the FakeBot takes
+        """
+        self.work_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.work_dir.name, 'dagan.db')
+        test_db.create_db(db_path, restaurants, menus, chats, subscriptions)
+        private_parameters.DB_URL = 'sqlite:///' + db_path
+        public_parameters.SEND_GLOBAL_RATE = UNLIMITED_RATE
+        public_parameters.SEND_CHAT_RATE = UNLIMITED_RATE
+        public_parameters.SEND_CHAT_BURST = UNLIMITED_RATE
+        public_parameters.TOKEN_FILE = os.path.join(self.work_dir.name, 'token.json')
+        InfoManager.menu_history = MenuHistory(os.path.join(self.work_dir.name, 'history'))
+
+        self.infos = [test_upv.generate_info(restaurants, menus, revision) for revision in range(2)]
+        self.revision = 0  # Index of the info served
+        self.patches = [patch.object(InfoManager, '_request_token', side_effect=lambda: test_upv.TOKEN),
+                        patch.object(InfoManager, '_request_info',
+                                     side_effect=lambda campus, bar: self.infos[self.revision])]
+        for patcher in self.patches:
+            patcher.start()
+
+        self.bot = FakeBot(latency)
+        self.dagan = DaganBot(self.bot, threads=False)
+
+    def change_info(self):
+        """
+        Serve a different revision of the info with the next refresh
+        """
+        self.revision = 1 - self.revision
+
+    def stop(self):
+        self.dagan.stop()
+        for patcher in self.patches:
+            patcher.stop()
+        self.work_dir.cleanup()
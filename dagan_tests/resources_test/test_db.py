@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+
+from dagan_tests.resources_test import test_upv
+
+SQL_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'scripts', 'sql')
+MASTER_SCRIPT = '2.Master_test.sql'  # Fixed data, replaced by the generated one
+
+
+def schema_scripts():
+    """
+    :return: Paths of the scripts that create the schema, in order
+    """
+    names = [name for name in os.listdir(SQL_PATH) if name[0].isdigit() and name != MASTER_SCRIPT]
+    return [os.path.join(SQL_PATH, name) for name in sorted(names, key=lambda name: int(name.split('.')[0]))]
+
+
+def create_db(path, restaurants, menus, chats, subscriptions):
+    """
+    Create a SQLite DB with the restaurants and menus of test_upv.generate_info, and chats subscribed to them
+
+    :param path: Path of the DB file. It is replaced if it exists
+    :param restaurants: Number of restaurants
+    :param menus: Number of menus of each restaurant
+    :param chats: Number of chats (ids 1 to chats). Their delivery window is always open
+    :param subscriptions: Subscriptions of each chat, spread over all menus
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        for script in schema_scripts():
+            with open(script, encoding='utf-8') as file:
+                connection.executescript(file.read().replace('commit;', ''))
+        connection.executemany('INSERT INTO restaurant (res_id, name) VALUES (?, ?)',
+                               [(res_id, test_upv.GENERATED_RES_NAME % res_id) for res_id in range(restaurants)])
+        connection.executemany('INSERT INTO menu (res_id, menu_id, name) VALUES (?, ?, ?)',
+                               [(res_id, menu_id, test_upv.GENERATED_MENU_NAME % menu_id)
+                                for res_id in range(restaurants) for menu_id in range(menus)])
+        connection.executemany('INSERT INTO chat (chat_id, start_hour, end_hour, days) VALUES (?, 0, 24, ?)',
+                               [(chat_id, json.dumps(list(range(7)))) for chat_id in range(1, chats + 1)])
+        all_menus = restaurants * menus
+        connection.executemany('INSERT INTO subscription (chat_id, res_id, menu_id) VALUES (?, ?, ?)',
+                               [(chat_id, index % all_menus // menus, index % menus)
+                                for chat_id in range(1, chats + 1)
+                                for index in range(chat_id, chat_id + min(subscriptions, all_menus))])
+        connection.commit()
+    finally:
+        connection.close()
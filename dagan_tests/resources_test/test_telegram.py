@@ -0,0 +1,3 @@
+SECRET = 'dagan-secret'
+UPDATE_START_JSON = '{"update_id": 100000001, "message": {"message_id": 10, "date": 1516017600, "chat": {"id": 5, "type": "private", "first_name": "Test"}, "from": {"id": 5, "is_bot": false, "first_name": "Test"}, "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}'
+UPDATE_CALLBACK_JSON = '{"update_id": 100000002, "callback_query": {"id": "1", "from": {"id": 5, "is_bot": false, "first_name": "Test"}, "chat_instance": "1", "data": "QR2", "message": {"message_id": 11, "date": 1516017600, "chat": {"id": 5, "type": "private", "first_name": "Test"}}}}'
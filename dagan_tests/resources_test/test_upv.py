@@ -1,2 +1,30 @@
+import json
+
 TOKEN = '{"access_token": "AAAA", "token_type": "Bearer", "expiration_time": 9999999999}'
 INFO_JSON = '[{"ID_BAR":"0","NOMBRE_BAR":"Bar Primero","NOMBRE_BAR_V":"Bar Primero","NOMBRE_BAR_I":"Bar Primero","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Ensaladas","PLATO1":"Ensalada de pavo :s:#Ensalada de pavo modificada :s:#Ensalada mediterránea :s:#Ensalada de pasta :s:#Ensalada con nueces :s:#Ensalada de garbanzos:s:#Ensalada de frutas :s:","PLATO2":"","OTROS":"","OBSERVACIONES":"","HORARIO":"de 13:00 a 16:00 horas","HORARIO_I":"","HORARIO_V":"","PRECIO":"Ensalada vegetal + agua: 2,85 Euros#Ensalada vegetal + zumo: 3,25 Euros#Ingrediente extra: 0,40 Euros#Vasito de fruta : 1,50 Euros#Ensalada de frutas: 2,85 Euros#"},{"ID_BAR":"1","NOMBRE_BAR":"Bar Segundo","NOMBRE_BAR_V":"Bar Segundo","NOMBRE_BAR_I":"Bar Segundo","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Menú del día","PLATO1":"A elegir entre: #- Ensalada del día :s:#- Salmorejo#- Canelones a la boloñesa#- Menestra al natural","PLATO2":"A elegir entre: #- Arroz al horno#- Suquet de cazón :s:#- Burguer BBQ con cebolla caramelizada#- Espinacas a la crema ","OTROS":"Postres a elegir:# - Fruta de temporada # - Yogurt :s:# - Postre casero,# - Tartas variadas ","OBSERVACIONES":"Incluido: Pan, 1/5 de cerveza o 1/4 de agua","HORARIO":" De 13:30 a 16:00","HORARIO_I":"","HORARIO_V":"","PRECIO":"5,00 Euros"},{"ID_BAR":"2","NOMBRE_BAR":"Bar Tercero","NOMBRE_BAR_V":"Bar Tercero","NOMBRE_BAR_I":"Bar Tercero","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Menú del día","PLATO1":" A elegir entre: #- Paella valenciana#- Crema de calabacín#- Sopa de marisco#- Raviolis dipepone","PLATO2":" A elegir entre: #- Muslo de pavo en salsa#- Ragut de ternera al vino#- Bacalao a la miel##","OTROS":"Postre","OBSERVACIONES":"El menú incluye bebida, pan y café#","HORARIO":"de 12:45 a 18:00 horas","HORARIO_I":"","HORARIO_V":"","PRECIO":"7,20 Euros"},{"ID_BAR":"2","NOMBRE_BAR":"Bar Tercero","NOMBRE_BAR_V":"Bar Tercero","NOMBRE_BAR_I":"Bar Tercero","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Bocatas del día","PLATO1":"Especial del día: #- Pechuga al roquefort#Bocatas del día: #- Magro con tomate y pimiento#- Revuelto de bacon#- Vegetal","PLATO2":"","OTROS":"","OBSERVACIONES":"","HORARIO":"de 9 a 12:30 hotas","HORARIO_I":"","HORARIO_V":"","PRECIO":"Especial del día: 4 Euros (incluye Bebida + aceitunas o cacaos)#Bocatas del día: 2,90 Euros (incluye bebida)"},{"ID_BAR":"2","NOMBRE_BAR":"Bar Tercero","NOMBRE_BAR_V":"Bar Tercero","NOMBRE_BAR_I":"Bar Tercero","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Tardeos","PLATO1":"Litro o 2 tercios de cerveza + Bravas: 5 euros#Litro o 2 tercios de cerveza + Ensaladilla Rusa: 5 euros #Litro o 2 tercios de cerveza + Fingers: 5,50 euros#Litro o 2 tercios de cerveza + Rabo o morro: 5,50  euros#","PLATO2":"","OTROS":"","OBSERVACIONES":"","HORARIO":"","HORARIO_I":"","HORARIO_V":"","PRECIO":""},{"ID_BAR":"2","NOMBRE_BAR":"Bar Tercero","NOMBRE_BAR_V":"Bar Tercero","NOMBRE_BAR_I":"Bar Tercero","LONGITUD":"","LATITUD":"","EMAIL_BAR":"","TELEF":"","TELEF_2":"","WEB":"","FECHA":"27/12/2017","MENU":"Menú ensalada","PLATO1":"Ensalada Mediterránea #+#Bebida#+#Postre o café","PLATO2":"","OTROS":"","OBSERVACIONES":"","HORARIO":"","HORARIO_I":"","HORARIO_V":"","PRECIO":"5 euros"}]'
+
+GENERATED_RES_NAME = 'Bar %d'
+GENERATED_MENU_NAME = 'Menú %d'
+
+
+def generate_info(restaurants, menus, revision=0):
+    """
+    Generate UPV info with the items of INFO_JSON as templates
+
+    :param restaurants: Number of restaurants (ids 0 to restaurants - 1, named like GENERATED_RES_NAME)
+    :param menus: Number of menus of each restaurant (ids 0 to menus - 1, named like GENERATED_MENU_NAME)
+    :param revision: Revision of the info. Each revision changes the observations of all menus
+    :return: Text of the info
+    """
+    templates = json.loads(INFO_JSON)
+    items = []
+    for res_id in range(restaurants):
+        for menu_id in range(menus):
+            item = dict(templates[(res_id * menus + menu_id) % len(templates)])
+            item['ID_BAR'] = str(res_id)
+            item['NOMBRE_BAR'] = item['NOMBRE_BAR_V'] = item['NOMBRE_BAR_I'] = GENERATED_RES_NAME % res_id
+            item['MENU'] = GENERATED_MENU_NAME % menu_id
+            if revision:
+                item['OBSERVACIONES'] += '#Revisión %d' % revision
+            items.append(item)
+    return json.dumps(items, ensure_ascii=False)
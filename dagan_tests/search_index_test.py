@@ -0,0 +1,53 @@
+import unittest
+from types import SimpleNamespace
+
+from dagan.upv.menu_diff import MenuDiff
+from dagan.upv.search_index import SearchIndex
+
+SALAD = (1, 1)
+PASTA = (1, 2)
+FISH = (2, 1)
+
+
+def make_menu(first, second='', others='', observations=''):
+    """
+    :return: Object with the fields of a TodayMenu
+    """
+    return SimpleNamespace(first=first, second=second, others=others, observations=observations)
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.update(MenuDiff(added={SALAD: make_menu('Ensalada MEDITERRÁNEA'),
+                                          PASTA: make_menu('Ensalada de pasta', 'Macarrones'),
+                                          FISH: make_menu('Sopa', 'Suquet de cazón', observations='Pan y café')}))
+
+    def test_accents_and_case(self):
+        for text in ('mediterranea', 'Mediterránea', 'MEDITERRANEA', 'medit'):
+            self.assertEqual(self.index.search(text), [SALAD], text)
+        self.assertEqual(self.index.search('cazon'), [FISH])
+        self.assertEqual(self.index.search('CAFÉ'), [FISH])
+
+    def test_words(self):
+        self.assertEqual(self.index.search('ensalada'), [SALAD, PASTA])
+        self.assertEqual(self.index.search('ensalada pasta'), [PASTA])
+        self.assertEqual(self.index.search('  pasta,  ENSAL '), [PASTA])
+        self.assertEqual(self.index.search('ensalada sopa'), [])
+        self.assertEqual(self.index.search('paella'), [])
+        self.assertEqual(self.index.search(' ¿? '), [])
+
+    def test_changed_and_removed(self):
+        self.assertEqual(self.index.update(MenuDiff(changed={PASTA: make_menu('Lasaña')}, removed={FISH})), {PASTA})
+        self.assertEqual(self.index.search('ensalada'), [SALAD])
+        self.assertEqual(self.index.search('lasana'), [PASTA])
+        self.assertEqual(self.index.search('macarrones'), [])
+        self.assertEqual(self.index.search('sopa'), [])
+        self.assertNotIn('sopa', self.index.words)
+        self.assertNotIn('sopa', self.index.postings)
+        self.index.update(MenuDiff(removed={SALAD, PASTA}))
+        self.assertEqual((self.index.menus, self.index.postings, self.index.words), ({}, {}, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
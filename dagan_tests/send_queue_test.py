@@ -0,0 +1,67 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from telegram.error import Unauthorized, TimedOut
+
+from dagan.bot_base.send_queue import SendQueue
+from dagan.data import public_parameters
+
+
+class SendQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [patch.object(public_parameters, 'SEND_GLOBAL_RATE', 1),
+                        patch.object(public_parameters, 'SEND_CHAT_RATE', 0.5),
+                        patch.object(public_parameters, 'SEND_CHAT_BURST', 1),
+                        patch.object(public_parameters, 'SEND_BACKOFF_SECONDS', 0)]
+        for patcher in self.patches:
+            patcher.start()
+        self.queue = SendQueue(workers=2, bulk_workers=1)
+        self.calls = []
+
+    def tearDown(self):
+        self.queue.stop()
+        for patcher in reversed(self.patches):
+            patcher.stop()
+
+    def send_message(self, chat_id):
+        self.calls.append((chat_id, time.monotonic()))
+        return chat_id
+
+    def test_chat_wait_keeps_global_rate(self):
+        start = time.monotonic()
+        self.queue.submit(SendQueue.INTERACTIVE, self.send_message, chat_id=1).result()
+        self.queue.submit(SendQueue.INTERACTIVE, self.send_message, chat_id=1)  # Waits 2s for its chat
+        time.sleep(0.1)
+        self.queue.submit(SendQueue.INTERACTIVE, self.send_message, chat_id=2).result()
+        # The second chat only waits for the global rate (1s), not for a global token taken by the first chat
+        self.assertLess(time.monotonic() - start, 1.6)
+
+    def test_permanent_errors(self):
+        def send_message(chat_id):
+            self.calls.append(chat_id)
+            raise Unauthorized('Forbidden: bot was blocked by the user')
+
+        with self.assertRaises(Unauthorized):
+            self.queue.submit(SendQueue.BULK, send_message, chat_id=1).result()
+        self.assertEqual(self.calls, [1])
+
+    def test_retried_errors(self):
+        def send_message(chat_id):
+            self.calls.append(chat_id)
+            if len(self.calls) < 2:
+                raise TimedOut()
+            return chat_id
+
+        with patch.object(public_parameters, 'SEND_CHAT_RATE', 1000), \
+                patch.object(public_parameters, 'SEND_GLOBAL_RATE', 1000):
+            queue = SendQueue(workers=1, bulk_workers=1)
+        try:
+            self.assertEqual(queue.submit(SendQueue.BULK, send_message, chat_id=1).result(), 1)
+            self.assertEqual(self.calls, [1, 1])
+        finally:
+            queue.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import queue
+import unittest
+import urllib.error
+import urllib.request
+
+from dagan.bot_base.webhook_server import WebhookServer
+from dagan_tests.resources_test import test_telegram
+
+PATH = '/dagan'
+
+
+class WebhookServerTest(unittest.TestCase):
+    def setUp(self):
+        self.updates = queue.Queue()
+        self.server = WebhookServer(None, self.updates, '127.0.0.1', 0, PATH, test_telegram.SECRET)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def post(self, body, secret=test_telegram.SECRET, path=PATH):
+        headers = {'Content-Type': 'application/json'}
+        if secret is not None:
+            headers[WebhookServer.SECRET_HEADER] = secret
+        request = urllib.request.Request('http://127.0.0.1:%d%s' % (self.server.port, path), body.encode('utf-8'),
+                                         headers)
+        try:
+            return urllib.request.urlopen(request).status
+        except urllib.error.HTTPError as err:
+            return err.code
+
+    def test_recorded_updates(self):
+        self.assertEqual(self.post(test_telegram.UPDATE_START_JSON), 200)
+        self.assertEqual(self.post(test_telegram.UPDATE_CALLBACK_JSON), 200)
+        self.assertEqual(self.updates.get(timeout=1).message.text, '/start')
+        self.assertEqual(self.updates.get(timeout=1).callback_query.data, 'QR2')
+
+    def test_rejected_updates(self):
+        self.assertEqual(self.post(test_telegram.UPDATE_START_JSON, secret=None), 403)
+        self.assertEqual(self.post(test_telegram.UPDATE_START_JSON, secret='wrong'), 403)
+        self.assertEqual(self.post(test_telegram.UPDATE_START_JSON, path='/other'), 404)
+        self.assertEqual(self.post('{not json'), 400)
+        self.assertTrue(self.updates.empty())
+
+    def test_secret_required(self):
+        with self.assertRaises(ValueError):
+            WebhookServer(None, self.updates, '127.0.0.1', 0, PATH, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
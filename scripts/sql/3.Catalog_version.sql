@@ -0,0 +1,37 @@
+-- Version marker of restaurants and menus. Cached catalogs are reloaded when it changes
+CREATE TABLE catalog_version (
+    version integer not null,
+    PRIMARY KEY(version)
+);
+
+INSERT INTO catalog_version (version) VALUES (0);
+
+CREATE TRIGGER restaurant_insert_version AFTER INSERT ON restaurant
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
+
+CREATE TRIGGER restaurant_update_version AFTER UPDATE ON restaurant
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
+
+CREATE TRIGGER restaurant_delete_version AFTER DELETE ON restaurant
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
+
+CREATE TRIGGER menu_insert_version AFTER INSERT ON menu
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
+
+CREATE TRIGGER menu_update_version AFTER UPDATE ON menu
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
+
+CREATE TRIGGER menu_delete_version AFTER DELETE ON menu
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+END;
@@ -0,0 +1,15 @@
+-- Indexes of the reads of today's reports and of the subscribers of a menu
+CREATE INDEX menu_report_date ON menu_report (report_date, chat_id, res_id, menu_id);
+CREATE INDEX search_report_date ON search_report (search_date, chat_id, text_to_search);
+CREATE INDEX subscription_menu ON subscription (res_id, menu_id);
+
+-- Daily aggregates of the menu reports older than REPORT_RETENTION_DAYS
+CREATE TABLE menu_report_daily (
+    report_day date not null,
+    res_id integer REFERENCES restaurant(res_id),
+    menu_id integer REFERENCES menu(menu_id),
+    mode integer not null default 0, -- 0: Manual / 1: Automatico
+    reports integer not null,
+    chats integer not null,
+    PRIMARY KEY(report_day, res_id, menu_id, mode)
+);
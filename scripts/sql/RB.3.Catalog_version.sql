@@ -0,0 +1,7 @@
+DROP TRIGGER menu_delete_version;
+DROP TRIGGER menu_update_version;
+DROP TRIGGER menu_insert_version;
+DROP TRIGGER restaurant_delete_version;
+DROP TRIGGER restaurant_update_version;
+DROP TRIGGER restaurant_insert_version;
+DROP TABLE catalog_version;
@@ -0,0 +1,4 @@
+DROP TABLE menu_report_daily;
+DROP INDEX subscription_menu;
+DROP INDEX search_report_date;
+DROP INDEX menu_report_date;